@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for Discord, for benchmarks that run without a bot token
+
+Serves the parts of Discord that DiscordStorage talks to:
+
+    POST /api/channels/<channel>/messages        message send (multipart file)
+    GET  /api/channels/<channel>/messages/<id>   fetch a message
+    POST /api/attachments/refresh-urls           re-sign attachment URLs
+    GET  /attachments/<channel>/<id>/<name>      the CDN (HEAD too)
+
+with configurable latency, bandwidth, message-send rate limits (429 with
+retry_after), random CDN 429s and links the CDN rejects with 403 until
+they are refreshed. Attachments are stored on disk, so the server's
+memory does not depend on how much was uploaded.
+
+    python benchmarks/fakediscord.py --port 8790 --latency-ms 20 --cdn-bandwidth 50M
+
+prints "READY <port>" once it is listening. FakeChannel and offline_core()
+connect a Core to it.
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import secrets
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+import discord
+from discordstorage.throttle import parse_rate
+
+PIECE = 64 * 1024  # CDN write size when bandwidth is limited
+
+
+class FakeDiscord:
+    """The fake API and CDN, an aiohttp application"""
+
+    def __init__(self, root: str, latency: float = 0.0, cdn_bandwidth: int = 0,
+                 send_bandwidth: int = 0, send_rate: float = 0.0, cdn_429: float = 0.0,
+                 revoke: float = 0.0, link_ttl: int = 86400, seed: int = 1):
+        self.root = root
+        self.latency = latency  # seconds before every response
+        self.cdn_bandwidth = cdn_bandwidth  # bytes/s per CDN response, 0 = unlimited
+        self.send_bandwidth = send_bandwidth  # bytes/s per message send, 0 = unlimited
+        self.send_rate = send_rate  # message sends per second before 429s, 0 = unlimited
+        self.cdn_429 = cdn_429  # fraction of CDN requests answered with 429
+        self.revoke = revoke  # fraction of signed links the CDN rejects with 403 until refreshed
+        self.link_ttl = link_ttl
+        self.random = random.Random(seed)
+        self.messages = {}  # message id -> message JSON
+        self.revoked = set()  # signatures the CDN rejects
+        self.next_id = 1000
+        self.send_allowance = 1.0
+        self.send_checked = time.monotonic()
+        self.base = None
+        self.stats = {'sends': 0, 'send_429': 0, 'cdn_requests': 0, 'cdn_429': 0, 'cdn_403': 0, 'refreshed': 0}
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/api/channels/{channel}/messages', self.send_message)
+        app.router.add_get('/api/channels/{channel}/messages/{message}', self.get_message)
+        app.router.add_post('/api/attachments/refresh-urls', self.refresh_urls)
+        app.router.add_get('/attachments/{channel}/{message}/{name}', self.cdn)
+        app.router.add_get('/stats', self.get_stats)
+        return app
+
+    def sign(self, channel: str, message: str, name: str) -> str:
+        now = int(time.time())
+        signature = secrets.token_hex(16)
+        if self.random.random() < self.revoke:
+            self.revoked.add(signature)
+        return (f"{self.base}/attachments/{channel}/{message}/{name}"
+                f"?ex={now + self.link_ttl:x}&is={now:x}&hm={signature}&")
+
+    def _rate_limited(self) -> float:
+        """Seconds to wait before the next send is allowed, 0 if it is"""
+        if not self.send_rate:
+            return 0.0
+        now = time.monotonic()
+        self.send_allowance = min(self.send_rate, self.send_allowance + (now - self.send_checked) * self.send_rate)
+        self.send_checked = now
+        if self.send_allowance < 1:
+            return (1 - self.send_allowance) / self.send_rate
+        self.send_allowance -= 1
+        return 0.0
+
+    async def send_message(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency)
+        retry_after = self._rate_limited()
+        if retry_after:
+            self.stats['send_429'] += 1
+            return web.json_response({'message': 'You are being rate limited.', 'retry_after': retry_after,
+                                      'global': False}, status=429)
+        channel = request.match_info['channel']
+        self.next_id += 1
+        message = str(self.next_id)
+        content, attachments = None, []
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name == 'content':
+                content = await part.text()
+            elif part.filename:
+                os.makedirs(os.path.join(self.root, message), exist_ok=True)
+                size = 0
+                started = time.monotonic()
+                with open(os.path.join(self.root, message, part.filename), 'wb') as f:
+                    while True:
+                        piece = await part.read_chunk(PIECE)
+                        if not piece:
+                            break
+                        f.write(piece)
+                        size += len(piece)
+                        if self.send_bandwidth:
+                            ahead = size / self.send_bandwidth - (time.monotonic() - started)
+                            if ahead > 0:
+                                await asyncio.sleep(ahead)
+                attachments.append({'filename': part.filename, 'size': size,
+                                    'url': self.sign(channel, message, part.filename)})
+        self.stats['sends'] += 1
+        data = {'id': message, 'channel_id': channel, 'content': content, 'attachments': attachments}
+        self.messages[message] = data
+        return web.json_response(data)
+
+    async def get_message(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency)
+        data = self.messages.get(request.match_info['message'])
+        if data is None:
+            return web.json_response({'message': 'Unknown Message'}, status=404)
+        for attachment in data['attachments']:
+            attachment['url'] = self.sign(data['channel_id'], data['id'], attachment['filename'])
+        return web.json_response(data)
+
+    async def refresh_urls(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency)
+        body = await request.json()
+        refreshed = []
+        for url in body.get('attachment_urls', []):
+            path = url.split('/attachments/', 1)[-1].split('?', 1)[0]
+            parts = path.split('/')
+            if len(parts) == 3 and os.path.exists(os.path.join(self.root, parts[1], parts[2])):
+                refreshed.append({'original': url, 'refreshed': self.sign(*parts)})
+                self.stats['refreshed'] += 1
+        return web.json_response({'refreshed_urls': refreshed})
+
+    async def cdn(self, request: web.Request) -> web.StreamResponse:
+        await asyncio.sleep(self.latency)
+        self.stats['cdn_requests'] += 1
+        path = os.path.join(self.root, request.match_info['message'], request.match_info['name'])
+        if not os.path.exists(path):
+            return web.Response(status=404)
+        try:
+            expiry = int(request.query.get('ex', '0'), 16)
+        except ValueError:
+            expiry = 0
+        if expiry < time.time() or request.query.get('hm') in self.revoked:
+            self.stats['cdn_403'] += 1
+            return web.Response(status=403, text="This content is no longer available.")
+        if request.method == 'GET' and self.random.random() < self.cdn_429:
+            self.stats['cdn_429'] += 1
+            return web.Response(status=429, headers={'Retry-After': '1'})
+        if request.method == 'HEAD' or not self.cdn_bandwidth:
+            return web.FileResponse(path)
+        response = web.StreamResponse(headers={'Content-Type': 'application/octet-stream'})
+        response.content_length = os.path.getsize(path)
+        await response.prepare(request)
+        started = time.monotonic()
+        sent = 0
+        with open(path, 'rb') as f:
+            for piece in iter(lambda: f.read(PIECE), b""):
+                await response.write(piece)
+                sent += len(piece)
+                ahead = sent / self.cdn_bandwidth - (time.monotonic() - started)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+        await response.write_eof()
+        return response
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+
+# --- client side -------------------------------------------------------
+
+class FakeAttachment:
+    def __init__(self, data):
+        self.url = data['url']
+        self.filename = data['filename']
+        self.size = data['size']
+
+
+class FakeMessage:
+    def __init__(self, channel, data):
+        self.channel = channel
+        self.id = int(data['id'])
+        self.content = data.get('content')
+        self.attachments = [FakeAttachment(item) for item in data['attachments']]
+
+
+class FakeChannel(discord.TextChannel):
+    """Text channel whose send() posts to a FakeDiscord, waiting out 429s the
+    way discord.py does"""
+
+    def __init__(self, api_base: str, channel_id: int = 1):
+        self.api_base = api_base
+        self.id = channel_id
+        self.rate_limited = 0
+        self._http = None
+
+    async def send(self, content=None, file=None, **kwargs):
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession()
+        while True:
+            form = aiohttp.FormData()
+            if content is not None:
+                form.add_field('content', content)
+            if file is not None:
+                file.fp.seek(0)
+                form.add_field('file', file.fp, filename=file.filename)
+            async with self._http.post(f"{self.api_base}/channels/{self.id}/messages", data=form) as r:
+                data = await r.json()
+                if r.status == 429:
+                    self.rate_limited += 1
+                    await asyncio.sleep(float(data.get('retry_after', 1)))
+                    continue
+                if r.status != 200:
+                    raise Exception(f"HTTP {r.status} sending to channel {self.id}")
+                return FakeMessage(self, data)
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.close()
+
+
+def offline_core(directory: str, base: str, channel_id: int = 1):
+    """A Core wired to the FakeDiscord at base, ready on the running loop"""
+    from discordstorage.core import Core
+    core = Core(directory, 'benchmark-token', str(channel_id))
+    core.refresher.api_base = base + "/api"
+    channel = FakeChannel(base + "/api", channel_id)
+    core.session.getChannel = lambda: channel
+    core.session.loop = asyncio.get_running_loop()
+    core.session.ready.set()
+    core.session.settled.set()
+    return core
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help="0 picks a free port")
+    parser.add_argument('--root', help="attachment directory (default: a temporary one)")
+    parser.add_argument('--latency-ms', type=float, default=0, help="delay before every response")
+    parser.add_argument('--cdn-bandwidth', default='0', help="bytes/s per CDN response, e.g. 50M (0 = unlimited)")
+    parser.add_argument('--send-bandwidth', default='0', help="bytes/s per message send (0 = unlimited)")
+    parser.add_argument('--send-rate', type=float, default=0, help="message sends per second before 429s (0 = unlimited)")
+    parser.add_argument('--cdn-429', type=float, default=0, help="fraction of CDN GETs answered with 429")
+    parser.add_argument('--revoke', type=float, default=0, help="fraction of links rejected with 403 until refreshed")
+    parser.add_argument('--link-ttl', type=int, default=86400, help="seconds a signed link is valid")
+    parser.add_argument('--seed', type=int, default=1)
+    options = parser.parse_args()
+
+    root = options.root or tempfile.mkdtemp(prefix="fakediscord-")
+    fake = FakeDiscord(root, options.latency_ms / 1000, parse_rate(options.cdn_bandwidth),
+                       parse_rate(options.send_bandwidth), options.send_rate, options.cdn_429,
+                       options.revoke, options.link_ttl, options.seed)
+
+    async def serve():
+        runner = web.AppRunner(fake.app())
+        await runner.setup()
+        site = web.TCPSite(runner, options.host, options.port)
+        await site.start()
+        port = runner.addresses[0][1]
+        fake.base = f"http://{options.host}:{port}"
+        print(f"READY {port}", flush=True)
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
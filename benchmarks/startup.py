@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Startup time benchmark for the ds.py CLI
+
+Runs the catalog-only commands (-l, -h) against a synthetic config.discord
+and reports their wall time. Fails if one of them imports a networking
+module (discord, aiohttp, cherrypy, SMB libraries) or if the median goes
+over the budget, so lazy imports stay lazy.
+
+    python benchmarks/startup.py [--files 5000] [--runs 10] [--budget-ms 250]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+DS_PY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ds.py")
+HEAVY_MODULES = ('discord', 'aiohttp', 'cherrypy', 'smb', 'smbprotocol')
+COMMANDS = (['-l'], ['-h'])
+
+
+def write_catalog(directory: str, files: int):
+    records = {str(code): [f"file{code}.bin", 9000000 * (code % 7 + 1),
+                           [f"https://cdn.discordapp.com/attachments/1/2/{code}.0"],
+                           f"https://cdn.discordapp.com/attachments/1/2/{code}.hash",
+                           "0" * 32, {'chunking': 'fixed'}]
+               for code in range(files)}
+    with open(os.path.join(directory, "config.discord"), 'w') as f:
+        f.write(json.dumps({'TOKEN': 'benchmark', 'ROOM_ID': '1'}) + '\n')
+        f.write(json.dumps(records))
+
+
+def heavy_imports(directory: str, args) -> list:
+    """Top-level networking modules imported while running ds.py with args"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', DS_PY] + args, cwd=directory,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imported = set()
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:'):
+            name = line.rsplit('|', 1)[-1].strip()
+            imported.add(name.split('.')[0])
+    return sorted(imported.intersection(HEAVY_MODULES))
+
+
+def time_command(directory: str, args, runs: int) -> list:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, DS_PY] + args, cwd=directory,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=5000, help="catalog entries (default 5000)")
+    parser.add_argument('--runs', type=int, default=10, help="runs per command (default 10)")
+    parser.add_argument('--budget-ms', type=float, default=250, help="median wall time allowed (default 250)")
+    options = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        write_catalog(directory, options.files)
+        interpreter = []
+        for _ in range(options.runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', 'pass'], check=True)
+            interpreter.append((time.perf_counter() - start) * 1000)
+        print(f"python -c pass       median {statistics.median(interpreter):7.1f} ms")
+
+        for args in COMMANDS:
+            timings = time_command(directory, args, options.runs)
+            median = statistics.median(timings)
+            heavy = heavy_imports(directory, args)
+            status = 'ok'
+            if heavy:
+                status = f"FAIL imports {', '.join(heavy)}"
+                failed = True
+            elif median > options.budget_ms:
+                status = f"FAIL over {options.budget_ms:.0f} ms budget"
+                failed = True
+            print(f"ds.py {' '.join(args):<14} median {median:7.1f} ms  min {min(timings):7.1f} ms  {status}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+End-to-end transfer benchmark against a local fake Discord
+
+Starts benchmarks/fakediscord.py, then runs each scenario in its own
+process so its peak RSS is its own:
+
+    upload    Core.async_upload of a generated file
+    download  Core.async_download of that upload
+    recover   Core.async_recover from the upload's URLs alone
+    webdav    PUT then a cold GET through the WebDAV server
+
+Reports MB/s, p50/p99 chunk latency, retries and peak RSS per scenario,
+and checks every transfer's hash. --save writes the results as JSON;
+--compare fails (exit 1) when a scenario got slower or bigger than a
+saved run by more than --tolerance, so CI can catch regressions.
+
+    python benchmarks/transfer.py [--size-mb 128] [--latency-ms 20] [--cdn-bandwidth 50M]
+                                  [--send-rate 5] [--cdn-429 0.02] [--revoke 0.05]
+                                  [--save results.json | --compare results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = ('upload', 'download', 'recover', 'webdav')
+MB = 1024 * 1024
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes (0 where unknown)"""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def percentile(values, fraction: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def make_source(path: str, size: int, seed: int):
+    """Incompressible test data, the same for the same seed"""
+    block = hashlib.sha256(str(seed).encode()).digest()
+    with open(path, 'wb') as f:
+        written = 0
+        while written < size:
+            block = hashlib.sha512(block).digest() * 1024  # 64 KB
+            f.write(block[:size - written])
+            written += len(block)
+
+
+def file_md5(path: str) -> str:
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(MB), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+class ChunkEvents:
+    """Event sink collecting chunk latencies and retries"""
+
+    def __init__(self):
+        self.seconds = []
+        self.retries = {}
+
+    def __call__(self, event):
+        if event.kind == 'chunk_completed':
+            self.seconds.append(event.seconds)
+        elif event.kind == 'chunk_retried':
+            self.retries[event.cause] = self.retries.get(event.cause, 0) + 1
+
+
+def server_stats(base: str) -> dict:
+    with urllib.request.urlopen(base + "/stats") as r:
+        return json.load(r)
+
+
+# --- scenarios, each run in its own process ----------------------------
+
+async def run_scenario(name: str, options) -> dict:
+    from fakediscord import offline_core
+    workdir = options.workdir
+    directory = os.path.join(workdir, 'webdav' if name == 'webdav' else 'transfer') + os.sep
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory)  # the servers keep their caches in the working directory
+    core = offline_core(directory, options.base)
+    core.chunk_concurrency = options.chunk_concurrency
+    core.max_connections = options.connections
+    if not options.verbose:
+        core.events.unsubscribe(core.console)
+    events = core.events.subscribe(ChunkEvents())
+    source = os.path.join(workdir, f"source-{name if name == 'webdav' else 'transfer'}.bin")
+    if not os.path.exists(source):
+        make_source(source, options.size_mb * MB, seed=2 if name == 'webdav' else 1)
+    size = os.path.getsize(source)
+    record_path = os.path.join(workdir, 'record.json')
+    stats_before = server_stats(options.base)
+    result = {'scenario': name}
+
+    started = time.perf_counter()
+    if name == 'upload':
+        record = await core.async_upload(source, '1', 'fixed', options.compress)
+        elapsed = time.perf_counter() - started
+        with open(record_path, 'w') as f:
+            json.dump(record, f)
+        result['ok'] = record[4] == file_md5(source)
+    elif name in ('download', 'recover'):
+        with open(record_path) as f:
+            record = json.load(f)
+        output = os.path.join(directory, 'downloads', record[0])
+        if os.path.exists(output):
+            os.remove(output)
+        report = {}
+        if name == 'download':
+            await core.async_download(record, report=report)
+        else:
+            await core.async_recover(record[0], record[3], record[2])
+        elapsed = time.perf_counter() - started
+        result['ok'] = file_md5(output) == record[4]
+    else:
+        elapsed, result = await run_webdav(core, source, directory, result, options)
+    core.catalog.save()
+
+    stats_after = server_stats(options.base)
+    result.update({
+        'bytes': size,
+        'seconds': round(elapsed, 3),
+        'mbps': round(size / MB / elapsed, 2) if elapsed else None,
+        'chunks': len(events.seconds),
+        'p50_ms': round(percentile(events.seconds, 0.5) * 1000, 1) if events.seconds else None,
+        'p99_ms': round(percentile(events.seconds, 0.99) * 1000, 1) if events.seconds else None,
+        'retries': events.retries,
+        'rate_limited': core.session.getChannel().rate_limited,
+        'server': {key: stats_after[key] - stats_before.get(key, 0) for key in stats_after},
+        'peak_rss_mb': round(peak_rss() / MB, 1),
+    })
+    await core.session.getChannel().close()
+    return result
+
+
+async def run_webdav(core, source: str, directory: str, result: dict, options):
+    """PUT the source through WebDAV, wait for its upload, then time a cold GET"""
+    from discordstorage import smbserver
+    if not (smbserver.SMB_AVAILABLE or smbserver.SMBPROTOCOL_AVAILABLE):
+        result.update({'ok': None, 'skipped': 'pysmb/smbprotocol not installed'})
+        return 0, result
+    import socket
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    server = smbserver.DiscordSMBServer(core, os.path.join(directory, "config.discord"),
+                                        host='127.0.0.1', port=port)
+    server.start_server()
+    url = f"http://127.0.0.1:{port}/bench.bin"
+    await asyncio.sleep(0.5)
+    try:
+        def put():
+            with open(source, 'rb') as f:
+                request = urllib.request.Request(url, data=f, method='PUT',
+                                                 headers={'Content-Length': str(os.path.getsize(source))})
+                with urllib.request.urlopen(request) as r:
+                    return r.headers['X-Job-Id']
+        put_started = time.perf_counter()
+        job = core.jobs.get(await asyncio.to_thread(put))
+        if await job == -1:
+            result.update({'ok': False, 'error': job.error})
+            return time.perf_counter() - put_started, result
+        result['put_seconds'] = round(time.perf_counter() - put_started, 3)
+        core.catalog.save()
+        server.filesystem.reload_file_list()
+
+        def get():
+            md5 = hashlib.md5()
+            with urllib.request.urlopen(url) as r:
+                for block in iter(lambda: r.read(MB), b""):
+                    md5.update(block)
+            return md5.hexdigest()
+        started = time.perf_counter()
+        result['ok'] = await asyncio.to_thread(get) == file_md5(source)
+        return time.perf_counter() - started, result
+    finally:
+        server.stop_server()
+
+
+# --- driver -------------------------------------------------------------
+
+def start_fake(options, root: str):
+    args = [sys.executable, os.path.join(HERE, "fakediscord.py"), '--root', root,
+            '--latency-ms', str(options.latency_ms), '--cdn-bandwidth', options.cdn_bandwidth,
+            '--send-bandwidth', options.send_bandwidth, '--send-rate', str(options.send_rate),
+            '--cdn-429', str(options.cdn_429), '--revoke', str(options.revoke)]
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("READY"):
+        process.kill()
+        raise RuntimeError("fakediscord.py did not start")
+    return process, f"http://127.0.0.1:{line.split()[1]}"
+
+
+def run_child(name: str, options, base: str, workdir: str) -> dict:
+    result_path = os.path.join(workdir, f"result-{name}.json")
+    args = [sys.executable, os.path.abspath(__file__), '--run', name, '--base', base, '--workdir', workdir,
+            '--size-mb', str(options.size_mb), '--chunk-concurrency', str(options.chunk_concurrency),
+            '--connections', str(options.connections)]
+    if options.compress:
+        args += ['--compress', options.compress]
+    if options.verbose:
+        args.append('--verbose')
+    completed = subprocess.run(args, stdout=None if options.verbose else subprocess.DEVNULL)
+    if completed.returncode != 0 or not os.path.exists(result_path):
+        return {'scenario': name, 'ok': False, 'error': f"exit code {completed.returncode}"}
+    with open(result_path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline_path: str, tolerance: float) -> list:
+    with open(baseline_path) as f:
+        baseline = {item['scenario']: item for item in json.load(f)['results']}
+    problems = []
+    for result in results:
+        before = baseline.get(result['scenario'])
+        if not before or not result.get('mbps') or not before.get('mbps'):
+            continue
+        if result['mbps'] < before['mbps'] * (1 - tolerance):
+            problems.append(f"{result['scenario']}: {result['mbps']} MB/s, was {before['mbps']}")
+        if before.get('peak_rss_mb') and result['peak_rss_mb'] > before['peak_rss_mb'] * (1 + tolerance):
+            problems.append(f"{result['scenario']}: peak RSS {result['peak_rss_mb']} MB, was {before['peak_rss_mb']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="comma separated, in order")
+    parser.add_argument('--size-mb', type=int, default=128, help="size of the test file (default 128)")
+    parser.add_argument('--chunk-concurrency', type=int, default=4, help="Core.chunk_concurrency (default 4)")
+    parser.add_argument('--connections', type=int, default=8, help="Core.max_connections (default 8)")
+    parser.add_argument('--compress', help="upload with this codec")
+    parser.add_argument('--latency-ms', type=float, default=20, help="fake server delay per response (default 20)")
+    parser.add_argument('--cdn-bandwidth', default='0', help="per CDN response, e.g. 50M (default unlimited)")
+    parser.add_argument('--send-bandwidth', default='0', help="per message send (default unlimited)")
+    parser.add_argument('--send-rate', type=float, default=0, help="message sends per second before 429s")
+    parser.add_argument('--cdn-429', type=float, default=0, help="fraction of CDN GETs answered with 429")
+    parser.add_argument('--revoke', type=float, default=0, help="fraction of links that 403 until refreshed")
+    parser.add_argument('--save', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="fail if slower/bigger than the results in this JSON file")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed regression for --compare (default 0.25)")
+    parser.add_argument('--verbose', action='store_true', help="show the transfers' console output")
+    # used by the driver to run one scenario in a child process
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    parser.add_argument('--base', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.run:
+        sys.path.insert(0, HERE)
+        result = asyncio.run(run_scenario(options.run, options))
+        with open(os.path.join(options.workdir, f"result-{options.run}.json"), 'w') as f:
+            json.dump(result, f)
+        return
+
+    scenarios = [name.strip() for name in options.scenarios.split(',') if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    if any(name in ('download', 'recover') for name in scenarios) and 'upload' not in scenarios:
+        scenarios.insert(0, 'upload')  # they fetch what the upload stored
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="ds-bench-") as workdir:
+        fake, base = start_fake(options, os.path.join(workdir, 'cdn'))
+        try:
+            for name in scenarios:
+                results.append(run_child(name, options, base, workdir))
+        finally:
+            fake.terminate()
+            fake.wait()
+
+    failed = False
+    print(f"{'scenario':<10} {'MB/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'retries':>8} {'RSS MB':>8}  result")
+    for result in results:
+        if result.get('skipped'):
+            print(f"{result['scenario']:<10} {'':>8} {'':>8} {'':>8} {'':>8} {'':>8}  skipped: {result['skipped']}")
+            continue
+        status = 'ok' if result.get('ok') else f"FAIL {result.get('error', 'hash mismatch')}"
+        failed = failed or not result.get('ok')
+        cell = lambda key: '-' if result.get(key) is None else str(result[key])
+        print(f"{result['scenario']:<10} {cell('mbps'):>8} {cell('p50_ms'):>8} {cell('p99_ms'):>8} "
+              f"{sum(result.get('retries', {}).values()):>8} {cell('peak_rss_mb'):>8}  {status}")
+    if options.save:
+        with open(options.save, 'w') as f:
+            json.dump({'options': {key: value for key, value in vars(options).items()
+                                   if key not in ('run', 'base', 'workdir', 'save', 'compare')},
+                       'results': results}, f, indent=2)
+    if options.compare:
+        problems = compare(results, options.compare, options.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-import discord,asyncio
+import discord,asyncio,threading
 
 '''
 this class uses discord.py
@@ -6,49 +6,62 @@ seperate API will be written soon
 to reduce # of dependencies
 Refer to the following documentation:
 http://discordpy.readthedocs.io/en/latest/api.html
-'''
 
-global client,loop,channelid
-intents = discord.Intents.default()
-client = discord.Client(intents=intents) #discord client object
-loop = None #async loop. used by other classes to add coroutines
-channelid = None
+Every Session owns its own client, loop and channel, so several
+sessions (e.g. one per channel) can run in one process, each
+started on its own thread.
+'''
 
 class Session:
 
-    global client,loop,channelid
-
     def __init__(self,token,channel):
-        global channelid
         self.token = token #bot token
-        channelid = channel #channel ID the bot uploads files to
+        self.channelid = channel #channel ID the bot uploads files to
+        self.client = discord.Client(intents=discord.Intents.default()) #discord client object
+        self.loop = None #async loop. used by other classes to add coroutines
+        self.ready = threading.Event() #set once connected, cleared on logout
+        self.settled = threading.Event() #set once connected or once start() has given up
+        self.client.event(self.on_ready)
     #closes all connections
     #RUNS ON MAIN THREAD, ASYNC.
     async def logout(self):
-        await client.close()
+        self.ready.clear()
+        await self.client.close()
     #initializes the loop once connected to
-    #discord servers. 
+    #discord servers.
     #RUNS ON MAIN THREAD, ASYNC.
-    @client.event
-    async def on_ready():
-        global client,loop,channelid
-        loop = asyncio.get_event_loop()
-        if client.get_channel(int(channelid)) == None:
+    async def on_ready(self):
+        self.loop = asyncio.get_running_loop()
+        if self.client.get_channel(int(self.channelid)) == None:
             print("Channel ID doesn't exist, reconfigure the program or update config.discord")
+        self.ready.set()
+        self.settled.set()
 
     #Returns text channel bot is uploading files to
     def getChannel(self):
-        return client.get_channel(int(channelid))
+        return self.client.get_channel(int(self.channelid))
 
     #Connects to discord servers.
     #LEADS TO ASYNC LOOP. RUNS ON MAIN THREAD.
     def start(self):
-        client.run(self.token)
+        try:
+            self.client.run(self.token)
+        finally:
+            self.loop = None
+            self.ready.clear()
+            self.settled.set() #wake wait_ready() callers if the login failed
 
     #Returns the client object
     def getClient(self):
-        return client
+        return self.client
 
     #Returns the async loop.
     def getLoop(self):
-        return loop
+        return self.loop
+
+    #Blocks until connected (or timeout seconds), returns True if ready and
+    #False if the timeout passed or the connection could not be made.
+    #can be run from anything outside of main thread.
+    def wait_ready(self,timeout=None):
+        self.settled.wait(timeout)
+        return self.ready.is_set()
@@ -0,0 +1,205 @@
+"""
+Discord Storage Adaptive Concurrency
+AIMD limit on chunks in flight, jittered exponential retry backoff and
+per-endpoint circuit breakers
+
+AdaptiveLimit raises the number of chunks transferred at a time by one per
+round of successful chunks and halves it when the link pushes back: a rate
+limit, a server error, a timeout, or chunks taking far longer per byte than
+the best recently seen (more streams no longer add throughput). It settles
+on whatever parallelism the link at hand sustains, between 1 and the
+configured maximum.
+
+Every request also pays a fixed cost (connection, TLS, time to first
+byte) that dominates small files and the short last chunk of a file, so
+only chunks of about the largest size seen are compared per byte; smaller
+ones count as successes without feeding the latency signal.
+"""
+
+import time
+import random
+import asyncio
+from typing import Dict, Optional
+
+LATENCY_TOLERANCE = 2.0  # ratio of seconds per byte to the baseline that counts as congestion
+BASELINE_DRIFT = 0.02  # the baseline forgets 2% per sample, to follow a link that got slower
+FULL_CHUNK_FRACTION = 0.4  # chunks at least this share of the largest seen are compared (CDC sizes vary 4-9 MB)
+DECREASE_COOLDOWN = 2.0  # seconds; failures of chunks that were in flight together count once
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 30.0
+BREAKER_THRESHOLD = 5  # consecutive failures that open a circuit
+BREAKER_RESET = 15.0  # seconds an open circuit waits before letting one probe through
+BREAKER_RESET_MAX = 120.0
+
+
+def is_congestion(cause: str) -> bool:
+    """True for retry causes (metrics.retry_cause) that mean the endpoint or
+    the link is overloaded, rather than a problem with one request"""
+    if cause in ('timeout', 'connection'):
+        return True
+    return cause == 'http_429' or cause.startswith('http_5')
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header, None if absent or not a number"""
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP,
+                  retry_after: Optional[float] = None) -> float:
+    """Seconds to wait before retry number attempt (1, 2, ...)
+
+    Doubles per attempt up to cap, with half of it random so clients that
+    failed together do not retry together; never less than a server's
+    Retry-After.
+    """
+    ceiling = min(cap, base * 2 ** (attempt - 1))
+    delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+    return max(delay, retry_after or 0)
+
+
+class AdaptiveLimit:
+    """Concurrency limit that adapts to observed latency and errors (AIMD)
+
+    Use as "async with limit:" around one chunk transfer and report how it
+    went with success() or failure(). Belongs to the loop that runs the
+    transfers.
+    """
+
+    def __init__(self, initial: int, maximum: int, minimum: int = 1, name: str = "chunks"):
+        self.name = name
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.in_flight = 0
+        self.baseline = None  # best recent seconds per byte of full-size chunks
+        self.full_size = 0  # largest chunk seen, in bytes
+        self.decreased_at = 0.0
+        self._waiters = []
+
+    async def __aenter__(self):
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        free = int(self.limit) - self.in_flight
+        for waiter in self._waiters[:max(0, free)]:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def success(self, seconds: float, nbytes: int):
+        """One chunk of nbytes took seconds"""
+        if nbytes * FULL_CHUNK_FRACTION > self.full_size:
+            self.baseline = None  # earlier samples were small chunks, their per-byte time is not comparable
+        self.full_size = max(self.full_size, nbytes)
+        if nbytes >= self.full_size * FULL_CHUNK_FRACTION:
+            sample = seconds / max(nbytes, 1)
+            if self.baseline is None:
+                self.baseline = sample
+            else:
+                self.baseline = min(sample, self.baseline * (1 + BASELINE_DRIFT))
+            if sample > self.baseline * LATENCY_TOLERANCE:
+                self._decrease()
+                return
+        self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+        self._wake()
+
+    def failure(self, cause: str):
+        """One chunk transfer failed with a metrics.retry_cause label"""
+        if is_congestion(cause):
+            self._decrease()
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self.decreased_at < DECREASE_COOLDOWN:
+            return
+        self.decreased_at = now
+        self.limit = max(float(self.minimum), self.limit / 2)
+
+    @property
+    def current(self) -> int:
+        return int(self.limit)
+
+
+class CircuitBreaker:
+    """Pauses all requests to an endpoint that keeps failing
+
+    After BREAKER_THRESHOLD consecutive failures the circuit opens and
+    wait() holds every caller back; after the reset time one caller is let
+    through as a probe. Its success closes the circuit, its failure opens
+    it again for twice as long (up to BREAKER_RESET_MAX).
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, endpoint: str, threshold: int = BREAKER_THRESHOLD, reset: float = BREAKER_RESET):
+        self.endpoint = endpoint
+        self.threshold = threshold
+        self.base_reset = reset
+        self.reset = reset
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    async def wait(self):
+        """Return once a request to the endpoint may be made"""
+        while self.state != self.CLOSED:
+            remaining = self.opened_at + self.reset - time.monotonic()
+            if remaining <= 0:
+                # this caller is the probe (another one if the last never reported back)
+                self.state = self.HALF_OPEN
+                self.opened_at = time.monotonic()
+                return
+            await asyncio.sleep(min(max(remaining, 0.0), 1.0) or 1.0)
+
+    def success(self):
+        self.failures = 0
+        if self.state != self.CLOSED:
+            print(f"✅ {self.endpoint} is answering again, resuming requests")
+            self.state = self.CLOSED
+            self.reset = self.base_reset
+
+    def failure(self, cause: str):
+        if not is_congestion(cause):
+            return  # the request itself was the problem (e.g. an expired link), not the endpoint
+        self.failures += 1
+        if self.state == self.HALF_OPEN:
+            self.reset = min(self.reset * 2, BREAKER_RESET_MAX)
+            self._open()
+        elif self.state == self.CLOSED and self.failures >= self.threshold:
+            self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        print(f"⚡ {self.endpoint} failed {self.failures} times in a row, pausing requests for {self.reset:.0f}s")
+
+
+class CircuitBreakers:
+    """One CircuitBreaker per endpoint (CDN host, Discord API)"""
+
+    def __init__(self):
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, endpoint: str) -> CircuitBreaker:
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = self.breakers[endpoint] = CircuitBreaker(endpoint)
+        return breaker
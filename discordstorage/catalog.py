@@ -0,0 +1,390 @@
+"""
+Discord Storage Catalog
+Reads and writes config.discord (bot settings line + files line +
+directories line) and keeps a content-hash index over the stored file
+records
+
+Directories are entries {id: [parent id, name]} under ROOT. A file sits in
+the directory named by the path part of its stored name ("photos/2024/a.jpg"
+is a.jpg in photos/2024, as directory uploads have always named files);
+missing directories are created when such a record is added. Entries are
+indexed by (parent, name), so resolving a path costs one lookup per
+component and listing a directory touches only its children.
+
+Directories implied by file names are derived again on every load and only
+reach config.discord with the next save, so writers that read the same
+older catalog do not each persist their own copy. Unsaved directories are
+matched by (parent, name) against what another writer saved meanwhile.
+A Catalog is shared by the web, WebDAV, FUSE and transfer threads and
+every method holds its lock.
+"""
+
+import os
+import json
+import random
+import secrets
+import threading
+from typing import Dict, List, Optional, Tuple
+
+ROOT = '0'  # id of the top directory
+
+
+class Catalog:
+    """File catalog backed by config.discord
+
+    Records use the same list format as uploads:
+    [filename, size, urls, hash_url, md5, meta]
+    """
+
+    def __init__(self, config_path: str):
+        self.config_path = config_path
+        self.header = json.dumps({})
+        self.files = {}
+        self.dirs = {}  # directory id -> [parent id, name]
+        self.mtime = None
+        self._pending = {}  # code -> record (None = removal) not yet written
+        self._pending_dirs = {}  # directory id -> entry (None = removal) not yet written
+        self._reserved = set()  # codes handed out to uploads still in flight
+        self._by_sha256 = {}
+        self._by_md5 = {}
+        self._subdirs = {}  # directory id -> {name: directory id}
+        self._entries = {}  # directory id -> {name: file code}
+        self._placed = {}  # file code -> (directory id, name)
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        """Load the catalog from disk (missing file means an empty catalog)"""
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.config_path, 'r') as f:
+                first_line = f.readline().strip()
+                second_line = f.readline().strip()
+                third_line = f.readline().strip()
+            self.mtime = os.path.getmtime(self.config_path)
+        except FileNotFoundError:
+            first_line, second_line, third_line = '', '', ''
+            self.mtime = None
+        if first_line:
+            self.header = first_line
+        previous_dirs = self.dirs
+        self.files = json.loads(second_line) if second_line else {}
+        self.dirs = json.loads(third_line) if third_line else {}
+        # unsaved changes survive a reload caused by another writer
+        for code, record in self._pending.items():
+            if record is None:
+                self.files.pop(code, None)
+            else:
+                self.files[code] = record
+        self._merge_pending_dirs(previous_dirs)
+        self._build_index()
+
+    def _merge_pending_dirs(self, previous_dirs: Dict[str, List]):
+        """Apply unsaved directory changes to the directories just read
+
+        A directory another writer saved under the same parent and name is
+        reused instead of adding a second one. Parents that were only
+        implied by file names (so never saved) are looked up the same way,
+        or kept as unsaved directories of their own.
+        """
+        by_name = {tuple(entry): dir_id for dir_id, entry in self.dirs.items()}
+        moved = {}  # unsaved id -> id of the same directory in the new view
+        pending = {}
+
+        def current(dir_id):
+            if dir_id in moved:
+                return moved[dir_id]
+            if dir_id == ROOT or dir_id in self.dirs:
+                return dir_id
+            if dir_id not in previous_dirs:
+                return ROOT  # gone, like any orphan
+            parent, name = previous_dirs[dir_id]
+            return add(dir_id, current(parent), name)
+
+        def add(dir_id, parent, name):
+            existing = by_name.get((parent, name))
+            if existing is not None and existing != dir_id:
+                moved[dir_id] = existing
+                return existing
+            self.dirs[dir_id] = pending[dir_id] = [parent, name]
+            by_name[(parent, name)] = dir_id
+            return dir_id
+
+        for dir_id, entry in self._pending_dirs.items():
+            if entry is None:
+                self.dirs.pop(dir_id, None)
+                pending[dir_id] = None
+            else:
+                add(dir_id, current(entry[0]), entry[1])
+        self._pending_dirs = pending
+
+    def reload_if_changed(self):
+        """Reload if another process or server rewrote config.discord"""
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.config_path)
+            except FileNotFoundError:
+                return
+            if mtime != self.mtime:
+                self._load()
+
+    def save(self):
+        """Write the catalog (including batched changes) to config.discord atomically"""
+        with self._lock:
+            self.reload_if_changed()
+            tmp_path = self.config_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(self.header + '\n')
+                f.write(json.dumps(self.files))
+                if self.dirs:
+                    f.write('\n' + json.dumps(self.dirs))
+            os.replace(tmp_path, self.config_path)
+            self.mtime = os.path.getmtime(self.config_path)
+            self._pending = {}
+            self._pending_dirs = {}
+
+    def _build_index(self):
+        self._by_sha256 = {}
+        self._by_md5 = {}
+        self._subdirs = {ROOT: {}}
+        self._entries = {ROOT: {}}
+        self._placed = {}
+        # parents before children, whatever order the ids were written in
+        waiting = dict(self.dirs)
+        while waiting:
+            placed = [dir_id for dir_id, (parent, _) in waiting.items() if parent in self._subdirs]
+            if not placed:
+                # orphans (their parent was removed by another writer) move to the top
+                placed = list(waiting)
+                for dir_id in placed:
+                    waiting[dir_id] = [ROOT, waiting[dir_id][1]]
+            for dir_id in placed:
+                parent, name = waiting.pop(dir_id)
+                kept = self._subdirs[parent].get(name)
+                if kept is not None:
+                    # the same directory twice (written by an older version): merge them
+                    for child, entry in waiting.items():
+                        if entry[0] == dir_id:
+                            self.dirs[child] = waiting[child] = [kept, entry[1]]
+                    self.dirs.pop(dir_id, None)
+                    continue
+                self._subdirs[parent][name] = dir_id
+                self._subdirs[dir_id] = {}
+                self._entries[dir_id] = {}
+        for code, record in self.files.items():
+            self._index_record(code, record)
+
+    def _index_record(self, code: str, record: List):
+        self._place(code, record)
+        if not record or len(record) < 5:
+            return
+        meta = record[5] if len(record) > 5 else {}
+        if meta.get('sha256'):
+            self._by_sha256.setdefault(meta['sha256'], code)
+        if record[4]:
+            self._by_md5.setdefault((record[4], record[1]), code)
+
+    def add(self, code: str, record: List, save: bool = True):
+        """Add or replace a file record
+
+        With save=False the change is kept in memory until the next save(),
+        so batch uploads can write many records in one go.
+        """
+        with self._lock:
+            self.reload_if_changed()
+            self.files[code] = record
+            self._pending[code] = record
+            self._reserved.discard(code)
+            self._index_record(code, record)
+            if save:
+                self.save()
+
+    def remove(self, code: str, save: bool = True) -> bool:
+        """Remove a file record, returns False if the code is unknown"""
+        with self._lock:
+            self.reload_if_changed()
+            if code not in self.files:
+                return False
+            del self.files[code]
+            self._pending[code] = None
+            self._build_index()
+            if save:
+                self.save()
+            return True
+
+    # --- directory tree -------------------------------------------------
+
+    def _place(self, code: str, record: List):
+        """Enter a file record in the directory its stored name points to"""
+        previous = self._placed.pop(code, None)
+        if previous is not None:
+            self._entries[previous[0]].pop(previous[1], None)
+        if not record:
+            return
+        parts = split_path(str(record[0]))
+        if not parts:
+            return
+        parent = ROOT
+        for part in parts[:-1]:
+            if part in self._entries[parent]:
+                break  # a file has this name, keep the record one level up
+            child = self._subdirs[parent].get(part)
+            if child is None:
+                child = self._new_dir(parent, part, pending=False)  # derived again on every load
+            parent = child
+        name = parts[-1]
+        if name in self._entries[parent] or name in self._subdirs[parent]:
+            name = f"{name} ({code})"  # same stored name twice: tell them apart by code
+        self._entries[parent][name] = code
+        self._placed[code] = (parent, name)
+
+    def _new_dir(self, parent: str, name: str, pending: bool = True) -> str:
+        dir_id = secrets.token_hex(4)  # random, so two writers never hand out the same id
+        while dir_id in self.dirs:
+            dir_id = secrets.token_hex(4)
+        self.dirs[dir_id] = [parent, name]
+        if pending:
+            self._pending_dirs[dir_id] = self.dirs[dir_id]
+        self._subdirs[parent][name] = dir_id
+        self._subdirs[dir_id] = {}
+        self._entries[dir_id] = {}
+        return dir_id
+
+    def resolve(self, path: str) -> Optional[Tuple[str, str]]:
+        """('dir', id) or ('file', code) for a path like "/photos/a.jpg",
+        None if nothing is there"""
+        with self._lock:
+            self.reload_if_changed()
+            parent = ROOT
+            parts = split_path(path)
+            for part in parts[:-1]:
+                parent = self._subdirs.get(parent, {}).get(part)
+                if parent is None:
+                    return None
+            if not parts:
+                return 'dir', ROOT
+            name = parts[-1]
+            if name in self._subdirs.get(parent, {}):
+                return 'dir', self._subdirs[parent][name]
+            if name in self._entries.get(parent, {}):
+                return 'file', self._entries[parent][name]
+            return None
+
+    def listdir(self, dir_id: str = ROOT) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """Children of a directory: ({name: directory id}, {name: file code})"""
+        with self._lock:
+            self.reload_if_changed()
+            if dir_id not in self._subdirs:
+                raise FileNotFoundError(dir_id)
+            return dict(self._subdirs[dir_id]), dict(self._entries[dir_id])
+
+    def dir_path(self, dir_id: str) -> str:
+        """Path of a directory, "/" for ROOT"""
+        with self._lock:
+            parts = []
+            while dir_id != ROOT and dir_id in self.dirs:
+                dir_id, name = self.dirs[dir_id]
+                parts.append(name)
+            return '/' + '/'.join(reversed(parts))
+
+    def file_path(self, code: str) -> Optional[str]:
+        """Path a file record is listed under, None if the code is unknown"""
+        with self._lock:
+            self.reload_if_changed()
+            if code not in self._placed:
+                return None
+            parent, name = self._placed[code]
+            return self.dir_path(parent).rstrip('/') + '/' + name
+
+    def mkdir(self, path: str) -> str:
+        """Create a directory, returns its id; the parent must exist
+
+        Raises FileExistsError if the name is taken and FileNotFoundError if
+        the parent is missing.
+        """
+        with self._lock:
+            self.reload_if_changed()
+            parts = split_path(path)
+            if not parts:
+                raise FileExistsError(path)
+            if self.resolve(path) is not None:
+                raise FileExistsError(path)
+            parent = self.resolve('/'.join(parts[:-1]))
+            if parent is None or parent[0] != 'dir':
+                raise FileNotFoundError(path)
+            dir_id = self._new_dir(parent[1], parts[-1])
+            self.save()
+            return dir_id
+
+    def rmdir(self, path: str):
+        """Remove an empty directory (OSError if it is not empty)"""
+        with self._lock:
+            self.reload_if_changed()
+            found = self.resolve(path)
+            if found is None or found[0] != 'dir' or found[1] == ROOT:
+                raise FileNotFoundError(path)
+            dir_id = found[1]
+            if self._subdirs[dir_id] or self._entries[dir_id]:
+                raise OSError(f"directory {path} is not empty")
+            del self.dirs[dir_id]
+            self._pending_dirs[dir_id] = None
+            self._build_index()
+            self.save()
+
+    def get(self, code: str) -> Optional[List]:
+        with self._lock:
+            return self.files.get(code)
+
+    def find_by_hash(self, sha256: str = None, md5: str = None,
+                     size: int = None) -> Optional[Tuple[str, List]]:
+        """Find a stored record with the same content
+
+        SHA-256 is used when the record has one; records uploaded before it
+        was tracked fall back to an MD5 + size match.
+        """
+        with self._lock:
+            self.reload_if_changed()
+            code = self._by_sha256.get(sha256) if sha256 else None
+            if code is None and md5 is not None:
+                code = self._by_md5.get((md5, size))
+            if code is None or code not in self.files:
+                return None
+            return code, self.files[code]
+
+    def new_code(self) -> str:
+        """Generate and reserve an unused file code
+
+        Codes stay in the original 0-4098 range until the catalog gets
+        crowded, then the range grows so large batches never spin.
+        """
+        with self._lock:
+            upper = max(4098, 4 * (len(self.files) + len(self._reserved)))
+            code = str(random.randint(0, upper))
+            while code in self.files or code in self._reserved:
+                code = str(random.randint(0, upper))
+            self._reserved.add(code)
+            return code
+
+    def reserve_code(self, code: str):
+        """Reserve a known code, e.g. for an upload restored from the queue"""
+        with self._lock:
+            self._reserved.add(code)
+
+    def release_code(self, code: str):
+        """Give back a reserved code whose upload failed"""
+        with self._lock:
+            self._reserved.discard(code)
+
+    def __len__(self):
+        return len(self.files)
+
+    def __contains__(self, code):
+        return code in self.files
+
+
+def split_path(path: str) -> List[str]:
+    """Components of a catalog path ("a/b", "/a/b/" and "a\\b" are the same)"""
+    return [part for part in path.replace('\\', '/').split('/') if part not in ('', '.', '..')]
@@ -0,0 +1,411 @@
+"""
+Discord Storage Chunk Cache
+Chunks of stored files kept on disk, so the servers can answer a read of a
+byte range by fetching only the chunks it covers instead of the whole file
+
+Each client's reads of a file go through a ChunkStream. Once they turn out
+to be sequential (a read starting where the previous one ended, or at the
+start of the file), the next `readahead` chunks are fetched in the
+background, so playback or a copy does not stall for a CDN round trip at
+every chunk boundary. A seek cancels read-ahead that is no longer wanted;
+so does closing the stream when the client disconnects.
+
+Compressed files cannot be read at an offset and are not served from here.
+The cache is shared by the web and WebDAV servers and evicts the least
+recently used chunks beyond max_bytes.
+"""
+
+import os
+import time
+import bisect
+import asyncio
+import hashlib
+import secrets
+import threading
+import collections
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
+
+import aiohttp
+
+from .adaptive import backoff_delay, parse_retry_after
+from .fileio import BLOCK_SIZE, write_at
+from .metrics import retry_cause
+from .refresh import url_key
+
+CACHE_BYTES = 2 * 1024 ** 3  # default size limit of the chunk cache
+READAHEAD = 2  # chunks fetched ahead of a sequential reader
+STREAM_IDLE = 30.0  # seconds before an unused stream is closed
+FETCH_ATTEMPTS = 5  # a client is waiting: give up after this many failed tries
+READY_TIMEOUT = 30.0  # seconds a read waits for the Discord session to connect
+AGENT = {'User-Agent': 'DiscordStorageBot (http://github.com/nigel/discordstorage)'}
+
+
+def parse_byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """(first, last) byte of a single "bytes=" Range header, None for the
+    whole file; raises ValueError if the range cannot be satisfied"""
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[6:].strip().partition('-')
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0:
+                raise ValueError
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError(f"range {header} outside a file of {size} bytes")
+    return start, end
+
+
+class ChunkCache:
+    """LRU cache of chunks on disk, filled on demand and by read-ahead
+
+    fetch() and the prefetch bookkeeping run on the session loop; ChunkStream
+    bridges reads from server threads to it.
+    """
+
+    def __init__(self, core, directory: str, max_bytes: int = CACHE_BYTES, readahead: int = READAHEAD):
+        self.core = core
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.readahead = readahead
+        self.entries = collections.OrderedDict()  # key -> size, least recently used first
+        self.size = 0
+        self.pinned = {}  # key -> readers that have the file open
+        self.streams = {}  # (client, file) -> ChunkStream
+        self._inflight = {}  # key -> [task, refs]
+        self._http = None
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    # --- layout ---------------------------------------------------------
+
+    def supports(self, record: List) -> bool:
+        """True if ranges of the file can be served from chunks"""
+        meta = record[5] if len(record) > 5 else {}
+        return bool(record[2]) and not meta.get('codec')
+
+    def chunk_key(self, record: List, index: int) -> str:
+        meta = record[5] if len(record) > 5 else {}
+        hashes = meta.get('chunk_hashes') or []
+        if index < len(hashes) and hashes[index]:
+            return hashes[index]  # identical chunks of different files share an entry
+        return hashlib.sha256(url_key(record[2][index]).encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def span(self, record: List, index: int) -> Tuple[int, int]:
+        """Byte range [start, end) of chunk index in the file"""
+        offsets = self.core.chunk_offsets(record)
+        end = offsets[index + 1] if index + 1 < len(offsets) else record[1]
+        return offsets[index], end
+
+    def locate(self, record: List, offset: int) -> int:
+        """Index of the chunk holding byte offset"""
+        return max(0, bisect.bisect_right(self.core.chunk_offsets(record), offset) - 1)
+
+    # --- entries ----------------------------------------------------------
+
+    def _load(self):
+        """Pick up the chunks left by an earlier run, oldest use first"""
+        if self._loaded:
+            return
+        self._loaded = True
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for name in os.listdir(self.directory):
+            path = self.path(name)
+            if name.endswith('.part'):
+                os.remove(path)  # interrupted fetch (one per task: <key>.<token>.part)
+                continue
+            stat = os.stat(path)
+            found.append((stat.st_atime, name, stat.st_size))
+        for _, name, size in sorted(found):
+            self.entries[name] = size
+            self.size += size
+
+    def _lookup(self, key: str) -> bool:
+        """True (and marked recently used, and pinned) if key is cached"""
+        with self._lock:
+            self._load()
+            if key not in self.entries:
+                return False
+            self.entries.move_to_end(key)
+            self.pinned[key] = self.pinned.get(key, 0) + 1
+            return True
+
+    def unpin(self, key: str):
+        with self._lock:
+            count = self.pinned.get(key, 0) - 1
+            if count > 0:
+                self.pinned[key] = count
+            else:
+                self.pinned.pop(key, None)
+
+    def _store(self, key: str, size: int):
+        with self._lock:
+            if key not in self.entries:
+                self.entries[key] = size
+                self.size += size
+            self._evict()
+
+    def _evict(self):
+        for key in list(self.entries):
+            if self.size <= self.max_bytes:
+                return
+            if key in self.pinned or key in self._inflight:
+                continue
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+            self.size -= self.entries.pop(key)
+            self.core.metrics.cache_evictions.inc(cache='chunks')
+
+    # --- fetching (on the session loop) -------------------------------------
+
+    def _session(self) -> aiohttp.ClientSession:
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession()
+        return self._http
+
+    async def close(self):
+        for task, _ in list(self._inflight.values()):
+            task.cancel()
+        if self._http is not None:
+            await self._http.close()
+
+    async def fetch(self, record: List, index: int, client: Optional[str] = None) -> str:
+        """Path of chunk index, fetched if it is not cached; the entry is
+        pinned until the caller unpins it"""
+        key = self.chunk_key(record, index)
+        if self._lookup(key):
+            self.core.metrics.cache_requests.inc(cache='chunks', result='hit')
+            return self.path(key)
+        self.core.metrics.cache_requests.inc(cache='chunks', result='miss')
+        with self._lock:
+            self.pinned[key] = self.pinned.get(key, 0) + 1  # so it is not evicted before we read it
+        task = self._acquire(record, index, client)
+        try:
+            await asyncio.shield(task)
+        except BaseException:
+            self.unpin(key)
+            raise
+        finally:
+            self._release(key)
+        return self.path(key)
+
+    def prefetch(self, record: List, indices: List[int], client: Optional[str] = None):
+        """Start fetching chunks a reader will want soon; each one holds a
+        reference until released"""
+        for index in indices:
+            self._acquire(record, index, client)
+
+    def release(self, keys: List[str]):
+        for key in keys:
+            self._release(key)
+
+    def _acquire(self, record: List, index: int, client: Optional[str]) -> asyncio.Future:
+        key = self.chunk_key(record, index)
+        with self._lock:
+            self._load()
+            entry = self._inflight.get(key)
+            if entry is not None:
+                entry[1] += 1
+                return entry[0]
+            task = asyncio.ensure_future(self._download(record, index, key, client))
+            self._inflight[key] = [task, 1]
+
+        def finished(task):
+            with self._lock:
+                if self._inflight.get(key, [None])[0] is task:
+                    del self._inflight[key]
+        task.add_done_callback(finished)
+        return task
+
+    def _release(self, key: str):
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._inflight[key]  # a later fetch of the chunk starts over
+                entry[0].cancel()  # nobody wants it any more
+
+    async def _download(self, record: List, index: int, key: str, client: Optional[str]):
+        if key in self.entries:
+            return
+        start, end = self.span(record, index)
+        meta = record[5] if len(record) > 5 else {}
+        messages = meta.get('messages') or [None] * len(record[2])
+        core = self.core
+        [url] = await core.refresher.fresh_urls([record[2][index]], [messages[index]])
+        breaker = core.breakers.get(urlparse(url).netloc)
+        limit, slots = core.chunk_limit('download'), core.connection_slots()
+        # each task writes its own part file: a cancelled task must not remove
+        # the one a newer fetch of the same chunk is writing
+        part = f"{self.path(key)}.{secrets.token_hex(4)}.part"
+        refreshes = 0
+        attempt = 0
+        while True:
+            status, retry_after, size = None, None, 0
+            try:
+                await breaker.wait()
+                async with limit, slots:
+                    attempt_start = time.monotonic()
+                    throttled = 0.0
+                    with open(part, 'wb', buffering=0) as f:
+                        async with self._session().get(url, headers=AGENT) as r:
+                            status = r.status
+                            if status == 200:
+                                async for data in r.content.iter_chunked(BLOCK_SIZE):
+                                    throttled += await core.bandwidth.consume('download', len(data), client=client)
+                                    write_at(f, data, size)
+                                    size += len(data)
+                            elif status == 429:
+                                retry_after = parse_retry_after(r.headers.get('Retry-After'))
+                    if status == 200:
+                        limit.success(time.monotonic() - attempt_start - throttled, size)
+                        breaker.success()
+                if status in (403, 404) and refreshes < FETCH_ATTEMPTS:
+                    refreshes += 1  # the link expired or was revoked: re-sign it and try again
+                    core.metrics.url_refreshes.inc()
+                    url = (await core.refresher.refresh([url], [messages[index]])).get(url, url)
+                    continue
+                if status != 200:
+                    raise Exception(f"HTTP {status}")
+                if size != end - start:
+                    raise Exception(f"got {size} bytes, expected {end - start}")
+                break
+            except asyncio.CancelledError:
+                if os.path.exists(part):
+                    os.remove(part)
+                raise
+            except Exception as e:
+                attempt += 1
+                cause = retry_cause(e, status)
+                limit.failure(cause)
+                breaker.failure(cause)
+                core.metrics.chunk_retries.inc(direction='download', cause=cause)
+                if attempt >= FETCH_ATTEMPTS:
+                    if os.path.exists(part):
+                        os.remove(part)
+                    raise Exception(f"Chunk {index + 1} of {record[0]} could not be fetched: {e}")
+                await asyncio.sleep(backoff_delay(attempt, retry_after=retry_after))
+        os.replace(part, self.path(key))
+        core.metrics.bytes_downloaded.inc(size)
+        self._store(key, size)
+
+    # --- streams ----------------------------------------------------------------
+
+    def stream(self, record: List, client: Optional[str] = None) -> 'ChunkStream':
+        """The stream of client's reads of a file, reused across requests
+        (Range requests of one player continue one stream)"""
+        now = time.monotonic()
+        with self._lock:
+            for stream_key, stream in list(self.streams.items()):
+                if stream.closed or now - stream.used > STREAM_IDLE:
+                    stream.close()
+                    del self.streams[stream_key]
+            stream_key = (client, record[4] or record[0], record[1])
+            stream = self.streams.get(stream_key)
+            if stream is None:
+                stream = self.streams[stream_key] = ChunkStream(self, record, client)
+            return stream
+
+
+class ChunkStream:
+    """One client's reads of one file, with read-ahead while they are sequential
+
+    read() blocks and must not be called on the session loop. slack is how
+    far a read may start from where the last one ended and still count as
+    sequential, for callers whose reads arrive slightly out of order (the
+    kernel's own read-ahead under FUSE).
+    """
+
+    def __init__(self, cache: ChunkCache, record: List, client: Optional[str] = None, slack: int = 0):
+        self.cache = cache
+        self.record = record
+        self.client = client
+        self.slack = slack
+        self.position = None  # where the last read ended
+        self.ahead = {}  # chunk index -> key of read-ahead holding a reference
+        self.used = time.monotonic()
+        self.closed = False
+        self.chunks = len(record[2])
+        self._lock = threading.Lock()  # concurrent requests of one client share the stream
+
+    @property
+    def loop(self):
+        return self.cache.core.session.getLoop()
+
+    def read(self, offset: int, size: int) -> bytes:
+        """Up to size bytes at offset (fewer at the end of a chunk or file)"""
+        if self.closed:
+            raise ValueError("read from a closed stream")
+        self.used = time.monotonic()
+        if offset >= self.record[1] or size <= 0:
+            return b""
+        loop = self._ready_loop()
+        index = self.cache.locate(self.record, offset)
+        with self._lock:
+            if offset == 0 or (self.position is not None and abs(offset - self.position) <= self.slack):
+                self._read_ahead(loop, index)
+            else:
+                # a seek: read-ahead outside the new position's window is not wanted now
+                window = range(index, index + 1 + self.cache.readahead)
+                self._drop_ahead(lambda i: i not in window)
+        start, end = self.cache.span(self.record, index)
+        key = self.cache.chunk_key(self.record, index)
+        path = asyncio.run_coroutine_threadsafe(
+            self.cache.fetch(self.record, index, self.client), loop).result()
+        try:
+            with open(path, 'rb') as f:
+                f.seek(offset - start)
+                data = f.read(min(size, end - offset))
+        finally:
+            self.cache.unpin(key)
+        with self._lock:
+            self._drop_ahead(lambda i: i <= index)  # reached, held by the reader now
+        self.position = offset + len(data)
+        return data
+
+    def _ready_loop(self):
+        """The session loop, waiting for the session to connect if it has not yet"""
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            self.cache.core.wait_ready(READY_TIMEOUT)
+            loop = self.loop
+            if loop is None or loop.is_closed():
+                raise ConnectionError("not connected to Discord")
+        return loop
+
+    def _read_ahead(self, loop, index: int):
+        wanted = [i for i in range(index + 1, min(self.chunks, index + 1 + self.cache.readahead))
+                  if i not in self.ahead]
+        if not wanted:
+            return
+        for i in wanted:
+            self.ahead[i] = self.cache.chunk_key(self.record, i)
+        # the same thread-safe queue as the releases, so they cannot overtake it
+        loop.call_soon_threadsafe(self.cache.prefetch, self.record, wanted, self.client)
+
+    def _drop_ahead(self, which):
+        keys = [self.ahead.pop(i) for i in [i for i in self.ahead if which(i)]]
+        loop = self.loop
+        if keys and loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self.cache.release, keys)
+
+    def close(self):
+        """Stop read-ahead, e.g. when the client has disconnected"""
+        with self._lock:
+            if not self.closed:
+                self.closed = True
+                self._drop_ahead(lambda i: True)
@@ -0,0 +1,134 @@
+"""
+Discord Storage Content-Defined Chunker
+Splits files at content-dependent boundaries (FastCDC-style gear hash)
+so an edited file re-uses most of the chunks of its previous version
+"""
+
+import os
+import json
+import hashlib
+from typing import Iterator, List, Optional
+
+# Discord attachment cap used by the fixed chunker as well
+MAX_CHUNK_SIZE = 9000000
+MIN_CHUNK_SIZE = 4000000
+AVG_CHUNK_SIZE = 6000000
+
+# 30-bit gear hash: keeps every intermediate value a single-digit Python int,
+# which is what makes the per-byte loop bearable without a C extension.
+_HASH_BITS = 30
+_HASH_MASK = (1 << _HASH_BITS) - 1
+
+# Gear table derived from a fixed seed. It must never change, otherwise
+# boundaries (and with them the chunk index) stop matching older uploads.
+GEAR = [int.from_bytes(hashlib.sha256(b'discordstorage-gear-%d' % i).digest()[:4], 'big') >> (32 - _HASH_BITS)
+        for i in range(256)]
+
+
+def _mask(bits: int) -> int:
+    """Build a mask over the top bits of the gear hash"""
+    return ((1 << bits) - 1) << (_HASH_BITS - bits)
+
+
+def find_cut_point(data, min_size: int = MIN_CHUNK_SIZE,
+                   avg_size: int = AVG_CHUNK_SIZE,
+                   max_size: int = MAX_CHUNK_SIZE) -> int:
+    """Return the length of the first chunk in data (normalized chunking)"""
+    n = len(data)
+    if n <= min_size:
+        return n
+    if n > max_size:
+        n = max_size
+
+    bits = max(avg_size.bit_length() - 1, 3)
+    mask_s = _mask(bits + 2)  # harder to match before the average size
+    mask_l = _mask(bits - 2)  # easier to match after it
+    normal = min(avg_size, n)
+    gear = GEAR
+    h = 0
+    # Bytes below min_size are never hashed; the gear hash only depends on
+    # the last _HASH_BITS bytes, so starting from zero here is equivalent.
+    for i, b in enumerate(data[min_size:normal], min_size):
+        h = ((h << 1) + gear[b]) & _HASH_MASK
+        if not h & mask_s:
+            return i + 1
+    for i, b in enumerate(data[normal:n], normal):
+        h = ((h << 1) + gear[b]) & _HASH_MASK
+        if not h & mask_l:
+            return i + 1
+    return n
+
+
+def iter_chunks(file_path: str, min_size: int = MIN_CHUNK_SIZE,
+                avg_size: int = AVG_CHUNK_SIZE,
+                max_size: int = MAX_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield the content-defined chunks of a file, reading it once"""
+    buf = bytearray()
+    with open(file_path, 'rb') as f:
+        eof = False
+        while True:
+            while not eof and len(buf) < max_size:
+                data = f.read(max_size)
+                if not data:
+                    eof = True
+                    break
+                buf.extend(data)
+            if not buf:
+                return
+            cut = find_cut_point(buf, min_size, avg_size, max_size)
+            yield bytes(buf[:cut])
+            del buf[:cut]
+
+
+def chunk_hash(data) -> str:
+    """Strong hash used as the chunk index key"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ChunkIndex:
+    """Global index of stored chunks keyed by SHA-256
+
+    Entries are stored as [url, size, message] so a chunk that is already
+    on Discord can be referenced by new uploads instead of being re-sent.
+    message is [channel_id, message_id], used to refresh an expired url;
+    older entries only have [url, size].
+    """
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self.chunks = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        """Load the index from disk, starting empty if it is missing"""
+        try:
+            with open(self.index_path, 'r') as f:
+                self.chunks = json.load(f)
+        except FileNotFoundError:
+            self.chunks = {}
+        except Exception as e:
+            print(f"⚠️  Could not read chunk index, starting empty: {e}")
+            self.chunks = {}
+
+    def save(self):
+        """Write the index back to disk if it changed"""
+        if not self.dirty:
+            return
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.chunks, f)
+        os.replace(tmp_path, self.index_path)
+        self.dirty = False
+
+    def lookup(self, digest: str) -> Optional[List]:
+        """Return the stored [url, size, message] entry for a chunk hash"""
+        return self.chunks.get(digest)
+
+    def add(self, digest: str, url: str, size: int, message: Optional[List] = None):
+        """Record a chunk that has been stored on Discord"""
+        self.chunks[digest] = [url, size, message] if message else [url, size]
+        self.dirty = True
+
+    def __len__(self):
+        return len(self.chunks)
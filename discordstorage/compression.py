@@ -0,0 +1,137 @@
+"""
+Discord Storage Compression
+Streaming compression applied to a file before it is chunked, and the
+matching streaming decompressor used while it is downloaded
+"""
+
+import os
+import zlib
+import lzma
+from typing import Optional
+
+# zstd is optional; zlib/lzma from the standard library are the fallback
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+CODECS = ['zstd', 'zlib', 'lzma']
+
+# Compression is skipped when the sample does not shrink below this ratio
+MIN_RATIO = 0.9
+SAMPLE_BLOCK = 256 * 1024
+SAMPLE_BLOCKS = 4
+READ_BLOCK = 1024 * 1024
+
+
+def default_codec() -> str:
+    """Best codec available in this environment"""
+    return 'zstd' if ZSTD_AVAILABLE else 'zlib'
+
+
+def resolve_codec(name: Optional[str]) -> Optional[str]:
+    """Map a user choice ('auto', a codec name or None) to a usable codec"""
+    if not name or name == 'none':
+        return None
+    if name == 'auto':
+        return default_codec()
+    if name not in CODECS:
+        raise ValueError(f"Unknown compression codec: {name} (choose from {', '.join(CODECS)})")
+    if name == 'zstd' and not ZSTD_AVAILABLE:
+        print("⚠️  zstandard not installed, falling back to zlib (pip install zstandard)")
+        return 'zlib'
+    return name
+
+
+def _compressor(codec: str):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    if codec == 'zlib':
+        return zlib.compressobj(6)
+    if codec == 'lzma':
+        return lzma.LZMACompressor(preset=6)
+    raise ValueError(f"Unknown compression codec: {codec}")
+
+
+def sample_ratio(file_path: str, codec: str) -> float:
+    """Compress a few blocks spread across the file and return the size ratio"""
+    file_size = os.path.getsize(file_path)
+    if file_size == 0:
+        return 1.0
+    if file_size <= SAMPLE_BLOCK * SAMPLE_BLOCKS:
+        positions = [0]
+        block = file_size
+    else:
+        step = (file_size - SAMPLE_BLOCK) // (SAMPLE_BLOCKS - 1)
+        positions = [i * step for i in range(SAMPLE_BLOCKS)]
+        block = SAMPLE_BLOCK
+
+    raw = 0
+    packed = 0
+    with open(file_path, 'rb') as f:
+        for position in positions:
+            f.seek(position)
+            data = f.read(block)
+            compressor = _compressor(codec)
+            packed += len(compressor.compress(data)) + len(compressor.flush())
+            raw += len(data)
+    return packed / raw if raw else 1.0
+
+
+def compress_file(src_path: str, dst_path: str, codec: str) -> int:
+    """Stream-compress src into dst, returns the compressed size"""
+    compressor = _compressor(codec)
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        for block in iter(lambda: src.read(READ_BLOCK), b""):
+            dst.write(compressor.compress(block))
+        dst.write(compressor.flush())
+    return os.path.getsize(dst_path)
+
+
+class StreamDecompressor:
+    """Incremental decompressor fed with chunk data in file order"""
+
+    def __init__(self, codec: str):
+        self.codec = codec
+        if codec == 'zstd':
+            if not ZSTD_AVAILABLE:
+                raise ImportError("This file was compressed with zstd. Install with: pip install zstandard")
+            self._obj = zstandard.ZstdDecompressor().decompressobj()
+        elif codec == 'zlib':
+            self._obj = zlib.decompressobj()
+        elif codec == 'lzma':
+            self._obj = lzma.LZMADecompressor()
+        else:
+            raise ValueError(f"Unknown compression codec: {codec}")
+
+    def feed(self, data) -> bytes:
+        """Decompress the next piece of the stream"""
+        return self._obj.decompress(data)
+
+    def feed_blocks(self, data, limit: int):
+        """Decompress the next piece of the stream as blocks of at most limit
+        bytes, so highly compressible data does not expand in memory at once
+        (zstd's streaming object cannot bound its output, it yields one block)"""
+        if self.codec == 'zlib':
+            while data:
+                block = self._obj.decompress(data, limit)
+                data = self._obj.unconsumed_tail
+                if block:
+                    yield block
+        elif self.codec == 'lzma':
+            block = self._obj.decompress(data, limit)
+            while True:
+                if block:
+                    yield block
+                if self._obj.eof or self._obj.needs_input:
+                    return
+                block = self._obj.decompress(b"", limit)
+        else:
+            yield self._obj.decompress(data)
+
+    def finish(self) -> bytes:
+        """Return any output still buffered at the end of the stream"""
+        if self.codec == 'zlib':
+            return self._obj.flush()
+        return b""
@@ -1,6 +1,21 @@
 import os,io,aiohttp,asyncio, discord, time, hashlib, json
 from typing import cast
+from urllib.parse import urlparse
 from .Session import Session
+from .chunker import ChunkIndex, chunk_hash, iter_chunks
+from .catalog import Catalog
+from .compression import StreamDecompressor, compress_file, resolve_codec, sample_ratio, MIN_RATIO
+from .throttle import Shaper
+from .adaptive import AdaptiveLimit, CircuitBreakers, backoff_delay, parse_retry_after
+from .refresh import UrlRefresher
+from .rebuild import MANIFEST_LIMIT, RebuildState, manifest
+from .filetype import HEAD_SIZE, sniff
+from .fileio import BLOCK_SIZE, ChunkBitmap, ProgressJournal, has_hole, open_unbuffered, preallocate, read_range, write_at
+from .jobs import JobRegistry
+from .chunkcache import ChunkCache
+from .metrics import Metrics, retry_cause
+from .events import ConsoleSink, EventBus, JobSink, MetricsSink
+from .transfers import TransferQueue, INTERACTIVE, NORMAL, BACKGROUND
 
 class Core:
 
@@ -8,10 +23,37 @@ class Core:
         self.directory = directory #set root directory for downloaded/files to be uploaded
         self.session = Session(token,channel) #discord API
         self.client = self.session.getClient() #discord API client object
+        self.chunking = 'fixed' #'fixed' 9MB offsets or 'cdc' content-defined boundaries
+        self.compression = None #None, 'auto', or a codec name from compression.CODECS
+        self.chunk_index = ChunkIndex(os.path.join(directory, "chunks.discord")) #sha256 -> stored chunk
+        self.catalog = Catalog(os.path.join(directory, "config.discord")) #stored files, used for whole-file dedup
+        self.max_connections = 8 #open CDN connections across all transfers
+        self.chunk_concurrency = 4 #chunks fetched at the same time to start with, adapted up to max_connections
+        self.chunk_attempts = 10 #tries of one chunk (a few minutes of backoff) before its transfer fails
+        self.bandwidth = Shaper() #rate caps in bytes/s (global, per job, per client, scheduled), unlimited by default
+        self._connection_slots = None
+        self._chunk_limits = {} #direction -> AdaptiveLimit, see chunk_limit()
+        self.breakers = CircuitBreakers() #per endpoint, pause requests to one that keeps failing
+        self.refresher = UrlRefresher(token, os.path.join(directory, "urls.discord")) #re-signs expired CDN links
+        self.chunk_cache = ChunkCache(self, os.path.join(directory, "chunk_cache")) #chunks for range reads by the servers, with read-ahead
+        self.jobs = JobRegistry() #transfers started with submit_upload/submit_download
+        self.queue = TransferQueue(self, os.path.join(directory, "queue.discord")) #persistent scheduler every transfer goes through
+        self.metrics = Metrics(self) #counters and histograms served on /metrics
+        self.events = EventBus() #structured progress of every transfer, see events.py
+        self.console = self.events.subscribe(ConsoleSink(self)) #progress lines, a few per second at most
+        self.events.subscribe(MetricsSink(self.metrics))
+        self.events.subscribe(JobSink(self.jobs))
 
     #check if the client is connected to discord servers
     def isready(self):
-        return not(self.session.getLoop() == None)    #starts conenction to discord servers. 
+        return self.session.ready.is_set()
+
+    #blocks until connected to discord servers (or timeout seconds), returns isready().
+    #can be run from anything outside of main thread.
+    def wait_ready(self,timeout=None):
+        return self.session.wait_ready(timeout)
+
+    #starts conenction to discord servers.
     #RUNS ON MAIN THREAD, ASYNC.
     def start(self):
         self.session.start()
@@ -20,54 +62,159 @@ class Core:
     def logout(self):
          loop = self.session.getLoop()
          if loop is not None:
+             asyncio.run_coroutine_threadsafe(self.chunk_cache.close(), loop)
              future = asyncio.run_coroutine_threadsafe(self.session.logout(), loop)
     
-    #runs the async_upload in a threadsafe way,
+    #runs the async_upload through the transfer queue and waits for it,
     #can be run from anything outisde of main thread.
-    def upload(self,inp,code):
+    #the record is also added to the catalog under code.
+    def upload(self,inp,code,chunking=None,compression=None):
+         job = self.submit_upload(inp,code,chunking,compression,priority=NORMAL)
+         result = job.wait()
+         if job.error:
+             print(job.error)
+         return result
+
+    #queues an upload and returns its TransferJob right away; the record is added to
+    #the catalog under code when it finishes and cleanup (a directory) is removed.
+    #can be run from anything, including the session loop.
+    def submit_upload(self,inp,code=None,chunking=None,compression=None,name=None,owner=None,priority=BACKGROUND,cleanup=None):
+         code = code or self.catalog.new_code()
+         return self.queue.submit_upload(inp,code,chunking,compression,name,owner,priority,cleanup)
+
+    #queues a download into downloads/ and returns its TransferJob right away.
+    #can be run from anything, including the session loop.
+    def submit_download(self,inp,owner=None,priority=INTERACTIVE):
+         return self.queue.submit_download(inp,owner,priority)
+
+    #Variants for code already running on the session loop; the returned job can be
+    #awaited for its result.
+    #RUNS ON MAIN THREAD, ASYNC.
+    async def async_submit_upload(self,inp,code=None,chunking=None,compression=None,name=None,owner=None,priority=BACKGROUND,cleanup=None):
+         return self.submit_upload(inp,code,chunking,compression,name,owner,priority,cleanup)
+
+    async def async_submit_download(self,inp,owner=None,priority=INTERACTIVE):
+         return self.submit_download(inp,owner,priority)
+
+    #runs async_upload_many in a threadsafe way, returns the paths that failed.
+    #can be run from anything outside of main thread.
+    def upload_many(self,targets,on_done,concurrency=3,chunking=None,compression=None):
          loop = self.session.getLoop()
          if loop is None:
              print('[ERROR] Discord session not ready')
              return -1
-         future = asyncio.run_coroutine_threadsafe(self.async_upload(inp,code), loop)
+         future = asyncio.run_coroutine_threadsafe(
+             self.async_upload_many(targets,on_done,concurrency,chunking,compression), loop)
          try:
             return future.result()
          except Exception as exc:
             print(exc)
             return -1
-       #runs the async_download in a threadsafe way,
+
+    #runs the async_download through the transfer queue and waits for it,
     #can be run from an ything outside of main thread.
     def download(self,inp):
+        job = self.submit_download(inp,priority=NORMAL)
+        result = job.wait()
+        if job.error:
+            print('[ERROR] ' + job.error)
+        return result
+
+    #runs async_rebuild_index in a threadsafe way, returns (added, incomplete codes).
+    #can be run from anything outside of main thread.
+    def rebuild_index(self):
+        loop = self.session.getLoop()
+        if loop is None:
+            print('[ERROR] Discord session not ready')
+            return -1
+        future = asyncio.run_coroutine_threadsafe(self.async_rebuild_index(), loop)
+        try:
+            return future.result()
+        except Exception as exc:
+            print('[ERROR] ' + str(exc))
+            return -1
+
+    #runs async_download_many in a threadsafe way, returns the records that failed.
+    #can be run from anything outside of main thread.
+    def download_many(self,records,concurrency=2):
         loop = self.session.getLoop()
         if loop is None:
             print('[ERROR] Discord session not ready')
             return -1
-        future = asyncio.run_coroutine_threadsafe(self.async_download(inp), loop)
+        future = asyncio.run_coroutine_threadsafe(self.async_download_many(records,concurrency), loop)
         try:
             return future.result()
         except Exception as exc:
             print('[ERROR] ' + str(exc))
-            return -1    #Downloads a file from the server.
-    #The list object in this format is needed: [filename,size,[DL URLs],hash_url,original_hash]
+            return -1
+
+    #Semaphore capping open CDN connections across every transfer of this Core.
+    #Created lazily so it belongs to the loop that runs the transfers.
+    def connection_slots(self):
+        if self._connection_slots is None:
+            self._connection_slots = asyncio.Semaphore(self.max_connections)
+        return self._connection_slots
+
+    #AIMD limit on chunks in flight in direction ('download' or 'upload') across
+    #every transfer of this Core; starts at chunk_concurrency for downloads and at
+    #the queue's worker count for uploads. Created lazily, like connection_slots.
+    def chunk_limit(self,direction):
+        if direction not in self._chunk_limits:
+            if direction == 'download':
+                limit = AdaptiveLimit(self.chunk_concurrency, self.max_connections, name=direction)
+            else:
+                limit = AdaptiveLimit(self.queue.workers, self.queue.workers, name=direction)
+            self._chunk_limits[direction] = limit
+        return self._chunk_limits[direction]
+
+    #Downloads a file from the server.
+    #The list object in this format is needed: [filename,size,[DL URLs],hash_url,original_hash,meta]
+    #Chunks are fetched concurrently (as many as chunk_limit('download') allows, never more
+    #than self.max_connections) and written straight to their offsets. http = shared aiohttp session, optional.
+    #report = optional dict that receives 'expected_hash', 'actual_hash' and 'head'
+    #(the first bytes of the file, for file type detection).
+    #job = optional TransferJob that is advanced as chunks arrive.
     #RUNS ON MAIN THREAD, ASYNC.
-    async def async_download(self,inp):
+    async def async_download(self,inp,http=None,report=None,job=None):
+            if http is None:
+                async with aiohttp.ClientSession() as http:
+                    return await self.async_download(inp,http,report,job)
+            if job is not None:
+                job.start()
             filename = inp[0]
             total_size = inp[1]
-            urls = inp[2]
+            urls = list(inp[2]) # refreshed links replace expired ones in place
             hash_url = inp[3] if len(inp) > 3 else None
             original_hash = inp[4] if len(inp) > 4 else None
             total_chunks = len(urls)
+            offsets = self.chunk_offsets(inp)
+            meta = inp[5] if len(inp) > 5 else {}
+            codec = meta.get('codec')
+            messages = meta.get('messages') or [None] * total_chunks
+            #user agent is not in compliance with Discord API rules. Change accordingly if needed
+            agent = {'User-Agent':'DiscordStorageBot (http://github.com/nigel/discordstorage)'}
             
             print(f"\n📥 Starting download: {filename}")
             print(f"📊 File size: {self.GetHumanReadable(total_size)}")
             print(f"🔢 Total chunks: {total_chunks}")
+            if codec:
+                print(f"🗜️  Compressed with {codec} ({self.GetHumanReadable(meta.get('stored_size', 0))} stored)")
             print("-" * 50)
             
+            # Re-sign links that expired (or are about to) before any request fails
+            links = urls + ([hash_url] if hash_url else [])
+            try:
+                links = await self.refresher.fresh_urls(links, messages + [meta.get('hash_message')])
+            except Exception as e:
+                print(f"⚠️  Could not refresh expiring URLs: {str(e)}")
+            urls = links[:total_chunks]
+            if hash_url:
+                hash_url = links[-1]
+            
             # Create download directory and progress tracking
-            import hashlib
             file_hash = hashlib.md5(filename.encode()).hexdigest()[:8]
             download_dir = os.path.join(self.directory, "downloading", f"{filename}_{file_hash}")
-            progress_file = os.path.join(download_dir, "progress.json")
+            progress_file = os.path.join(download_dir, "progress.bitmap")
             output_file = os.path.join(self.directory, "downloads", filename)
             
             os.makedirs(os.path.dirname(output_file), exist_ok=True)
@@ -78,15 +225,21 @@ class Core:
             if hash_url:
                 print("📥 Downloading hash file first...")
                 try:
-                    agent = {'User-Agent':'DiscordStorageBot (http://github.com/nigel/discordstorage)'}
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(hash_url, headers=agent) as r:
-                            if r.status == 200:
+                    for attempt in range(2):
+                        async with http.get(hash_url, headers=agent) as r:
+                            status = r.status
+                            if status == 200:
                                 hash_content = await r.read()
                                 downloaded_hash = hash_content.decode('utf-8').strip()
                                 print(f"✅ Expected file hash: {downloaded_hash}")
-                            else:
-                                print(f"⚠️  Failed to download hash file (HTTP {r.status})")
+                                break
+                        if status in (403, 404) and attempt == 0:
+                            refreshed = await self.refresher.refresh([hash_url], [meta.get('hash_message')])
+                            if refreshed.get(hash_url):
+                                hash_url = refreshed[hash_url]
+                                continue
+                        print(f"⚠️  Failed to download hash file (HTTP {status})")
+                        break
                 except Exception as e:
                     print(f"⚠️  Failed to download hash file: {str(e)}")
             elif original_hash:
@@ -96,135 +249,207 @@ class Core:
                 print("⚠️  No hash information available for verification")
             
             # Check if we're resuming a download
-            resume_data = self.load_resume_data(progress_file)
-            if resume_data and resume_data.get('completed_chunks'):
-                completed_chunks = set(resume_data['completed_chunks'])
+            # Chunks that are done are bits in progress.bitmap, set in place as each one lands
+            stored_size = meta.get('stored_size', total_size) if codec else total_size
+            data_file = os.path.join(download_dir, "stream.part") if codec else output_file
+            bitmap = ChunkBitmap(progress_file, total_chunks, stored_size)
+            legacy = self.load_resume_data(os.path.join(download_dir, "progress.json"))
+            if legacy and legacy.get('completed_chunks') and legacy.get('total_chunks') == total_chunks:
+                for n in legacy['completed_chunks']:
+                    bitmap.add(n)
+                os.remove(os.path.join(download_dir, "progress.json"))
+            completed_chunks = set(bitmap)
+            if completed_chunks:
+                dropped = self.check_marked_chunks(data_file, completed_chunks, offsets, stored_size)
+                if dropped:
+                    print(f"⚠️  {len(dropped)} chunk(s) marked done are missing from the partial file, fetching them again")
+                    bitmap.discard(dropped)
+                    completed_chunks -= dropped
+            if completed_chunks:
                 print(f"🔄 Found previous download progress: {len(completed_chunks)}/{total_chunks} chunks completed")
                 print(f"📋 Resuming download...")
             else:
-                completed_chunks = set()
                 print("📋 Starting fresh download...")
             
             start_time = time.time()
-            downloaded_bytes = len(completed_chunks) * 9000000  # Approximate chunk size
+            downloaded_bytes = 0  # Bytes fetched in this run, used for speed
+            # chunks carry the stored (possibly compressed) bytes
+            done_bytes = sum((offsets[n + 1] if n + 1 < total_chunks else stored_size) - offsets[n]
+                             for n in completed_chunks)
+            if job is not None:
+                job.bytes_total = stored_size
+                job.advance(done_bytes)
+            events = self.events.transfer('download', filename, job, chunks_total=total_chunks, bytes_total=stored_size)
+            events.emit('transfer_started', chunks_done=len(completed_chunks), bytes_done=done_bytes)
             
             # Create/open the output file
-            f = open(output_file, 'r+b' if completed_chunks else 'wb')
+            # Compressed files land in a part file first and are decompressed
+            # into the output in chunk order as soon as the next chunk is present.
+            # The file is unbuffered and preallocated to its final size: chunks
+            # are written at their offset as they stream in.
+            f = open_unbuffered(data_file, bool(completed_chunks))
+            preallocate(f, stored_size)
+            if codec:
+                decoder = StreamDecompressor(codec)
+                out = open(output_file, 'wb')
             
-            for i in range(total_chunks):
-                    # Skip already completed chunks
-                    if i in completed_chunks:
-                        print(f"⏭️  Chunk {i+1}/{total_chunks} already downloaded, skipping...")
-                        continue
-                        
+            # The MD5 is computed while the data streams in: every time the
+            # next chunk in file order is complete it is read back (through one
+            # reused buffer, from the page cache) and hashed (and decoded)
+            hasher = hashlib.md5()
+            ordered = {'next': 0}
+            readback = bytearray(BLOCK_SIZE)
+            head = bytearray()
+            def consume_ready():
+                while ordered['next'] in completed_chunks and ordered['next'] < total_chunks:
+                    n = ordered['next']
+                    end = offsets[n + 1] if n + 1 < total_chunks else None
+                    for data in read_range(f, offsets[n], end, readback):
+                        for piece in (decoder.feed_blocks(data, BLOCK_SIZE) if codec else (data,)):
+                            if codec:
+                                out.write(piece)
+                            hasher.update(piece)
+                            if report is not None and len(head) < HEAD_SIZE:
+                                head.extend(piece[:HEAD_SIZE - len(head)])
+                                report['head'] = bytes(head)
+                    ordered['next'] += 1
+            consume_ready()
+            
+            refresh_lock = asyncio.Lock()
+            async def refresh_link(i, failed_url):
+                # One refresh re-signs every link still needed, so workers that
+                # hit the same expiry wait for it instead of sending their own
+                async with refresh_lock:
+                    if urls[i] != failed_url:
+                        return True
+                    print(f"🔗 Link for chunk {i+1}/{total_chunks} expired, refreshing...")
+                    self.metrics.url_refreshes.inc()
+                    needed = [n for n in range(total_chunks) if n not in completed_chunks]
+                    try:
+                        refreshed = await self.refresher.refresh([urls[n] for n in needed], [messages[n] for n in needed])
+                    except Exception as e:
+                        print(f"⚠️  URL refresh failed: {str(e)}")
+                        return False
+                    for n in needed:
+                        urls[n] = refreshed.get(urls[n], urls[n])
+                    return urls[i] != failed_url
+            
+            slots = self.connection_slots()
+            limit = self.chunk_limit('download')
+            pending = iter([i for i in range(total_chunks) if i not in completed_chunks])
+            if completed_chunks:
+                print(f"⏭️  Skipping {len(completed_chunks)} chunk(s) already downloaded")
+            
+            async def fetch_chunk(i):
+                    nonlocal downloaded_bytes, done_bytes
                     chunk_start_time = time.time()
-                    chunk_size = 0
                     
-                    # Retry mechanism with exponential backoff
+                    # Retry with jittered exponential backoff, paused while the CDN's circuit is open
                     retry_count = 0
-                    retry_delays = [1, 5, 15, 30]  # 1s, 5s, 15s, then 30s forever
-                    download_successful = False
-                    
-                    while not download_successful:
+                    link_refreshed = False  # at most one refresh per retry
+                    while True:
                         try:
-                            if retry_count == 0:
-                                print(f"⬇️  Downloading chunk {i+1}/{total_chunks}...", end=" ")
-                            else:
-                                print(f"🔄 Retry {retry_count} for chunk {i+1}/{total_chunks}...", end=" ")
-                            
-                            #user agent is not in compliance with Discord API rules. Change accordingly if needed
-                            agent = {'User-Agent':'DiscordStorageBot (http://github.com/nigel/discordstorage)'}
-                            
-                            # Download chunk to temporary location first
-                            chunk_data = bytearray()
-                            async with aiohttp.ClientSession() as session:
-                                async with session.get(urls[i], headers=agent) as r:
-                                        if r.status == 200:
-                                                async for data in r.content.iter_any():
-                                                        chunk_data.extend(data)
-                                                        chunk_size += len(data)
-                                        else:
-                                            raise Exception(f"HTTP {r.status}")
-                            
-                            # Write chunk to correct position in file
-                            f.seek(i * 9000000)  # Seek to chunk position
-                            f.write(chunk_data)
-                            f.flush()  # Ensure data is written
-                            
-                            downloaded_bytes += chunk_size
-                            completed_chunks.add(i)
-                            download_successful = True
-                            
+                            events.emit('chunk_started', index=i, attempt=retry_count)
+                            chunk_size = 0
+                            url = urls[i]
+                            status = None
+                            retry_after = None
+                            breaker = self.breakers.get(urlparse(url).netloc)
+                            await breaker.wait()
+                            async with limit, slots:
+                                attempt_start = time.monotonic()
+                                if not retry_count:
+                                    chunk_start_time = time.time()  # not counting the wait for a slot
+                                throttled = 0.0  # time spent in bandwidth limits is not the link's
+                                async with http.get(url, headers=agent) as r:
+                                    status = r.status
+                                    if status == 200:
+                                        # straight to the chunk's offset, nothing is collected in memory
+                                        async for data in r.content.iter_chunked(BLOCK_SIZE):
+                                            throttled += await self.bandwidth.consume('download', len(data), job)
+                                            write_at(f, data, offsets[i] + chunk_size)
+                                            chunk_size += len(data)
+                                    elif status == 429:
+                                        retry_after = parse_retry_after(r.headers.get('Retry-After'))
+                                if status == 200:
+                                    limit.success(time.monotonic() - attempt_start - throttled, chunk_size)
+                                    breaker.success()
+                            if status in (403, 404) and not link_refreshed:
+                                # Signed CDN links expire; re-sign and try again right away
+                                link_refreshed = True
+                                if await refresh_link(i, url):
+                                    continue
+                            if status != 200:
+                                raise Exception(f"HTTP {status}")
+                            break
                         except Exception as e:
                             retry_count += 1
-                            
-                            # Determine retry delay (1s, 5s, 15s, then stay at 30s)
-                            if retry_count <= len(retry_delays):
-                                delay = retry_delays[retry_count - 1]
-                            else:
-                                delay = retry_delays[-1]  # Stay at 30s
-                            
-                            print(f"❌ Failed: {str(e)}")
-                            print(f"⏱️  Waiting {delay}s before retry {retry_count}... (Press Ctrl+C to abort)")
-                            
-                            try:
-                                await asyncio.sleep(delay)
-                            except KeyboardInterrupt:
-                                f.close()
-                                print("\n❌ Download cancelled by user")
-                                # Save progress before exiting
-                                self.save_resume_data(progress_file, {
-                                    'completed_chunks': list(completed_chunks),
-                                    'total_chunks': total_chunks,
-                                    'file_size': total_size,
-                                    'filename': filename
-                                })
-                                raise Exception("Download cancelled by user")
+                            link_refreshed = False
+                            cause = retry_cause(e, status)
+                            limit.failure(cause)
+                            breaker.failure(cause)
+                            if retry_count >= self.chunk_attempts:
+                                raise Exception(f"Chunk {i+1}/{total_chunks} failed {retry_count} times ({cause}): {e}")
+                            delay = backoff_delay(retry_count, retry_after=retry_after)
+                            events.emit('chunk_retried', index=i, attempt=retry_count, cause=cause,
+                                        error=str(e), delay=delay)
+                            await asyncio.sleep(delay)
+                    
+                    downloaded_bytes += chunk_size
+                    done_bytes += chunk_size
+                    if job is not None:
+                        job.advance(chunk_size)
+                    completed_chunks.add(i)
+                    bitmap.add(i, f)
+                    consume_ready()
                     
-                    # Calculate and display progress (only after successful download)
+                    # Report progress (only after successful download)
                     chunk_time = time.time() - chunk_start_time
                     total_time = time.time() - start_time
-                    
-                    # Calculate speeds
-                    chunk_speed = chunk_size / chunk_time if chunk_time > 0 else 0
-                    avg_speed = downloaded_bytes / total_time if total_time > 0 else 0
-                    
-                    # Calculate progress percentage  
-                    progress = (len(completed_chunks) / total_chunks) * 100
-                    
-                    # Display progress
-                    print(f"✅ ({self.GetHumanReadable(chunk_size)}) ({chunk_speed * 8 / 1024 / 1024:.1f} Mbps)")
-                    print(f"📈 Progress: {progress:.1f}% | Avg Speed: {avg_speed * 8 / 1024 / 1024:.1f} Mbps | ETA: {self.calculate_eta((total_chunks - len(completed_chunks)) * 9000000, avg_speed)}")
-                    
-                    if i < total_chunks - 1:  # Don't print separator after last chunk
-                        print("   " + "█" * int(progress/2) + "░" * int(50-progress/2) + f" {len(completed_chunks)}/{total_chunks} chunks")
-                    
-                    # Save progress after each successful chunk
-                    self.save_resume_data(progress_file, {
-                        'completed_chunks': list(completed_chunks),
-                        'total_chunks': total_chunks,
-                        'file_size': total_size,
-                        'filename': filename
-                    })
+                    events.emit('chunk_completed', index=i, chunk_bytes=chunk_size, seconds=chunk_time,
+                                speed=chunk_size / chunk_time if chunk_time > 0 else 0,
+                                avg_speed=downloaded_bytes / total_time if total_time > 0 else 0,
+                                chunks_done=len(completed_chunks), bytes_done=done_bytes)
+            
+            async def worker():
+                for i in pending:
+                    await fetch_chunk(i)
             
+            # as many workers as the adaptive limit may allow; it decides how many fetch at a time
+            workers = [asyncio.ensure_future(worker()) for _ in range(min(limit.maximum, total_chunks) or 1)]
+            try:
+                await asyncio.gather(*workers)
+            except BaseException:
+                # Cancelled or failed: stop the other workers and keep what we
+                # have so the next run resumes
+                for task in workers:
+                    task.cancel()
+                bitmap.close(f)
+                f.close()
+                if codec:
+                    out.close()
+                print("\n❌ Download interrupted, progress saved")
+                raise
+            
+            bitmap.close(f)
             f.close()
+            if codec:
+                tail = decoder.finish()
+                out.write(tail)
+                hasher.update(tail)
+                out.close()
             
             total_time = time.time() - start_time
-            avg_speed = total_size / total_time if total_time > 0 else 0
-            
-            print("-" * 50)
-            print(f"🎉 Download completed!")
-            print(f"⏱️  Total time: {total_time:.1f}s")
-            print(f"🚀 Average speed: {avg_speed * 8 / 1024 / 1024:.1f} Mbps")
+            events.emit('transfer_done', bytes=downloaded_bytes, seconds=total_time,
+                        avg_speed=downloaded_bytes / total_time if total_time > 0 else 0,
+                        chunks_done=total_chunks, bytes_done=done_bytes)
             print(f"📁 Saved to: downloads/{filename}")
               # --- Verify file hash after download ---
             print(f"🔎 Verifying file hash after download...")
-            import hashlib
-            md5 = hashlib.md5()
-            with open(output_file, "rb") as f_hash:
-                for chunk in iter(lambda: f_hash.read(8192), b""):
-                    md5.update(chunk)
-            actual_hash = md5.hexdigest()
+            if ordered['next'] == total_chunks:
+                actual_hash = hasher.hexdigest()
+            else:
+                actual_hash = (await asyncio.to_thread(self.hash_file, output_file))[0]
             
             if downloaded_hash:
                 if actual_hash == downloaded_hash:
@@ -236,26 +461,225 @@ class Core:
                     print(f"⚠️  File may be corrupted or incomplete!")
             else:
                 print(f"⚠️  No hash available for verification. Calculated hash: {actual_hash}")
+            if report is not None:
+                report['expected_hash'] = downloaded_hash
+                report['actual_hash'] = actual_hash
             # --- End hash verification ---
               # Clean up temporary files
             self.cleanup_upload_dir(download_dir)
+            return output_file
+
+    #Restores many files through the transfer queue (priority NORMAL, owner 'cli').
+    #At least `concurrency` queue workers run them; their chunks share the
+    #connection cap and bandwidth limits of this Core. Returns the records that failed.
+    #RUNS ON MAIN THREAD, ASYNC.
+    async def async_download_many(self,records,concurrency=2):
+            self.queue.workers = max(self.queue.workers, concurrency)
+            start_time = time.time()
+            restored_bytes = 0
+            failed = []
+            jobs = [self.submit_download(record,'cli',NORMAL) for record in records]
+            for record, job in zip(records, jobs):
+                if await job == -1:
+                    print(f"❌ Download failed for {record[0]}: {job.error}")
+                    failed.append(record)
+                else:
+                    restored_bytes += record[1]
+            
+            total_time = time.time() - start_time
+            avg_speed = restored_bytes / total_time if total_time > 0 else 0
+            print("=" * 50)
+            print(f"🎉 Restored {len(records) - len(failed)}/{len(records)} files")
+            print(f"📦 Total: {self.GetHumanReadable(restored_bytes)} in {total_time:.1f}s")
+            print(f"🚀 Aggregate speed: {avg_speed * 8 / 1024 / 1024:.1f} Mbps")
+            return failed
+
+    #Rebuilds the catalog from the attachments in the storage channel.
+    #The history is walked oldest first (100 messages per request, the API maximum);
+    #finished records are streamed into the catalog and a checkpoint is written every
+    #`checkpoint_every` messages so an interrupted scan resumes where it stopped.
+    #Codes already in the catalog are left alone. Returns (added, incomplete codes).
+    #RUNS ON MAIN THREAD, ASYNC.
+    async def async_rebuild_index(self,checkpoint_every=1000):
+            channel = self.session.getChannel()
+            if channel is None:
+                raise Exception("Channel not found - check your channel ID configuration")
+            agent = {'User-Agent':'DiscordStorageBot (http://github.com/nigel/discordstorage)'}
+            state = RebuildState(os.path.join(self.directory, "rebuild.discord"))
+            after = None
+            if state.last_message_id:
+                after = discord.Object(id=state.last_message_id)
+                print(f"🔄 Resuming channel scan after {state.scanned} messages ({len(state.groups)} uploads pending)")
+            else:
+                print("🔍 Scanning channel history...")
+            ready = []
+            added = 0
+            slots = self.connection_slots()
+            
+            async with aiohttp.ClientSession() as http:
+                async def read_hash(code, record):
+                    # the hash file holds the MD5 the download verifies against
+                    try:
+                        if record[3]:
+                            async with slots:
+                                async with http.get(record[3], headers=agent) as r:
+                                    if r.status == 200:
+                                        record[4] = (await r.read()).decode('utf-8').strip()
+                        if record[0] == f"{code}.unknown" and not record[5].get('codec'):
+                            # no stored name: sniff the type from the head of the first chunk
+                            async with slots:
+                                async with http.get(record[2][0], headers=dict(agent, Range=f"bytes=0-{HEAD_SIZE - 1}")) as r:
+                                    if r.status in (200, 206):
+                                        record[0] = code + sniff(await r.content.read(HEAD_SIZE))[1]
+                    except Exception as e:
+                        print(f"⚠️  Could not read hash file of {record[0]}: {str(e)}")
+                
+                async def flush():
+                    nonlocal added
+                    await asyncio.gather(*[read_hash(code, record) for code, record in ready])
+                    for code, record in ready:
+                        if code in self.catalog:
+                            continue
+                        self.catalog.add(code, record, save=False)
+                        added += 1
+                    ready.clear()
+                    # catalog first: a crash in between only re-adds the same records
+                    self.catalog.save()
+                    state.save()
+                
+                async for message in channel.history(limit=None, oldest_first=True, after=after):
+                    for attachment in message.attachments:
+                        code = state.add(attachment.filename, attachment.url, attachment.size,
+                                         [message.channel.id, message.id], message.content)
+                        if code is not None and state.is_complete(code):
+                            record = state.pop_record(code)
+                            if state.needs_sources(record):
+                                state.deferred[code] = record  # resolved once the whole channel is read
+                            else:
+                                ready.append((code, record))
+                    state.last_message_id = message.id
+                    state.scanned += 1
+                    if state.scanned % checkpoint_every == 0:
+                        await flush()
+                        print(f"📜 {state.scanned} messages scanned, {added} files restored to the catalog")
+                
+                # End of the channel: uploads from before manifests existed can only
+                # be closed now; groups that still miss chunks are reported
+                incomplete = []
+                for code in state.pending_codes():
+                    group = state.groups[code]
+                    record = None if 'stored_size' in group['manifest'] else state.pop_record(code)
+                    if record is None:
+                        state.groups.pop(code, None)
+                        incomplete.append(code)
+                    else:
+                        ready.append((code, record))
+                await flush()
+                # Uploads that reused stored chunks: their sources are in the catalog now
+                if state.deferred:
+                    resolved, missing = state.resolve(list(self.catalog.files.values()))
+                    ready.extend(resolved)
+                    incomplete.extend(missing)
+                    await flush()
+            
+            state.clear()
+            print(f"🎉 Scan complete: {state.scanned} messages, {added} files restored to the catalog")
+            if incomplete:
+                print(f"⚠️  {len(incomplete)} upload(s) could not be rebuilt (missing chunks): {', '.join(sorted(incomplete))}")
+            return added, incomplete
+
+    #Finds the stored size of every chunk URL with HEAD requests, so chunks can be
+    #written to their offsets without knowing how the file was chunked.
+    #Expired links are refreshed once. Returns (urls, sizes); a size is None if unknown.
+    #RUNS ON MAIN THREAD, ASYNC.
+    async def async_probe_sizes(self,urls,http):
+            agent = {'User-Agent':'DiscordStorageBot (http://github.com/nigel/discordstorage)'}
+            urls = list(urls)
+            sizes = [None] * len(urls)
+            statuses = [None] * len(urls)
+            slots = self.connection_slots()
+            
+            async def probe(i):
+                async with slots:
+                    try:
+                        async with http.head(urls[i], headers=agent, allow_redirects=True) as r:
+                            statuses[i] = r.status
+                            if r.status == 200 and r.content_length is not None:
+                                sizes[i] = r.content_length
+                    except Exception as e:
+                        print(f"⚠️  Could not reach chunk {i+1}: {str(e)}")
+            
+            await asyncio.gather(*[probe(i) for i in range(len(urls))])
+            expired = [i for i in range(len(urls)) if statuses[i] in (403, 404)]
+            if expired:
+                print(f"🔗 {len(expired)} link(s) expired, refreshing...")
+                try:
+                    refreshed = await self.refresher.refresh([urls[i] for i in expired])
+                    for i in expired:
+                        urls[i] = refreshed.get(urls[i], urls[i])
+                    await asyncio.gather(*[probe(i) for i in expired])
+                except Exception as e:
+                    print(f"⚠️  URL refresh failed: {str(e)}")
+            return urls, sizes
+
+    #Recovers a file from its Discord URLs alone, no catalog entry or Discord login needed.
+    #Chunk sizes are probed first, then the regular download engine fetches the chunks
+    #concurrently into downloads/<name> (resumable, hashed as it streams in).
+    #Returns (record, report); record is None if a chunk could not be reached.
+    #RUNS ON MAIN THREAD, ASYNC.
+    async def async_recover(self,name,hash_url,chunk_urls):
+            report = {}
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            async with aiohttp.ClientSession(connector=connector) as http:
+                print(f"🔍 Probing {len(chunk_urls)} chunk(s)...")
+                urls, sizes = await self.async_probe_sizes(chunk_urls, http)
+                missing = [i + 1 for i, size in enumerate(sizes) if size is None]
+                if missing:
+                    print(f"❌ Could not reach {len(missing)} chunk(s): {', '.join(map(str, missing))}")
+                    return None, report
+                total_size = sum(sizes)
+                fixed = all(size == 9000000 for size in sizes[:-1])
+                meta = {'chunking': 'fixed' if fixed else 'cdc', 'chunk_sizes': sizes}
+                record = [name, total_size, urls, hash_url, None, meta]
+                await self.async_download(record, http, report)
+            record[4] = report.get('expected_hash') or report.get('actual_hash')
+            if fixed:
+                del meta['chunk_sizes']
+            return record, report
+
+    #Runs async_recover on a private event loop; recovery does not log in to Discord.
+    def recover(self,name,hash_url,chunk_urls):
+        try:
+            return asyncio.run(self.async_recover(name,hash_url,chunk_urls))
+        except KeyboardInterrupt:
+            print("\n❌ Recovery cancelled, run the same command again to resume")
+            return None, {}
             #files[code] = [name,size,[urls]]    #Uploads a file to the server from the root directory, or any other directory specified
-    #inp = directory, code = application-generated file code    #RUNS ON MAIN THREAD, ASYNC.
-    async def async_upload(self,inp,code):
+    #inp = directory, code = application-generated file code
+    #chunking = 'fixed' or 'cdc', defaults to self.chunking
+    #compression = None, 'auto' or a codec name, defaults to self.compression
+    #name = filename stored in the record, defaults to the basename of inp
+    #job = optional TransferJob that is advanced as chunks are stored
+    #RUNS ON MAIN THREAD, ASYNC.
+    async def async_upload(self,inp,code,chunking=None,compression=None,name=None,job=None):
+            if job is not None:
+                job.start()
             urls = []
+            messages = [] # [channel_id, message_id] per chunk, used to refresh expired urls
+            chunk_hashes = []
+            chunk_sizes = None
             hash_url = None
-            # --- Calculate and save file hash before upload ---
-            import hashlib
-            hash_path = inp + ".hash"
+            hash_message = None
+            chunking = chunking or self.chunking
+            codec = resolve_codec(compression or self.compression)
+            name = name or os.path.basename(inp)
+            # --- Calculate file hash before upload ---
+            # Disk-heavy steps run in a worker thread so concurrent uploads
+            # (and the gateway heartbeat) keep running on the loop
             print(f"🔎 Calculating file hash before upload...")
-            md5 = hashlib.md5()
-            with open(inp, "rb") as f_hash:
-                for chunk in iter(lambda: f_hash.read(8192), b""):
-                    md5.update(chunk)
-            file_md5 = md5.hexdigest()
-            with open(hash_path, "w") as f_hash_out:
-                f_hash_out.write(file_md5)
-            print(f"✅ File hash: {file_md5} (saved to {hash_path})")
+            file_md5, file_sha256 = await asyncio.to_thread(self.hash_file, inp)
+            
+            print(f"✅ File hash: {file_md5}")
             # --- End hash calculation ---
             channel = self.session.getChannel()
             
@@ -267,15 +691,33 @@ class Core:
             if not isinstance(channel, (discord.TextChannel, discord.DMChannel, discord.GroupChannel)):
                 raise Exception("Channel must be a text channel, DM, or group channel for file uploads")
             
+            # Identical content already stored: reuse its chunks and skip the transfer.
+            # A hash message naming the stored copy lets --rebuild-index restore this code too;
+            # copies of records without a hash message (older uploads) are sent again.
+            existing = self.catalog.find_by_hash(file_sha256, file_md5, os.path.getsize(inp))
+            if existing is not None and len(existing[1]) > 5 and existing[1][5].get('hash_message'):
+                existing_code, record = existing
+                print(f"♻️  Identical file already stored as code {existing_code}, reusing its chunks")
+                meta = dict(record[5])
+                content = manifest(name, record[1], meta.get('codec'), meta.get('stored_size', record[1]),
+                                   copy_of=meta['hash_message'])
+                hash_url, meta['hash_message'] = await self.send_hash_file(channel, code, file_md5, content)
+                meta['sha256'] = file_sha256
+                return [name,record[1],list(record[2]),hash_url,file_md5,meta]
+            
             # Calculate file info for progress tracking
             file_size = os.path.getsize(inp)
+            stored_size = file_size # bytes actually sent, differs when compressed
             total_chunks = self.splitFile(inp)
             chunk_size = 9000000  # 9MB
             
-            print(f"\n📤 Starting upload: {os.path.basename(inp)}")
+            print(f"\n📤 Starting upload: {name}")
             print(f"📊 File size: {self.GetHumanReadable(file_size)}")
-            print(f"🔢 Total chunks: {total_chunks}")
-            print(f"📦 Chunk size: {self.GetHumanReadable(chunk_size)}")
+            if chunking == 'cdc':
+                print(f"🔢 Total chunks: content-defined (max {self.GetHumanReadable(chunk_size)})")
+            else:
+                print(f"🔢 Total chunks: {total_chunks}")
+                print(f"📦 Chunk size: {self.GetHumanReadable(chunk_size)}")
             print("-" * 50)
             
             # Create uploading directory and pre-chunk the file
@@ -283,156 +725,304 @@ class Core:
             import hashlib
             file_hash = hashlib.md5(inp.encode()).hexdigest()[:8]
             upload_dir = os.path.join(self.directory, "uploading", f"{os.path.basename(inp)}_{file_hash}")
-            progress_file = os.path.join(upload_dir, "progress.json")
+            journal = ProgressJournal(os.path.join(upload_dir, "progress.journal"))
               # Check if we're resuming an upload
-            resume_data = self.load_resume_data(progress_file)
+            resume_data = self.load_upload_progress(journal, upload_dir)
             if resume_data:
+                total_chunks = resume_data.get('total_chunks', total_chunks)
                 print(f"🔄 Found previous upload progress: {resume_data['last_completed_chunk'] + 1}/{total_chunks} chunks completed")
                 print(f"📋 Resuming from chunk {resume_data['last_completed_chunk'] + 1}")
                 urls = resume_data['urls']
                 hash_url = resume_data.get('hash_url')
+                hash_message = resume_data.get('hash_message')
+                messages = resume_data.get('messages') or [None] * len(urls)
+                chunk_hashes = resume_data.get('chunk_hashes', [])
+                chunk_sizes = resume_data.get('chunk_sizes')
+                codec = resume_data.get('codec')
+                stored_size = resume_data.get('stored_size', file_size)
                 start_chunk = resume_data['last_completed_chunk'] + 1
                 # Use the existing upload code for consistency
                 if 'upload_code' in resume_data:
                     code = resume_data['upload_code']
                     print(f"📋 Using existing upload code: {code}")
             else:
+                source = inp
+                if codec:
+                    ratio = await asyncio.to_thread(sample_ratio, inp, codec)
+                    if ratio > MIN_RATIO:
+                        print(f"🗜️  Compression skipped: sample only shrinks to {ratio * 100:.0f}%")
+                        codec = None
+                    else:
+                        print(f"🗜️  Compressing with {codec}...", end=" ")
+                        os.makedirs(upload_dir, exist_ok=True)
+                        source = os.path.join(upload_dir, "compressed.bin")
+                        stored_size = await asyncio.to_thread(compress_file, inp, source, codec)
+                        total_chunks = self.splitFile(source)
+                        print(f"✅ {self.GetHumanReadable(file_size)} -> {self.GetHumanReadable(stored_size)}")
                 print("📋 Pre-chunking file for reliable upload...")
-                self.pre_chunk_file(inp, upload_dir, chunk_size, total_chunks)
+                if chunking == 'cdc':
+                    chunk_sizes = await asyncio.to_thread(self.pre_chunk_file_cdc, source, upload_dir)
+                else:
+                    await asyncio.to_thread(self.pre_chunk_file, source, upload_dir, chunk_size, total_chunks)
+                if source != inp:
+                    os.remove(source) # the chunks hold the compressed data now
                 start_chunk = 0
+            if chunk_sizes is not None:
+                total_chunks = len(chunk_sizes)
+                print(f"🔢 Content-defined chunks: {total_chunks}")
+            
+            # Chunks already stored are referenced instead of sent again. They are decided
+            # before the hash file goes out, because its manifest has to name them for
+            # --rebuild-index; older journals have no 'reused' and send every chunk.
+            if resume_data:
+                reused = resume_data.get('reused') or {}
+                same = resume_data.get('same') or {}
+            else:
+                def described(reused, same):
+                    return manifest(name, file_size, codec, stored_size,
+                                    {i: [entry[2][1], entry[1]] for i, entry in reused.items()}, same=same)
+                fits = lambda reused, same: len(described(reused, same)) <= MANIFEST_LIMIT
+                reused, same = await asyncio.to_thread(self.find_reused_chunks, upload_dir, total_chunks, channel.id, fits)
 
             # Upload hash file first if not already uploaded
             if not hash_url:
-                print("📤 Uploading hash file...")
-                try:
-                    with open(hash_path, 'rb') as hash_file:
-                        hash_content = hash_file.read()
-                    
-                    o = io.BytesIO(hash_content)
-                    discord_file = discord.File(fp=o, filename=code + ".hash")
-                    await channel.send(file=discord_file)
-                      # Get the uploaded hash file URL
-                    async for message in channel.history(limit=1):
-                        if message.author == self.client.user:
-                            hash_url = message.attachments[0].url
-                            break
-                    
-                    print(f"✅ Hash file uploaded successfully")
-                    
-                    # Clean up local hash file after successful upload
-                    try:
-                        os.remove(hash_path)
-                        print(f"🧹 Cleaned up local hash file")
-                    except Exception as cleanup_error:
-                        print(f"⚠️  Could not clean up hash file: {str(cleanup_error)}")
-                        
-                except Exception as e:
-                    print(f"❌ Failed to upload hash file: {str(e)}")
-                    raise Exception("Hash file upload failed")
+                hash_url, hash_message = await self.send_hash_file(channel, code, file_md5, described(reused, same))
+            if not resume_data:
+                journal.start({'hash_url': hash_url, 'hash_message': hash_message, 'chunk_sizes': chunk_sizes,
+                               'file_size': file_size, 'codec': codec, 'stored_size': stored_size,
+                               'total_chunks': total_chunks, 'upload_code': code,
+                               'reused': reused, 'same': same})
             
             start_time = time.time()
-            uploaded_bytes = start_chunk * chunk_size
+            uploaded_bytes = sum(chunk_sizes[:start_chunk]) if chunk_sizes is not None else start_chunk * chunk_size
+            sent_bytes = 0  # bytes sent in this run, used for speed
+            if job is not None:
+                job.bytes_total = stored_size
+                job.advance(uploaded_bytes)
+            events = self.events.transfer('upload', name, job, chunks_total=total_chunks, bytes_total=stored_size)
+            events.emit('transfer_started', chunks_done=start_chunk, bytes_done=uploaded_bytes)
+            limit = self.chunk_limit('upload')
+            breaker = self.breakers.get('Discord API')
             
-            for i in range(start_chunk, total_chunks):
+            # Chunks are journaled as they finish; the journal is fsynced in
+            # batches and on the way out, whether the upload finished or not
+            try:
+                for i in range(start_chunk, total_chunks):
                     chunk_start_time = time.time()
                     
+                    # Reference the chunk instead of re-sending it if it is already stored
+                    if str(i) in reused or str(i) in same:
+                        if str(i) in reused:
+                            url, actual_chunk_size, message, digest = reused[str(i)]
+                        else:
+                            earlier = same[str(i)]  # the same data as an earlier chunk of this file
+                            url, message, digest = urls[earlier], messages[earlier], chunk_hashes[earlier]
+                            actual_chunk_size = chunk_sizes[earlier] if chunk_sizes is not None else chunk_size
+                        urls.append(url)
+                        messages.append(message)
+                        chunk_hashes.append(digest)
+                        uploaded_bytes += actual_chunk_size
+                        if job is not None:
+                            job.advance(actual_chunk_size)
+                        events.emit('chunk_reused', index=i, chunk_bytes=actual_chunk_size,
+                                    chunks_done=i + 1, bytes_done=uploaded_bytes)
+                        journal.append({'i': i, 'url': url, 'message': message, 'hash': digest})
+                        continue
+                    
                     # Read chunk data from pre-chunked file
                     chunk_path = os.path.join(upload_dir, f"chunk_{i:03d}.bin")
                     with open(chunk_path, 'rb') as chunk_file:
                         chunk_data = chunk_file.read()
                     actual_chunk_size = len(chunk_data)
+                    digest = chunk_hash(chunk_data)
+                    # Charged once per chunk: a retry resends bytes the limit has already paid for
+                    await self.bandwidth.consume('upload', actual_chunk_size, job)
                     
-                    # Retry mechanism with exponential backoff
+                    # Retry with jittered exponential backoff, paused while Discord's circuit is open
                     retry_count = 0
-                    max_retries = None  # Unlimited retries
-                    retry_delays = [1, 5, 15, 30]  # 1s, 5s, 15s, then 30s forever
                     upload_successful = False
                     
                     while not upload_successful:
                         try:
                             o = io.BytesIO(chunk_data)
                             discord_file = discord.File(fp=o,filename=code+"." + str(i))
+                            events.emit('chunk_started', index=i, attempt=retry_count)
+                            await breaker.wait()
                             
-                            if retry_count == 0:
-                                print(f"⬆️  Uploading chunk {i+1}/{total_chunks} ({self.GetHumanReadable(actual_chunk_size)})...", end=" ")
-                            else:
-                                print(f"🔄 Retry {retry_count} for chunk {i+1}/{total_chunks}...", end=" ")
-                            
-                            await channel.send(file=discord_file)                            
+                            async with limit:
+                                attempt_start = time.monotonic()
+                                message = await channel.send(file=discord_file)
+                                limit.success(time.monotonic() - attempt_start, actual_chunk_size)
+                            breaker.success()
                             # Get the uploaded file URL
-                            async for message in channel.history(limit=None):
-                                    if message.author == self.client.user:
-                                            urls.append(message.attachments[0].url)
-                                            break
+                            urls.append(message.attachments[0].url)
+                            messages.append([message.channel.id, message.id])
                             
+                            chunk_hashes.append(digest)
+                            self.chunk_index.add(digest, urls[-1], actual_chunk_size, messages[-1])
                             upload_successful = True
                             # Success indicator will be shown in progress display
                             
                         except Exception as e:
                             retry_count += 1
-                              # Determine retry delay (1s, 5s, 15s, then stay at 30s)
-                            if retry_count <= len(retry_delays):
-                                delay = retry_delays[retry_count - 1]
-                            else:
-                                delay = retry_delays[-1]  # Stay at 30s
+                            cause = retry_cause(e)
+                            limit.failure(cause)
+                            breaker.failure(cause)
+                            if retry_count >= self.chunk_attempts:
+                                raise Exception(f"Chunk {i+1}/{total_chunks} failed {retry_count} times ({cause}): {e}")
+                            delay = backoff_delay(retry_count, retry_after=getattr(e, 'retry_after', None))
                             
-                            print(f"❌ Failed: {str(e)}")
-                            print(f"⏱️  Waiting {delay}s before retry {retry_count}... (Press Ctrl+C to abort)")
+                            events.emit('chunk_retried', index=i, attempt=retry_count, cause=cause,
+                                        error=str(e), delay=delay)
                             
                             try:
                                 await asyncio.sleep(delay)
                             except KeyboardInterrupt:
-                                print("\n❌ Upload cancelled by user")                                # Save progress before exiting
-                                self.save_resume_data(progress_file, {
-                                    'urls': urls,
-                                    'hash_url': hash_url,
-                                    'last_completed_chunk': i - 1,
-                                    'file_size': file_size,
-                                    'total_chunks': total_chunks,
-                                    'upload_code': code
-                                })
+                                print("\n❌ Upload cancelled by user")  # progress is saved on the way out
                                 raise Exception("Upload cancelled by user")
                     
-                    # Calculate and display progress (only after successful upload)
+                    # Report progress (only after successful upload)
                     uploaded_bytes += actual_chunk_size
+                    sent_bytes += actual_chunk_size
+                    if job is not None:
+                        job.advance(actual_chunk_size)
                     chunk_time = time.time() - chunk_start_time
                     total_time = time.time() - start_time
-                    
-                    # Calculate speeds
-                    chunk_speed = actual_chunk_size / chunk_time if chunk_time > 0 else 0
-                    avg_speed = uploaded_bytes / total_time if total_time > 0 else 0
-                    
-                    # Calculate progress percentage
-                    progress = (uploaded_bytes / file_size) * 100
-                      # Display progress
-                    print(f"✅ ({chunk_speed * 8 / 1024 / 1024:.1f} Mbps)")
-                    print(f"📈 Progress: {progress:.1f}% | Avg Speed: {avg_speed * 8 / 1024 / 1024:.1f} Mbps | ETA: {self.calculate_eta(file_size - uploaded_bytes, avg_speed)}")
-                    
-                    if i < total_chunks - 1:  # Don't print separator after last chunk
-                        print("   " + "█" * int(progress/2) + "░" * int(50-progress/2) + f" {uploaded_bytes}/{file_size} bytes")
-                      # Save progress after each successful chunk
-                    self.save_resume_data(progress_file, {
-                        'urls': urls,
-                        'hash_url': hash_url,
-                        'last_completed_chunk': i,
-                        'file_size': file_size,
-                        'total_chunks': total_chunks,
-                        'upload_code': code
-                    })
+                    events.emit('chunk_completed', index=i, chunk_bytes=actual_chunk_size, seconds=chunk_time,
+                                speed=actual_chunk_size / chunk_time if chunk_time > 0 else 0,
+                                avg_speed=sent_bytes / total_time if total_time > 0 else 0,
+                                chunks_done=i + 1, bytes_done=uploaded_bytes)
+                      # Record the chunk (one appended line)
+                    journal.append({'i': i, 'url': urls[-1], 'message': messages[-1], 'hash': digest})
+            finally:
+                self.chunk_index.save()
+                journal.close()
             
             # Upload completed successfully
             total_time = time.time() - start_time
-            avg_speed = file_size / total_time if total_time > 0 else 0
-            
-            print("-" * 50)
-            print(f"🎉 Upload completed!")
-            print(f"⏱️  Total time: {total_time:.1f}s")
-            print(f"🚀 Average speed: {avg_speed * 8 / 1024 / 1024:.1f} Mbps")
+            events.emit('transfer_done', bytes=sent_bytes, seconds=total_time,
+                        avg_speed=sent_bytes / total_time if total_time > 0 else 0,
+                        chunks_done=total_chunks, bytes_done=uploaded_bytes)
             print(f"📋 File code: {code}")
               # Clean up temporary files
             self.cleanup_upload_dir(upload_dir)
 
-            return [os.path.basename(inp),os.path.getsize(inp),urls,hash_url,file_md5]
+            # meta carries the chunk layout; chunk_sizes is only needed when boundaries aren't fixed
+            meta = {'chunking': chunking, 'chunk_hashes': chunk_hashes, 'sha256': file_sha256,
+                    'messages': messages, 'hash_message': hash_message}
+            if chunk_sizes is not None:
+                meta['chunk_sizes'] = chunk_sizes
+            if codec:
+                # record[1] stays the uncompressed size, stored_size is what the chunks add up to
+                meta['codec'] = codec
+                meta['stored_size'] = stored_size
+            return [name,os.path.getsize(inp),urls,hash_url,file_md5,meta]
+
+    #Sends CODE.hash (the file's MD5) with content as the message text, the manifest
+    #read back by --rebuild-index. Returns (hash_url, [channel_id, message_id]).
+    #RUNS ON MAIN THREAD, ASYNC.
+    async def send_hash_file(self,channel,code,file_md5,content):
+            print("📤 Uploading hash file...")
+            try:
+                discord_file = discord.File(fp=io.BytesIO(file_md5.encode()), filename=code + ".hash")
+                # The URL comes from the message we just sent; reading the channel
+                # history instead would race with other uploads in the same channel.
+                message = await channel.send(content=content, file=discord_file)
+                print(f"✅ Hash file uploaded successfully")
+                return message.attachments[0].url, [message.channel.id, message.id]
+            except Exception as e:
+                print(f"❌ Failed to upload hash file: {str(e)}")
+                raise Exception("Hash file upload failed")
+
+    #Picks the pre-chunked pieces in upload_dir that need not be sent: ones already stored
+    #in this channel, as reused {index: [url, size, message, sha256]}, and repeats of an
+    #earlier chunk of the same file, as same {index: earlier index}. Both go into the
+    #manifest, so only as many are picked as fits(reused, same) allows. Reads every chunk once.
+    def find_reused_chunks(self,upload_dir,total_chunks,channel_id,fits):
+        reused, same = {}, {}
+        seen = {} # sha256 -> first index in this file
+        for i in range(total_chunks):
+            with open(os.path.join(upload_dir, f"chunk_{i:03d}.bin"), 'rb') as chunk_file:
+                data = chunk_file.read()
+            digest = chunk_hash(data)
+            stored = self.chunk_index.lookup(digest)
+            if digest in seen and str(seen[digest]) not in reused:
+                candidate = (reused, dict(same, **{str(i): seen[digest]}))
+            elif stored is not None and stored[1] == len(data) and len(stored) > 2 and stored[2] and stored[2][0] == channel_id:
+                # only chunks whose message is known and in this channel can be found by a rebuild
+                candidate = (dict(reused, **{str(i): [stored[0], stored[1], stored[2], digest]}), same)
+            else:
+                seen.setdefault(digest, i)
+                continue
+            if not fits(*candidate):
+                print(f"♻️  {len(reused) + len(same)} repeated chunk(s) fit in the manifest, the rest are sent again")
+                break
+            reused, same = candidate
+            seen.setdefault(digest, i)
+        return reused, same
+
+    #Uploads many files through the transfer queue (priority NORMAL, owner 'cli').
+    #targets = iterable of (path, name), consumed lazily so huge trees are never held in memory
+    #and at most 2 * `concurrency` files wait in the queue at a time (at least
+    #`concurrency` queue workers upload them).
+    #The queue adds every record to the catalog (saved in batches); on_done(code, record)
+    #is called on the loop for every finished file. Returns the paths that failed.
+    #RUNS ON MAIN THREAD, ASYNC.
+    async def async_upload_many(self,targets,on_done,concurrency=3,chunking=None,compression=None):
+            self.queue.workers = max(self.queue.workers, concurrency)
+            slots = asyncio.Semaphore(concurrency * 2)
+            followers = []
+            failed = []
+            
+            async def follow(path, code, job):
+                try:
+                    record = await job
+                    if record == -1:
+                        print(f"❌ Upload failed for {path}: {job.error}")
+                        failed.append(path)
+                    else:
+                        on_done(code, record)
+                finally:
+                    slots.release()
+            
+            iterator = iter(targets)
+            while True:
+                # walking a directory tree blocks, keep it off the loop
+                item = await asyncio.to_thread(next, iterator, None)
+                if item is None:
+                    break
+                await slots.acquire()
+                path, name = item
+                code = self.catalog.new_code()
+                job = self.submit_upload(path,code,chunking,compression,name,'cli',NORMAL)
+                followers.append(asyncio.ensure_future(follow(path, code, job)))
+            await asyncio.gather(*followers)
+            return failed
+
+    #Hashes a file once for both the MD5 (stored/verified) and SHA-256 (dedup) digests.
+    def hash_file(self,path):
+            import hashlib
+            md5 = hashlib.md5()
+            sha256 = hashlib.sha256()
+            with open(path, "rb") as f_hash:
+                for chunk in iter(lambda: f_hash.read(1048576), b""):
+                    md5.update(chunk)
+                    sha256.update(chunk)
+            return md5.hexdigest(), sha256.hexdigest()
+
+    #Returns the byte offset of every chunk of a file record.
+    #Records without 'chunk_sizes' in their meta use the fixed 9MB layout.
+    def chunk_offsets(self,inp):
+            meta = inp[5] if len(inp) > 5 else {}
+            sizes = meta.get('chunk_sizes')
+            if sizes is None:
+                return [i * 9000000 for i in range(len(inp[2]))]
+            offsets = []
+            position = 0
+            for size in sizes:
+                offsets.append(position)
+                position += size
+            return offsets
 
     #Finds out how many file blocks are needed to upload a file.
     #Regular max upload size at a time: 8MB.
@@ -487,7 +1077,75 @@ class Core:
         
         print("✅ Chunks created!")
     
-    # Load resume data from progress file
+    # Pre-chunk the file at content-defined boundaries.
+    # Returns the list of chunk sizes, which replaces the fixed 9MB layout.
+    def pre_chunk_file_cdc(self, file_path, upload_dir):
+        os.makedirs(upload_dir, exist_ok=True)
+        
+        print("📋 Creating content-defined chunks...", end=" ")
+        chunk_sizes = []
+        for i, chunk_data in enumerate(iter_chunks(file_path)):
+            chunk_path = os.path.join(upload_dir, f"chunk_{i:03d}.bin")
+            with open(chunk_path, 'wb') as chunk_file:
+                chunk_file.write(chunk_data)
+            chunk_sizes.append(len(chunk_data))
+            
+            # Show progress
+            if (i + 1) % 5 == 0:
+                print(f"({i + 1})", end=" ")
+        
+        if not chunk_sizes:  # Empty file still gets a single (empty) chunk
+            open(os.path.join(upload_dir, "chunk_000.bin"), 'wb').close()
+            chunk_sizes.append(0)
+        
+        print("✅ Chunks created!")
+        return chunk_sizes
+    
+    # Fast resume check: returns the chunks marked done in the bitmap that the
+    # partial file cannot hold, i.e. the file is gone, ends before the chunk
+    # does, or has a hole (never written) inside it. Only metadata is read.
+    def check_marked_chunks(self, path, marked, offsets, file_size):
+        if not os.path.exists(path):
+            return set(marked)
+        size = os.path.getsize(path)
+        dropped = set()
+        with open(path, 'rb') as f:
+            for n in marked:
+                end = offsets[n + 1] if n + 1 < len(offsets) else file_size
+                if end > size or has_hole(f, offsets[n], end):
+                    dropped.add(n)
+        return dropped
+    
+    # Load the resume state of an upload from its journal, in the shape of the
+    # old progress.json (urls, messages, chunk_hashes, last_completed_chunk, ...).
+    # A progress.json left by an older version is moved into the journal once.
+    # Returns None when there is nothing to resume.
+    def load_upload_progress(self, journal, upload_dir):
+        legacy_file = os.path.join(upload_dir, "progress.json")
+        legacy = self.load_resume_data(legacy_file)
+        if legacy and 'urls' in legacy:
+            header = {key: value for key, value in legacy.items()
+                      if key not in ('urls', 'messages', 'chunk_hashes', 'last_completed_chunk')}
+            count = legacy['last_completed_chunk'] + 1
+            messages = (legacy.get('messages') or []) + [None] * count
+            hashes = (legacy.get('chunk_hashes') or []) + [None] * count
+            journal.start(header, ({'i': n, 'url': legacy['urls'][n], 'message': messages[n], 'hash': hashes[n]}
+                                   for n in range(count)))
+            os.remove(legacy_file)
+        header, entries = journal.load()
+        if header is None:
+            return None
+        done = 0
+        while done < len(entries) and entries[done].get('i') == done:
+            done += 1  # chunks are recorded in order; anything after a gap is ignored
+        resume = dict(header)
+        resume['urls'] = [entry['url'] for entry in entries[:done]]
+        resume['messages'] = [entry.get('message') for entry in entries[:done]]
+        resume['chunk_hashes'] = [entry['hash'] for entry in entries[:done] if entry.get('hash')]
+        resume['last_completed_chunk'] = done - 1
+        return resume
+    
+    # Load resume data from a (pre-journal) progress file
     def load_resume_data(self, progress_file):
         if not os.path.exists(progress_file):
             return None
@@ -496,19 +1154,10 @@ class Core:
             import json
             with open(progress_file, 'r') as f:
                 return json.load(f)
-        except:
+        except Exception as e:
+            print(f"⚠️  Ignoring unreadable progress file {progress_file}: {e}")
             return None
     
-    # Save resume data to progress file
-    def save_resume_data(self, progress_file, data):
-        try:
-            import json
-            os.makedirs(os.path.dirname(progress_file), exist_ok=True)
-            with open(progress_file, 'w') as f:
-                json.dump(data, f)
-        except:
-            pass  # Don't fail upload if we can't save progress
-    
     # Clean up upload directory after successful upload
     def cleanup_upload_dir(self, upload_dir):
         try:
@@ -0,0 +1,245 @@
+"""
+Discord Storage Daemon
+Keeps one Core logged in to Discord and serves ds.py over a local socket,
+so commands skip the gateway login and reuse the warm connection, HTTP
+pools and transfer queue
+
+Protocol: one JSON object per line. A request is
+{"secret": ..., "cmd": ..., "args": {...}}; the reply is
+{"ok": true, "result": ...} or {"ok": false, "error": ...}. The "wait"
+command first streams {"progress": [job, ...]} lines. The socket (a Unix
+socket, or localhost TCP where those are not available) and its secret
+are written to daemon.discord, readable only by the current user.
+"""
+
+import os
+import json
+import socket
+import asyncio
+import secrets
+from typing import Dict, List, Optional
+
+from .throttle import parse_rate
+from .transfers import NORMAL
+
+DAEMON_FILE = "daemon.discord"
+SOCKET_NAME = "ds.sock"
+PROGRESS_INTERVAL = 0.5  # seconds between progress lines of "wait"
+LINE_LIMIT = 64 * 1024 * 1024  # longest request line (an upload of a large directory lists every file)
+
+
+class DaemonError(Exception):
+    """Raised by DaemonClient when the daemon answers with an error"""
+
+
+def _write_private(path: str, data: Dict):
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+
+
+class DaemonServer:
+    """Serves control requests for a Core on its session loop"""
+
+    def __init__(self, core):
+        self.core = core
+        self.directory = core.directory
+        self.info_path = os.path.join(self.directory, DAEMON_FILE)
+        self.secret = secrets.token_hex(16)
+        self.server = None
+        self.address = None
+        self.commands = {
+            'ping': self.cmd_ping,
+            'list': self.cmd_list,
+            'jobs': self.cmd_jobs,
+            'upload': self.cmd_upload,
+            'download': self.cmd_download,
+            'cancel': self.cmd_cancel,
+            'limits': self.cmd_limits,
+            'shutdown': self.cmd_shutdown,
+        }
+
+    async def serve(self):
+        """Open the control socket and publish its address (RUNS ON MAIN THREAD, ASYNC)"""
+        if hasattr(socket, 'AF_UNIX'):
+            path = os.path.join(self.directory, SOCKET_NAME)
+            if os.path.exists(path):
+                os.remove(path)  # left behind by a daemon that did not shut down cleanly
+            try:
+                self.server = await asyncio.start_unix_server(self.handle, path, limit=LINE_LIMIT)
+                os.chmod(path, 0o600)
+                self.address = {'unix': path}
+            except OSError as e:
+                print(f"⚠️  Could not open {path} ({e}), using localhost TCP instead")
+        if self.server is None:
+            self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0, limit=LINE_LIMIT)
+            self.address = {'host': '127.0.0.1', 'port': self.server.sockets[0].getsockname()[1]}
+        _write_private(self.info_path, {'address': self.address, 'secret': self.secret, 'pid': os.getpid()})
+        print(f"🛰️  Daemon listening on {self.address.get('unix') or '127.0.0.1:%d' % self.address['port']}")
+
+    def close(self):
+        """Stop accepting requests and unpublish the address"""
+        if self.server is not None:
+            self.server.close()
+        for path in (self.info_path, (self.address or {}).get('unix')):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def send(message):
+            writer.write(json.dumps(message).encode() + b'\n')
+            await writer.drain()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    # the rest of the line may still be coming, so this connection cannot go on
+                    await send({'ok': False, 'error': f"request longer than {LINE_LIMIT} bytes"})
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not secrets.compare_digest(str(request.get('secret', '')), self.secret):
+                        raise PermissionError("bad secret")
+                    cmd = request.get('cmd')
+                    args = request.get('args') or {}
+                    if cmd == 'wait':
+                        result = await self.cmd_wait(send, **args)
+                    elif cmd in self.commands:
+                        result = self.commands[cmd](**args)
+                    else:
+                        raise ValueError(f"unknown command: {cmd}")
+                    await send({'ok': True, 'result': result})
+                except (ConnectionError, asyncio.CancelledError):
+                    raise
+                except Exception as e:
+                    await send({'ok': False, 'error': str(e) or type(e).__name__})
+        except ConnectionError:
+            pass  # the client went away, its jobs keep running
+        finally:
+            writer.close()
+
+    def cmd_ping(self) -> Dict:
+        return {'pid': os.getpid(), 'ready': self.core.isready(), 'jobs': len(self.core.jobs.active())}
+
+    def cmd_list(self) -> Dict:
+        self.core.catalog.reload_if_changed()
+        return self.core.catalog.files
+
+    def cmd_jobs(self, ids: Optional[List[str]] = None) -> List[Dict]:
+        jobs = [self.core.jobs.get(job_id) for job_id in ids] if ids else self.core.jobs.list()
+        return [job.to_dict() for job in jobs if job is not None]
+
+    def cmd_upload(self, targets: List, chunking=None, compression=None, owner='cli') -> List[str]:
+        """targets = [[absolute path, stored name], ...], returns the job IDs"""
+        with self.core.queue.batch():
+            return [self.core.submit_upload(path, name=name, chunking=chunking, compression=compression,
+                                            owner=owner, priority=NORMAL).id
+                    for path, name in targets]
+
+    def cmd_download(self, codes: List[str], owner='cli') -> List[str]:
+        self.core.catalog.reload_if_changed()
+        missing = [code for code in codes if not self.core.catalog.get(code)]
+        if missing:
+            raise ValueError(f"file code not found: {', '.join(missing)}")
+        with self.core.queue.batch():
+            return [self.core.submit_download(self.core.catalog.get(code), owner=owner, priority=NORMAL).id
+                    for code in codes]
+
+    def cmd_cancel(self, ids: List[str]) -> List[str]:
+        return [job_id for job_id in ids if self.core.jobs.get(job_id) and self.core.jobs.get(job_id).cancel()]
+
+    def cmd_limits(self, job: Optional[str] = None, rate: Optional[str] = None, **changes) -> Dict:
+        """Change bandwidth limits (see Shaper.configure), or the rate of one
+        job; returns the limits in effect"""
+        if job is not None:
+            target = self.core.jobs.get(job)
+            if target is None:
+                raise ValueError(f"job not found: {job}")
+            self.core.bandwidth.set_job_rate(target, parse_rate(rate) if rate else None)
+        return self.core.bandwidth.configure(**changes)
+
+    async def cmd_wait(self, send, ids: List[str]) -> List[Dict]:
+        """Stream progress until every job in ids has finished"""
+        jobs = [job for job in (self.core.jobs.get(job_id) for job_id in ids) if job is not None]
+        waiters = [asyncio.ensure_future(job) for job in jobs]  # each resolves when its job finishes
+        try:
+            while not all(waiter.done() for waiter in waiters):
+                await send({'progress': [job.to_dict() for job in jobs]})
+                await asyncio.wait([waiter for waiter in waiters if not waiter.done()],
+                                   timeout=PROGRESS_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+            return [job.to_dict() for job in jobs]
+        finally:
+            for waiter in waiters:
+                waiter.cancel()  # only stops waiting, not the job
+
+    def cmd_shutdown(self) -> bool:
+        asyncio.get_event_loop().call_later(0.1, lambda: asyncio.ensure_future(self.core.session.logout()))
+        return True
+
+
+class DaemonClient:
+    """Blocking client for the control socket, used by ds.py"""
+
+    def __init__(self, info: Dict, timeout: Optional[float] = None):
+        self.secret = info['secret']
+        address = info['address']
+        if 'unix' in address:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(address['unix'])
+        else:
+            self.sock = socket.create_connection((address['host'], address['port']), timeout)
+        self.file = self.sock.makefile('rwb')
+
+    @classmethod
+    def connect(cls, directory: str) -> Optional['DaemonClient']:
+        """Client for the daemon serving directory, or None if none is running"""
+        try:
+            with open(os.path.join(directory, DAEMON_FILE), 'r') as f:
+                info = json.load(f)
+            client = cls(info, timeout=2)
+            client.sock.settimeout(None)
+            return client
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _send(self, cmd: str, args: Dict):
+        self.file.write(json.dumps({'secret': self.secret, 'cmd': cmd, 'args': args}).encode() + b'\n')
+        self.file.flush()
+
+    def _read(self) -> Dict:
+        line = self.file.readline()
+        if not line:
+            raise DaemonError("the daemon closed the connection")
+        return json.loads(line)
+
+    def request(self, cmd: str, **args):
+        """Run one command and return its result"""
+        self._send(cmd, args)
+        return self._result(self._read())
+
+    def wait(self, ids: List[str], on_progress=None) -> List[Dict]:
+        """Wait for jobs, calling on_progress(jobs) as progress lines arrive"""
+        self._send('wait', {'ids': ids})
+        while True:
+            message = self._read()
+            if 'progress' in message:
+                if on_progress:
+                    on_progress(message['progress'])
+                continue
+            return self._result(message)
+
+    def _result(self, message: Dict):
+        if not message.get('ok'):
+            raise DaemonError(message.get('error', 'unknown error'))
+        return message['result']
+
+    def close(self):
+        try:
+            self.file.close()
+            self.sock.close()
+        except OSError:
+            pass
@@ -0,0 +1,186 @@
+"""
+Discord Storage Events
+Structured progress events of transfers, delivered to pluggable sinks
+
+Transfers emit transfer_started, chunk_started, chunk_completed,
+chunk_reused, chunk_retried and transfer_done events on the Core's
+EventBus (core.events). Sinks are callables taking an Event. The console
+renderer, the metrics and the job progress shown by the servers are all
+sinks; JsonLinesSink writes the raw stream for scripts.
+"""
+
+import sys
+import json
+import time
+import threading
+from typing import Callable, Dict
+
+CONSOLE_INTERVAL = 0.25  # seconds between progress lines of one transfer
+
+
+class Event(dict):
+    """One event: kind, time, direction, name, transfer (job id or None) plus
+    the fields of the kind, readable as attributes"""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class EventBus:
+    """Delivers events to every subscribed sink, in subscription order"""
+
+    def __init__(self):
+        self.sinks = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, sink: Callable[[Event], None]) -> Callable[[Event], None]:
+        with self._lock:
+            self.sinks = self.sinks + [sink]
+        return sink
+
+    def unsubscribe(self, sink: Callable[[Event], None]):
+        with self._lock:
+            self.sinks = [other for other in self.sinks if other is not sink]
+
+    def emit(self, kind: str, **fields) -> Event:
+        event = Event(kind=kind, time=time.time(), **fields)
+        for sink in self.sinks:
+            try:
+                sink(event)
+            except Exception as e:
+                # a broken sink must not fail the transfer reporting to it
+                print(f"⚠️  Event sink {type(sink).__name__} failed: {e}")
+        return event
+
+    def transfer(self, direction: str, name: str, job=None, **fields) -> 'TransferEvents':
+        return TransferEvents(self, direction, name, job, fields)
+
+
+class TransferEvents:
+    """Emits the events of one transfer with its common fields filled in"""
+
+    def __init__(self, bus: EventBus, direction: str, name: str, job, fields: Dict):
+        self.bus = bus
+        self.common = dict(direction=direction, name=name, transfer=job.id if job is not None else None)
+        self.common.update(fields)
+
+    def emit(self, kind: str, **fields) -> Event:
+        return self.bus.emit(kind, **dict(self.common, **fields))
+
+
+class ConsoleSink:
+    """Renders events as the familiar emoji progress lines
+
+    Progress lines of a transfer are printed at most every interval seconds
+    (the last chunk always is); retries and summaries are never dropped.
+    """
+
+    def __init__(self, core, interval: float = CONSOLE_INTERVAL, stream=None):
+        self.core = core
+        self.interval = interval
+        self.stream = stream
+        self._last = {}  # (direction, transfer or name) -> time of the last progress line
+
+    def _print(self, *lines):
+        for line in lines:
+            print(line, file=self.stream or sys.stdout)
+
+    def __call__(self, event: Event):
+        handler = getattr(self, 'on_' + event.kind, None)
+        if handler is not None:
+            handler(event)
+
+    def on_chunk_started(self, event: Event):
+        if event.attempt:
+            self._print(f"🔄 Retry {event.attempt} for chunk {event.index + 1}/{event.chunks_total}...")
+
+    def on_chunk_completed(self, event: Event):
+        key = (event.direction, event.transfer or event.name)
+        last_chunk = event.chunks_done >= event.chunks_total
+        if not last_chunk and event.time - self._last.get(key, 0) < self.interval:
+            return
+        self._last[key] = event.time
+        human = self.core.GetHumanReadable
+        mbps = lambda speed: f"{speed * 8 / 1024 / 1024:.1f} Mbps"
+        progress = (event.bytes_done / event.bytes_total) * 100 if event.bytes_total else 100.0
+        self._print(f"✅ Chunk {event.index + 1}/{event.chunks_total} ({human(event.chunk_bytes)}) ({mbps(event.speed)})",
+                    f"📈 Progress: {progress:.1f}% | Avg Speed: {mbps(event.avg_speed)} | ETA: {self.core.calculate_eta(event.bytes_total - event.bytes_done, event.avg_speed)}")
+        if not last_chunk:
+            self._print("   " + "█" * int(progress/2) + "░" * int(50-progress/2) + f" {event.chunks_done}/{event.chunks_total} chunks")
+
+    def on_chunk_reused(self, event: Event):
+        self._print(f"♻️  Chunk {event.index + 1}/{event.chunks_total} already stored, reusing it")
+
+    def on_chunk_retried(self, event: Event):
+        self._print(f"❌ Chunk {event.index + 1}/{event.chunks_total} failed: {event.error}",
+                    f"⏱️  Waiting {event.delay:.1f}s before retry {event.attempt}... (Press Ctrl+C to abort)")
+
+    def on_transfer_done(self, event: Event):
+        self._last.pop((event.direction, event.transfer or event.name), None)
+        verb = 'Upload' if event.direction == 'upload' else 'Download'
+        self._print("-" * 50,
+                    f"🎉 {verb} completed!",
+                    f"⏱️  Total time: {event.seconds:.1f}s",
+                    f"🚀 Average speed: {event.avg_speed * 8 / 1024 / 1024:.1f} Mbps")
+
+
+class JsonLinesSink:
+    """Writes every event as one JSON object per line to a file or stream"""
+
+    def __init__(self, target):
+        self._own = isinstance(target, str)
+        self.stream = open(target, 'a', buffering=1) if self._own else target
+        self._lock = threading.Lock()
+
+    def __call__(self, event: Event):
+        line = json.dumps(event, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+
+    def close(self):
+        if self._own:
+            self.stream.close()
+
+
+class MetricsSink:
+    """Feeds the transfer counters and histograms of a Metrics"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def __call__(self, event: Event):
+        if event.kind == 'chunk_completed':
+            counter = self.metrics.bytes_uploaded if event.direction == 'upload' else self.metrics.bytes_downloaded
+            counter.inc(event.chunk_bytes)
+            self.metrics.chunk_seconds.observe(event.seconds, direction=event.direction)
+        elif event.kind == 'chunk_retried':
+            self.metrics.chunk_retries.inc(direction=event.direction, cause=event.cause)
+        elif event.kind == 'chunk_reused':
+            self.metrics.chunks_reused.inc()
+
+
+class JobSink:
+    """Keeps chunk counts, retries and ETA on the TransferJob of each
+    transfer, for the servers' /jobs pages and the daemon"""
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    def __call__(self, event: Event):
+        job = self.jobs.get(event.transfer) if event.transfer else None
+        if job is None:
+            return
+        if 'chunks_total' in event:
+            job.chunks_total = event.chunks_total
+        if event.kind in ('transfer_started', 'chunk_completed', 'chunk_reused'):
+            job.chunks_done = event.chunks_done
+        if event.kind == 'chunk_completed':
+            remaining = event.bytes_total - event.bytes_done
+            job.eta = remaining / event.avg_speed if event.avg_speed > 0 else None
+        elif event.kind == 'chunk_retried':
+            job.retries += 1
+        elif event.kind == 'transfer_done':
+            job.eta = 0
@@ -0,0 +1,282 @@
+"""
+Discord Storage File I/O
+Positional writes and buffered read-back on unbuffered files, so chunk
+data that arrives out of order goes straight to its offset instead of
+being collected in a per-chunk buffer first, plus the preallocation, chunk
+bitmap and progress journal transfers resume from
+
+Resume state is crash-consistent: it is only ever replaced atomically or
+appended to, and it is fsynced in batches (every SYNC_EVERY chunks or
+SYNC_INTERVAL seconds), after the data it vouches for. A crash loses at
+most the last batch, which is then transferred again.
+"""
+
+import os
+import json
+import time
+import zlib
+import errno
+import struct
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+BLOCK_SIZE = 1024 * 1024  # read-back buffer size and HTTP read size
+SYNC_EVERY = 8  # chunks recorded between fsyncs of resume state
+SYNC_INTERVAL = 5.0  # seconds, at most, before recorded chunks are fsynced
+
+
+def open_unbuffered(path: str, resume: bool):
+    """Open path for positional I/O, keeping its content when resuming"""
+    return open(path, 'r+b' if resume else 'w+b', buffering=0)
+
+
+def write_at(f, data, offset: int):
+    """Write all of data at offset without moving other writers' positions"""
+    view = memoryview(data)
+    if hasattr(os, 'pwrite'):
+        fd = f.fileno()
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+    else:
+        # no await between seek and write, so this cannot interleave on the loop
+        f.seek(offset)
+        while view:
+            written = f.write(view)
+            view = view[written:]
+
+
+def read_range(f, start: int, end: Optional[int], buffer: bytearray) -> Iterator[memoryview]:
+    """Yield views of f[start:end] (end None = to EOF) read through buffer
+
+    Each view is only valid until the next one is requested.
+    """
+    view = memoryview(buffer)
+    while end is None or start < end:
+        f.seek(start)
+        size = len(view) if end is None else min(len(view), end - start)
+        read = f.readinto(view[:size])
+        if not read:
+            return
+        yield view[:read]
+        start += read
+
+
+def replace_atomic(path: str, data: bytes):
+    """Replace path with data so a crash leaves either the old or the new
+    content, never a torn mix"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(os.path.dirname(path))
+
+
+def fsync_dir(path: str):
+    """Persist a rename or a new file in path (no-op where directories cannot be opened)"""
+    try:
+        fd = os.open(path or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def preallocate(f, size: int):
+    """Reserve size bytes for f up front, sparse where the filesystem
+    cannot allocate (the unwritten ranges are then holes)"""
+    fd = f.fileno()
+    if os.fstat(fd).st_size > size:
+        os.ftruncate(fd, size)  # left over from a different, larger file
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        os.ftruncate(fd, size)
+
+
+def has_hole(f, start: int, end: int) -> bool:
+    """True if f[start:end] contains a hole (never written to); False when
+    the platform or filesystem cannot tell"""
+    if start >= end or not hasattr(os, 'SEEK_HOLE'):
+        return False
+    try:
+        return os.lseek(f.fileno(), start, os.SEEK_HOLE) < end
+    except OSError as e:
+        if e.errno in (errno.ENXIO, errno.EINVAL, errno.EOPNOTSUPP):
+            return False
+        raise
+
+
+class _Batched:
+    """fsync bookkeeping shared by the resume state files"""
+
+    def __init__(self, sync_every: int, sync_interval: float):
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def _due(self) -> bool:
+        self.unsynced += 1
+        return (self.unsynced >= self.sync_every
+                or time.monotonic() - self.synced_at >= self.sync_interval)
+
+    def _synced(self):
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+
+class ChunkBitmap(_Batched):
+    """Completed chunks of a download, one bit per chunk in a small file
+
+    Marked chunks are written out in batches by rewriting only the bytes
+    holding their bits, after the data file has been fsynced, so the
+    bitmap never claims data that could still be lost. The header records
+    the chunk count and file size the bits belong to.
+    """
+
+    MAGIC = b"DSBM"
+    HEADER = struct.Struct("<4sBIQ")  # magic, version, chunk count, file size
+    VERSION = 1
+
+    def __init__(self, path: str, total_chunks: int, file_size: int,
+                 sync_every: int = SYNC_EVERY, sync_interval: float = SYNC_INTERVAL):
+        super().__init__(sync_every, sync_interval)
+        self.path = path
+        self.total_chunks = total_chunks
+        self.file_size = file_size
+        self.bits = bytearray((total_chunks + 7) // 8)
+        self.dirty = set()  # byte positions changed since the last write
+        self.header = self.HEADER.pack(self.MAGIC, self.VERSION, total_chunks, file_size)
+        stored = b""
+        try:
+            with open(path, 'rb') as existing:
+                stored = existing.read(self.HEADER.size + len(self.bits) + 1)
+        except FileNotFoundError:
+            pass
+        if stored[:self.HEADER.size] == self.header and len(stored) == self.HEADER.size + len(self.bits):
+            self.bits[:] = stored[self.HEADER.size:]
+        else:
+            replace_atomic(path, self.header + self.bits)  # new, or left by a different file
+        self._file = open(path, 'r+b', buffering=0)
+
+    def __contains__(self, index: int) -> bool:
+        return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def __iter__(self) -> Iterator[int]:
+        return (i for i in range(self.total_chunks) if i in self)
+
+    def __len__(self) -> int:
+        return sum(bin(byte).count('1') for byte in self.bits)
+
+    def add(self, index: int, data=None):
+        """Mark a chunk done; data is the file holding it, fsynced before the bit is"""
+        self.bits[index >> 3] |= 1 << (index & 7)
+        self.dirty.add(index >> 3)
+        if self._due():
+            self.sync(data)
+
+    def sync(self, data=None):
+        if data is not None and not data.closed:
+            os.fsync(data.fileno())
+        for position in sorted(self.dirty):
+            write_at(self._file, self.bits[position:position + 1], self.HEADER.size + position)
+        self.dirty.clear()
+        os.fsync(self._file.fileno())
+        self._synced()
+
+    def discard(self, indices: Iterable[int]):
+        """Unmark chunks (before any new ones are marked)"""
+        for index in indices:
+            self.bits[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+        self._file.close()
+        replace_atomic(self.path, self.header + self.bits)
+        self._file = open(self.path, 'r+b', buffering=0)
+
+    def close(self, data=None):
+        """Write out pending marks (fsyncing data first) and close"""
+        if not self._file.closed:
+            if self.dirty:
+                self.sync(data)
+            self._file.close()
+
+
+class ProgressJournal(_Batched):
+    """Append-only resume journal of an upload
+
+    The first line is a header describing the upload, every further line
+    one finished chunk. Each line carries a CRC32 of its payload; reading
+    stops at the first line that is torn or damaged, so a crash in the
+    middle of an append only loses that one chunk.
+    """
+
+    def __init__(self, path: str, sync_every: int = SYNC_EVERY, sync_interval: float = SYNC_INTERVAL):
+        super().__init__(sync_every, sync_interval)
+        self.path = path
+        self._file = None
+
+    @staticmethod
+    def _line(payload: Dict) -> bytes:
+        data = json.dumps(payload, separators=(',', ':')).encode()
+        return b"%08x %s\n" % (zlib.crc32(data), data)
+
+    def load(self) -> Tuple[Optional[Dict], List[Dict]]:
+        """(header, entries) recorded so far, (None, []) without a usable journal"""
+        header, entries, valid = None, [], 0
+        try:
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b"\n") or len(line) < 10 or line[8:9] != b" ":
+                        break
+                    payload = line[9:-1]
+                    try:
+                        if int(line[:8], 16) != zlib.crc32(payload):
+                            break
+                        record = json.loads(payload)
+                    except ValueError:
+                        break
+                    if header is None:
+                        header = record
+                    else:
+                        entries.append(record)
+                    valid += len(line)
+        except FileNotFoundError:
+            return None, []
+        if self._file is None:
+            # drop a torn tail so new entries follow the last good one
+            self._file = open(self.path, 'r+b', buffering=0)
+            self._file.truncate(valid)
+            self._file.seek(valid)
+        return header, entries
+
+    def start(self, header: Dict, entries: Iterable[Dict] = ()):
+        """Begin a new journal (replacing any old one) with header and entries"""
+        if self._file is not None:
+            self._file.close()
+        replace_atomic(self.path, self._line(header) + b"".join(self._line(entry) for entry in entries))
+        self._file = open(self.path, 'ab', buffering=0)
+        self._synced()
+
+    def append(self, entry: Dict):
+        view = memoryview(self._line(entry))
+        while view:
+            view = view[self._file.write(view):]
+        if self._due():
+            self.sync()
+
+    def sync(self):
+        if self._file is not None and not self._file.closed:
+            os.fsync(self._file.fileno())
+        self._synced()
+
+    def close(self):
+        if self._file is not None and not self._file.closed:
+            if self.unsynced:
+                self.sync()
+            self._file.close()
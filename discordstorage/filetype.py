@@ -0,0 +1,234 @@
+"""
+Discord Storage File Type Detection
+Identifies a file from its leading bytes with a built-in signature table,
+so recovered or rebuilt files can be given an extension without any
+external tools
+"""
+
+import os
+import struct
+from typing import Optional, Tuple
+
+# Enough to reach every signature below, including the ISO 9660 volume descriptor
+HEAD_SIZE = 36 * 1024
+UNKNOWN = ("unknown", ".unknown")
+
+# (offset, magic, description, extension); longer magics win at the same offset.
+# Two-byte magics (BM, MZ) also need their header to hold up, see _refine
+SIGNATURES = [
+    (0, b'\xff\xd8\xff', 'JPEG image data', '.jpg'),
+    (0, b'\x89PNG\r\n\x1a\n', 'PNG image data', '.png'),
+    (0, b'GIF87a', 'GIF image data', '.gif'),
+    (0, b'GIF89a', 'GIF image data', '.gif'),
+    (0, b'BM', 'PC bitmap', '.bmp'),
+    (0, b'II*\x00', 'TIFF image data', '.tiff'),
+    (0, b'MM\x00*', 'TIFF image data', '.tiff'),
+    (0, b'\x00\x00\x01\x00', 'MS Windows icon resource', '.ico'),
+    (0, b'8BPS', 'Adobe Photoshop Image', '.psd'),
+    (0, b'%PDF-', 'PDF document', '.pdf'),
+    (0, b'%!PS-Adobe', 'PostScript document', '.ps'),
+    (0, b'{\\rtf', 'Rich Text Format data', '.rtf'),
+    (0, b'PK\x03\x04', 'Zip archive data', '.zip'),
+    (0, b'PK\x05\x06', 'Zip archive data (empty)', '.zip'),
+    (0, b'Rar!\x1a\x07', 'RAR archive data', '.rar'),
+    (0, b"7z\xbc\xaf'\x1c", '7-zip archive data', '.7z'),
+    (0, b'\x1f\x8b', 'gzip compressed data', '.gz'),
+    (0, b'BZh', 'bzip2 compressed data', '.bz2'),
+    (0, b'\xfd7zXZ\x00', 'XZ compressed data', '.xz'),
+    (0, b'(\xb5/\xfd', 'Zstandard compressed data', '.zst'),
+    (257, b'ustar', 'POSIX tar archive', '.tar'),
+    (0, b'MSCF', 'Microsoft Cabinet archive data', '.cab'),
+    (0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'Composite Document File V2 Document (Microsoft Office)', '.doc'),
+    (0, b'MZ', 'PE32 executable (MS Windows)', '.exe'),
+    (0, b'\x7fELF', 'ELF executable', '.elf'),
+    (0, b'\xca\xfe\xba\xbe', 'Java class data or Mach-O universal binary', '.class'),
+    (0, b'\xcf\xfa\xed\xfe', 'Mach-O 64-bit executable', '.macho'),
+    (0, b'!<arch>\ndebian', 'Debian binary package', '.deb'),
+    (0, b'\xed\xab\xee\xdb', 'RPM package', '.rpm'),
+    (0, b'SQLite format 3\x00', 'SQLite 3.x database', '.db'),
+    (0, b'\x00\x01\x00\x00\x00', 'TrueType font data', '.ttf'),
+    (0, b'OTTO', 'OpenType font data', '.otf'),
+    (0, b'wOFF', 'Web Open Font Format', '.woff'),
+    (0, b'wOF2', 'Web Open Font Format 2', '.woff2'),
+    (0, b'ID3', 'Audio file with ID3 tag (MP3)', '.mp3'),
+    (0, b'\xff\xfb', 'MPEG ADTS, layer III (MP3)', '.mp3'),
+    (0, b'\xff\xf3', 'MPEG ADTS, layer III (MP3)', '.mp3'),
+    (0, b'\xff\xf1', 'MPEG ADTS, AAC', '.aac'),
+    (0, b'fLaC', 'FLAC audio bitstream data', '.flac'),
+    (0, b'OggS', 'Ogg data', '.ogg'),
+    (0, b'MThd', 'Standard MIDI data', '.mid'),
+    (0, b'\x1aE\xdf\xa3', 'Matroska data', '.mkv'),
+    (0, b'FLV\x01', 'Macromedia Flash Video', '.flv'),
+    (0, b'0&\xb2u\x8ef\xcf\x11', 'Microsoft ASF (WMV/WMA)', '.wmv'),
+    (0, b'\x00\x00\x01\xba', 'MPEG program stream', '.mpg'),
+    (0, b'RIFF', 'RIFF data', '.riff'),
+    (0, b'\x00asm', 'WebAssembly binary', '.wasm'),
+    (0, b'glTF', 'glTF binary model', '.glb'),
+    (0, b'BLENDER', 'Blender3D file', '.blend'),
+    (0, b'solid ', 'ASCII STL model', '.stl'),
+    (0, b'AC10', 'AutoCAD drawing', '.dwg'),
+    (0, b'koly', 'Apple disk image', '.dmg'),
+    (0, b'xar!', 'XAR archive (macOS package)', '.pkg'),
+    (0, b'KDMV', 'VMware4 disk image', '.vmdk'),
+    (0, b'conectix', 'Microsoft Virtual PC disk image', '.vhd'),
+    (0, b'QFI\xfb', 'QEMU QCOW disk image', '.qcow2'),
+    (32769, b'CD001', 'ISO 9660 CD-ROM filesystem data', '.iso'),
+]
+
+# RIFF containers are told apart by the form type at offset 8
+RIFF_TYPES = {
+    b'WAVE': ('RIFF (little-endian) data, WAVE audio', '.wav'),
+    b'AVI ': ('RIFF (little-endian) data, AVI', '.avi'),
+    b'WEBP': ('RIFF (little-endian) data, Web/P image', '.webp'),
+}
+
+# ISO base media files (ftyp box) are told apart by their major brand
+FTYP_BRANDS = {
+    b'qt  ': ('ISO Media, Apple QuickTime movie', '.mov'),
+    b'M4A ': ('ISO Media, Apple iTunes ALAC/AAC-LC (.M4A) Audio', '.m4a'),
+    b'M4V ': ('ISO Media, Apple iTunes Video (.M4V)', '.m4v'),
+    b'heic': ('ISO Media, HEIF Image HEVC Main', '.heic'),
+    b'avif': ('ISO Media, AVIF Image', '.avif'),
+    b'3gp4': ('ISO Media, 3GPP', '.3gp'),
+    b'3gp5': ('ISO Media, 3GPP', '.3gp'),
+}
+
+# Sizes of the BMP info headers (core, v1 to v5, and the OS/2 and Adobe variants)
+BMP_DIB_SIZES = (12, 16, 40, 52, 56, 64, 108, 124)
+
+# Zip based formats are recognised by a member name in the first local headers
+ZIP_MEMBERS = [
+    (b'word/', ('Microsoft Word 2007+', '.docx')),
+    (b'xl/', ('Microsoft Excel 2007+', '.xlsx')),
+    (b'ppt/', ('Microsoft PowerPoint 2007+', '.pptx')),
+    (b'AndroidManifest.xml', ('Android package (APK)', '.apk')),
+    (b'META-INF/MANIFEST.MF', ('Java archive data (JAR)', '.jar')),
+    (b'Payload/', ('iOS App Store package', '.ipa')),
+]
+
+# mimetype member stored first by EPUB and OpenDocument files
+ZIP_MIMETYPES = [
+    (b'application/epub+zip', ('EPUB document', '.epub')),
+    (b'application/vnd.oasis.opendocument.text', ('OpenDocument Text', '.odt')),
+    (b'application/vnd.oasis.opendocument.spreadsheet', ('OpenDocument Spreadsheet', '.ods')),
+    (b'application/vnd.oasis.opendocument.presentation', ('OpenDocument Presentation', '.odp')),
+]
+
+
+def _compile(signatures):
+    """Index signatures by offset and first two bytes, longest magic first"""
+    table = {}
+    for offset, magic, description, ext in signatures:
+        table.setdefault(offset, {}).setdefault(magic[:2], []).append((magic, description, ext))
+    for by_prefix in table.values():
+        for candidates in by_prefix.values():
+            candidates.sort(key=lambda c: len(c[0]), reverse=True)
+    return sorted(table.items())
+
+
+_TABLE = _compile(SIGNATURES)
+
+
+def _bmp_header(head: bytes) -> bool:
+    """True if the file and info header sizes of a BMP are consistent"""
+    if len(head) < 18:
+        return False
+    file_size, _, pixels, dib_size = struct.unpack_from('<IIII', head, 2)
+    return dib_size in BMP_DIB_SIZES and 14 + dib_size <= pixels <= file_size
+
+
+def _executable(head: bytes) -> Optional[Tuple[str, str]]:
+    """PE or plain DOS program behind an MZ header, None if it is neither"""
+    if len(head) >= 64:
+        pe_offset, = struct.unpack_from('<I', head, 0x3c)  # e_lfanew
+        if 64 <= pe_offset <= len(head) - 4 and head[pe_offset:pe_offset + 4] == b'PE\x00\x00':
+            return ('PE32 executable (MS Windows)', '.exe')
+    if len(head) < 28:
+        return None
+    # bytes in the last 512-byte page, page count, header size in paragraphs
+    last_page, pages, _, header = struct.unpack_from('<HHHH', head, 2)
+    if last_page < 512 and pages > 0 and 2 <= header and header * 16 <= pages * 512:
+        return ('MS-DOS executable', '.exe')
+    return None
+
+
+def _refine(head: bytes, description: str, ext: str) -> Optional[Tuple[str, str]]:
+    """Narrow down container formats that share a signature, None if the
+    header behind a short magic does not hold up"""
+    if ext == '.riff':
+        return RIFF_TYPES.get(head[8:12], (description, ext))
+    if ext == '.zip':
+        if head[30:38] == b'mimetype':
+            for mimetype, result in ZIP_MIMETYPES:
+                if mimetype in head[38:38 + 80]:
+                    return result
+        for member, result in ZIP_MEMBERS:
+            if member in head:
+                return result
+    if ext == '.bmp' and not _bmp_header(head):
+        return None
+    if ext == '.exe':
+        return _executable(head)
+    return description, ext
+
+
+def _sniff_text(head: bytes) -> Tuple[str, str]:
+    """Classify data that decodes as text"""
+    if not head or b'\x00' in head:
+        return UNKNOWN
+    try:
+        text = head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # the head may end in the middle of a multi-byte character
+        if e.start < len(head) - 3:
+            return UNKNOWN
+        text = head[:e.start].decode('utf-8')
+    stripped = text.lstrip('\ufeff \t\r\n')
+    lowered = stripped[:256].lower()
+    if stripped.startswith('#!'):
+        first_line = lowered.split('\n', 1)[0]
+        if 'python' in first_line:
+            return ('Python script, UTF-8 text', '.py')
+        if 'node' in first_line:
+            return ('JavaScript script, UTF-8 text', '.js')
+        return ('shell script, UTF-8 text', '.sh')
+    if lowered.startswith('<?xml'):
+        if '<svg' in text[:1024].lower():
+            return ('SVG Scalable Vector Graphics image', '.svg')
+        return ('XML document text', '.xml')
+    if lowered.startswith('<svg'):
+        return ('SVG Scalable Vector Graphics image', '.svg')
+    if lowered.startswith('<!doctype html') or lowered.startswith('<html'):
+        return ('HTML document, UTF-8 text', '.html')
+    if stripped[:1] in ('{', '['):
+        return ('JSON text data', '.json')
+    if lowered.startswith(('create table', 'insert into', '-- mysql dump', '-- postgresql database dump', 'begin transaction')):
+        return ('SQL text', '.sql')
+    lines = stripped.split('\n', 5)[:5]
+    if len(lines) > 1 and all(line.count(',') == lines[0].count(',') > 0 for line in lines[:-1]):
+        return ('CSV text', '.csv')
+    return ('UTF-8 Unicode text', '.txt')
+
+
+def sniff(head: bytes) -> Tuple[str, str]:
+    """Return (description, extension) for the first bytes of a file"""
+    head = bytes(head[:HEAD_SIZE])
+    for offset, by_prefix in _TABLE:
+        for magic, description, ext in by_prefix.get(head[offset:offset + 2], ()):
+            if head.startswith(magic, offset):
+                result = _refine(head, description, ext)
+                if result is not None:
+                    return result
+    if head[4:8] == b'ftyp':
+        return FTYP_BRANDS.get(head[8:12], ('ISO Media, MP4 v2', '.mp4'))
+    if len(head) > 188 * 2 and head[0] == 0x47 and head[188] == 0x47 and head[376] == 0x47:
+        return ('MPEG transport stream data', '.ts')
+    return _sniff_text(head)
+
+
+def sniff_file(path: str) -> Tuple[str, str]:
+    """Read the head of a file on disk and sniff it"""
+    if not os.path.isfile(path):
+        return UNKNOWN
+    with open(path, 'rb') as f:
+        return sniff(f.read(HEAD_SIZE))
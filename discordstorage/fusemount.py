@@ -0,0 +1,173 @@
+"""
+Discord Storage FUSE Mount
+Read-only filesystem (Linux, needs fusepy and libfuse) showing the stored
+files, so ordinary tools (rsync, ffprobe, tar -t, a video player) can open
+them without downloading them first
+
+read(offset, size) is served from the chunk cache shared with the web and
+WebDAV servers: only the chunks a tool touches are fetched, and read-ahead
+kicks in while it reads in order. Stored files never change, so the kernel
+is told to keep their pages cached across opens and to read ahead on its
+own as well. Compressed files cannot be read at an offset and are
+downloaded in full when they are opened.
+
+Paths are resolved through the catalog's directory tree, so a lookup
+touches one directory per path component and a listing only the entries
+of that directory.
+"""
+
+import os
+import stat
+import time
+import errno
+import shutil
+import itertools
+import threading
+from typing import List
+
+try:
+    from fuse import FUSE, FuseOSError, Operations
+    FUSE_AVAILABLE = True
+except (ImportError, OSError):  # fusepy raises OSError when libfuse is missing
+    FUSE_AVAILABLE = False
+    Operations = object
+
+    class FuseOSError(OSError):
+        def __init__(self, code):
+            super().__init__(code, os.strerror(code))
+
+from .chunkcache import ChunkStream
+
+MAX_READAHEAD = 4 * 1024 * 1024  # bytes the kernel may read ahead of an application
+ATTR_TIMEOUT = 30  # seconds the kernel may cache names and attributes
+OWNER = 'fuse'  # client name for bandwidth limits and queue fairness
+
+
+class DiscordFS(Operations):
+    """fusepy operations over the catalog of a Core (whose session must be running)"""
+
+    def __init__(self, core):
+        self.core = core
+        self.catalog = core.catalog
+        self.cache = core.chunk_cache
+        self.handles = {}  # fh -> ChunkStream, or an open file for compressed records
+        self._fh = itertools.count(1)
+        self._lock = threading.Lock()
+        self._fetching = {}  # compressed record -> lock, so it is downloaded once
+
+    def _resolve(self, path):
+        found = self.catalog.resolve(path)  # reloads config.discord if another process changed it
+        if found is None:
+            raise FuseOSError(errno.ENOENT)
+        return found
+
+    # --- metadata ---------------------------------------------------------
+
+    def getattr(self, path, fh=None):
+        kind, key = self._resolve(path)
+        mtime = self.catalog.mtime or time.time()
+        attrs = {'st_uid': os.getuid(), 'st_gid': os.getgid(),
+                 'st_atime': mtime, 'st_mtime': mtime, 'st_ctime': mtime}
+        if kind == 'dir':
+            attrs.update(st_mode=stat.S_IFDIR | 0o555, st_nlink=2, st_size=0)
+            return attrs
+        size = self.catalog.get(key)[1]
+        attrs.update(st_mode=stat.S_IFREG | 0o444, st_nlink=1, st_size=size,
+                     st_blocks=(size + 511) // 512)
+        return attrs
+
+    def readdir(self, path, fh):
+        kind, key = self._resolve(path)
+        if kind != 'dir':
+            raise FuseOSError(errno.ENOTDIR)
+        subdirs, entries = self.catalog.listdir(key)
+        return ['.', '..'] + sorted(subdirs) + sorted(entries)
+
+    def statfs(self, path):
+        total = sum(record[1] for record in list(self.catalog.files.values()) if record)
+        return {'f_bsize': 4096, 'f_frsize': 4096, 'f_blocks': (total + 4095) // 4096,
+                'f_bfree': 0, 'f_bavail': 0, 'f_files': len(self.catalog), 'f_ffree': 0,
+                'f_namemax': 255}
+
+    # --- reading ------------------------------------------------------------
+
+    def open(self, path, flags):
+        if flags & (os.O_WRONLY | os.O_RDWR | os.O_APPEND | os.O_TRUNC):
+            raise FuseOSError(errno.EROFS)
+        kind, key = self._resolve(path)
+        if kind != 'file':
+            raise FuseOSError(errno.EISDIR)
+        record = self.catalog.get(key)
+        if self.cache.supports(record):
+            # one stream per open file; the kernel's own read-ahead arrives out of order
+            handle = ChunkStream(self.cache, record, OWNER, slack=2 * MAX_READAHEAD)
+        else:
+            handle = open(self._download(record), 'rb')
+        fh = next(self._fh)
+        self.handles[fh] = handle
+        return fh
+
+    def read(self, path, size, offset, fh):
+        handle = self.handles.get(fh)
+        if handle is None:
+            raise FuseOSError(errno.EBADF)
+        if not isinstance(handle, ChunkStream):
+            return os.pread(handle.fileno(), size, offset)
+        data = bytearray()
+        try:
+            # FUSE expects the full size except at the end of the file; a read can span chunks
+            while len(data) < size:
+                piece = handle.read(offset + len(data), size - len(data))
+                if not piece:
+                    break
+                data += piece
+        except Exception as e:
+            print(f"❌ FUSE: Reading {path} failed: {e}")
+            raise FuseOSError(errno.EIO)
+        return bytes(data)
+
+    def release(self, path, fh):
+        handle = self.handles.pop(fh, None)
+        if handle is not None:
+            handle.close()
+        return 0
+
+    def _download(self, record: List) -> str:
+        """Path of a complete local copy of a record, downloaded on first use"""
+        directory = os.path.join(self.core.directory, "mount_cache")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{record[4] or 'file'}-{record[1]}")
+        with self._lock:
+            lock = self._fetching.setdefault(path, threading.Lock())
+        with lock:
+            if os.path.exists(path):
+                self.core.metrics.cache_requests.inc(cache='mount', result='hit')
+                return path
+            self.core.metrics.cache_requests.inc(cache='mount', result='miss')
+            print(f"📥 FUSE: Downloading {record[0]} (compressed files are read in full)...")
+            job = self.core.submit_download(record, owner=OWNER)
+            result = job.wait()
+            if job.error or result == -1 or not os.path.exists(result):
+                print(f"❌ FUSE: Downloading {record[0]} failed: {job.error or 'transfer failed'}")
+                raise FuseOSError(errno.EIO)
+            shutil.move(result, path)
+            return path
+
+    # --- read-only ------------------------------------------------------------
+
+    def _read_only(self, *args, **kwargs):
+        raise FuseOSError(errno.EROFS)
+
+    create = mkdir = rmdir = unlink = rename = write = truncate = _read_only
+    chmod = chown = symlink = link = utimens = _read_only
+
+
+def mount(core, mountpoint: str):
+    """Mount core's catalog at mountpoint; blocks until it is unmounted"""
+    if not FUSE_AVAILABLE:
+        raise RuntimeError("FUSE is not available, install fusepy (pip install fusepy) and libfuse")
+    print(f"📂 Mounting Discord Storage read-only at {mountpoint}")
+    print(f"💡 Unmount with: fusermount -u {mountpoint}")
+    FUSE(DiscordFS(core), mountpoint, foreground=True, nothreads=False, ro=True,
+         fsname='discordstorage', kernel_cache=True, async_read=True,
+         max_readahead=MAX_READAHEAD, attr_timeout=ATTR_TIMEOUT, entry_timeout=ATTR_TIMEOUT)
@@ -0,0 +1,207 @@
+"""
+Discord Storage Jobs
+Handles for transfers running on the Core's event loop, so callers on
+other threads (web and WebDAV handlers) can start a transfer, return
+right away and poll or cancel it later (see transfers.py for the queue
+that schedules them)
+"""
+
+import time
+import uuid
+import asyncio
+import threading
+from typing import Callable, Dict, List, Optional
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class TransferJob:
+    """One upload or download, with progress, result and cancellation"""
+
+    def __init__(self, kind: str, name: str, total_bytes: int = 0, owner: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind  # 'upload' or 'download'
+        self.name = name
+        self.owner = owner  # who submitted it (client address, 'cli', ...)
+        self.state = QUEUED
+        self.bytes_done = 0
+        self.bytes_total = total_bytes
+        self.chunks_done = 0  # chunk counts, retries and ETA come from the event stream (events.JobSink)
+        self.chunks_total = 0
+        self.retries = 0
+        self.eta = None  # seconds, None until known
+        self.rate = None  # bytes/s cap of this transfer alone, see Shaper.set_job_rate
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_requested = False
+        self.on_cancel = None  # set by a queue to cancel jobs that have not started
+        self._future = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._finished = False
+        self._done = threading.Event()
+
+    @property
+    def progress(self) -> float:
+        """Completed fraction between 0 and 1"""
+        if self.state == DONE:
+            return 1.0
+        if not self.bytes_total:
+            return 0.0
+        return min(1.0, self.bytes_done / self.bytes_total)
+
+    @property
+    def speed(self) -> float:
+        """Average bytes per second since the job started"""
+        if not self.started:
+            return 0.0
+        elapsed = (self.finished or time.time()) - self.started
+        return self.bytes_done / elapsed if elapsed > 0 else 0.0
+
+    def advance(self, amount: int):
+        """Called by the transfer as bytes are confirmed"""
+        if self.state == QUEUED:
+            self.start()
+        self.bytes_done += amount
+
+    def start(self):
+        self.state = RUNNING
+        self.started = self.started or time.time()
+
+    def attach(self, future):
+        """Bind the job to the future (concurrent or asyncio) running its coroutine"""
+        self._future = future
+        future.add_done_callback(self._finish)
+
+    def __await__(self):
+        """Await the job from a coroutine, gives the same result as wait()
+
+        Cancelling the awaiting coroutine does not cancel the job.
+        """
+        loop = asyncio.get_event_loop()
+        waiter = loop.create_future()
+
+        def wake(job):
+            loop.call_soon_threadsafe(lambda: waiter.done() or waiter.set_result(None))
+        self.add_done_callback(wake)
+        yield from waiter.__await__()
+        return self.result if self.state == DONE else -1
+
+    def _finish(self, future):
+        self.finished = time.time()
+        if future.cancelled():
+            self.state = CANCELLED
+        else:
+            error = future.exception()
+            if error is not None:
+                self.state = FAILED
+                self.error = str(error) or type(error).__name__
+            elif future.result() == -1:
+                self.state = FAILED
+                self.error = 'transfer failed'
+            else:
+                self.state = DONE
+                self.result = future.result()
+        with self._lock:
+            self._finished = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"⚠️  Job callback failed for {self.name}: {e}")
+        self._done.set()
+
+    def add_done_callback(self, callback: Callable[['TransferJob'], None]):
+        """Run callback(job) once the job has finished (immediately if it already has)"""
+        with self._lock:
+            if not self._finished:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def cancel(self) -> bool:
+        """Stop the transfer; partial progress is kept for a later resume"""
+        if self.state in FINISHED_STATES:
+            return False
+        self.cancel_requested = True
+        if self.on_cancel is not None:
+            return self.on_cancel(self)
+        if self._future is None:
+            return False
+        return self._future.cancel()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None):
+        """Block until the job has finished, returns its result (-1 on failure)"""
+        self._done.wait(timeout)
+        return self.result if self.state == DONE else -1
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'name': self.name,
+            'owner': self.owner,
+            'state': self.state,
+            'bytes_done': self.bytes_done,
+            'bytes_total': self.bytes_total,
+            'progress': round(self.progress, 4),
+            'speed': round(self.speed),
+            'chunks_done': self.chunks_done,
+            'chunks_total': self.chunks_total,
+            'retries': self.retries,
+            'eta': None if self.eta is None else round(self.eta),
+            'rate': self.rate,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+
+class JobRegistry:
+    """Thread-safe registry of the jobs of one Core
+
+    Finished jobs are kept for status polling until max_finished newer
+    ones have completed.
+    """
+
+    def __init__(self, max_finished: int = 200):
+        self.max_finished = max_finished
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def add(self, job: TransferJob) -> TransferJob:
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        return job
+
+    def get(self, job_id: str) -> Optional[TransferJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[TransferJob]:
+        """All known jobs, newest first"""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.created, reverse=True)
+
+    def active(self) -> List[TransferJob]:
+        return [job for job in self.list() if job.state not in FINISHED_STATES]
+
+    def _prune(self):
+        finished = sorted((job for job in self._jobs.values() if job.state in FINISHED_STATES),
+                          key=lambda job: job.finished or 0)
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job.id]
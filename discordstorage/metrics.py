@@ -0,0 +1,239 @@
+"""
+Discord Storage Metrics
+Counters, gauges and histograms for transfers, caches and the WebDAV
+server, rendered in the Prometheus text format by the web server's
+/metrics page
+
+Every Core has its own Metrics (core.metrics). Values that already live
+elsewhere (running jobs, queue length, catalog size) are read when the
+page is rendered instead of being tracked twice.
+"""
+
+import time
+import asyncio
+import threading
+import contextlib
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import aiohttp
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds; chunk transfers take from well under a second to minutes on a bad link
+CHUNK_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            return [(self.name, _format_labels(self.labelnames, key), value)
+                    for key, value in sorted(self._values.items())]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples()]
+        return lines
+
+
+class Counter(_Metric):
+    """Value that only goes up"""
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, or is read from a callback when rendered
+
+    The callback returns the value, or {label values tuple: value} when the
+    gauge has labels.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (),
+                 callback: Optional[Callable] = None):
+        super().__init__(name, help, labels)
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        if self.callback is not None:
+            value = self.callback()
+            values = value if self.labelnames else {(): value}
+            return [(self.name, _format_labels(self.labelnames, key), value)
+                    for key, value in sorted(values.items())]
+        return super().samples()
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (),
+                 buckets: Iterable[float] = REQUEST_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe how long the with-block takes"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        result = []
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state['counts']):
+                    cumulative += count
+                    le = 'le="%s"' % _format_value(bound)
+                    result.append((self.name + "_bucket", _format_labels(self.labelnames, key, le), cumulative))
+                labels = _format_labels(self.labelnames, key)
+                result.append((self.name + "_sum", labels, state['sum']))
+                result.append((self.name + "_count", labels, state['count']))
+        return result
+
+
+def retry_cause(error: BaseException, status: Optional[int] = None) -> str:
+    """Label for why a chunk transfer is retried: http_<status> (http_429 is
+    a rate limit), timeout, connection or other"""
+    status = status or getattr(error, 'status', None)
+    if isinstance(status, int) and status != 200:
+        return f"http_{status}"
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(error, (aiohttp.ClientConnectionError, ConnectionError, OSError)):
+        return "connection"
+    return "other"
+
+
+class Metrics:
+    """Instruments of one Core"""
+
+    def __init__(self, core):
+        self.core = core
+        self.metrics = []
+        self.bytes_downloaded = self.add(Counter(
+            "ds_downloaded_bytes_total", "Bytes fetched from the CDN"))
+        self.bytes_uploaded = self.add(Counter(
+            "ds_uploaded_bytes_total", "Bytes sent to Discord as chunks"))
+        self.chunk_seconds = self.add(Histogram(
+            "ds_chunk_seconds", "Time to transfer one chunk, retries included",
+            ("direction",), CHUNK_BUCKETS))
+        self.chunk_retries = self.add(Counter(
+            "ds_chunk_retries_total", "Chunk transfer attempts that failed and were retried",
+            ("direction", "cause")))
+        self.chunks_reused = self.add(Counter(
+            "ds_chunks_reused_total", "Chunks not uploaded because an identical one is stored"))
+        self.url_refreshes = self.add(Counter(
+            "ds_url_refreshes_total", "Expired CDN links re-signed during downloads"))
+        self.transfers = self.add(Counter(
+            "ds_transfers_total", "Transfers finished, by outcome", ("kind", "state")))
+        self.cache_requests = self.add(Counter(
+            "ds_cache_requests_total", "Reads served from (hit) or fetched into (miss) a local cache",
+            ("cache", "result")))
+        self.cache_evictions = self.add(Counter(
+            "ds_cache_evictions_total", "Entries removed from a local cache to make room", ("cache",)))
+        self.webdav_seconds = self.add(Histogram(
+            "ds_webdav_request_seconds", "WebDAV request latency", ("method",)))
+        self.webdav_requests = self.add(Counter(
+            "ds_webdav_requests_total", "WebDAV requests answered", ("method", "status")))
+        self.add(Gauge("ds_transfers_in_flight", "Transfers running now", ("kind",), self._in_flight))
+        self.add(Gauge("ds_transfers_queued", "Transfers waiting for a queue worker",
+                       callback=lambda: len(core.queue.pending())))
+        self.add(Gauge("ds_queue_workers", "Transfers the queue runs at a time",
+                       callback=lambda: core.queue.workers))
+        self.add(Gauge("ds_chunk_concurrency", "Chunks allowed in flight by the adaptive limit", ("direction",),
+                       lambda: {(direction,): limit.current for direction, limit in list(core._chunk_limits.items())}))
+        self.add(Gauge("ds_circuit_open", "1 while requests to an endpoint are paused after repeated failures",
+                       ("endpoint",), lambda: {(endpoint,): int(breaker.state != breaker.CLOSED)
+                                               for endpoint, breaker in list(core.breakers.breakers.items())}))
+        self.add(Gauge("ds_catalog_files", "Files in the catalog", callback=lambda: len(core.catalog)))
+        self.add(Gauge("ds_catalog_bytes", "Total size of the files in the catalog",
+                       callback=lambda: sum(record[1] for record in list(core.catalog.files.values()) if record)))
+        self.add(Gauge("ds_discord_ready", "1 while connected to Discord",
+                       callback=lambda: int(core.isready())))
+
+    def add(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def _in_flight(self) -> Dict[Tuple, int]:
+        counts = {('upload',): 0, ('download',): 0}
+        for job in self.core.jobs.active():
+            if job.state == 'running':
+                counts[(job.kind,)] = counts.get((job.kind,), 0) + 1
+        return counts
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,234 @@
+"""
+Discord Storage Index Rebuild
+Reconstructs catalog records from the attachments in the storage channel
+
+Uploads name their attachments '<code>.hash' and '<code>.<i>'; the hash
+message also carries a small JSON manifest (name, size, codec) in its
+content. Attachments are grouped by code while the history is walked
+oldest first, and a record is emitted as soon as its chunks are complete.
+
+Chunks that were not sent again are named in the manifest: repeats of an
+earlier chunk of the same upload ('same'), chunks stored by earlier
+uploads by their message ('reused'), or, for content that was already
+stored, the hash message of the stored copy ('copy_of'). Records with
+reused chunks or copies are deferred and resolved against the rebuilt
+catalog once the whole channel has been read, since what they point to
+always comes first in the history.
+"""
+
+import os
+import re
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+
+ATTACHMENT_NAME = re.compile(r'^(\d+)\.(hash|\d+)$')
+FIXED_CHUNK_SIZE = 9000000
+MANIFEST_LIMIT = 2000  # characters Discord allows in a message's content
+
+
+def manifest(name: str, size: int, codec: Optional[str], stored_size: int,
+             reused: Optional[Dict[str, List]] = None, copy_of: Optional[List] = None,
+             same: Optional[Dict[str, int]] = None) -> str:
+    """Message content sent with the hash file, read back by a rebuild
+
+    reused maps a chunk index to [message id, size] of a chunk stored by an
+    earlier upload in the same channel, same maps it to the index of an
+    earlier chunk of this upload with the same data; copy_of is the
+    [channel id, message id] of the hash message of an upload with the
+    same content.
+    """
+    data = {'name': name, 'size': size, 'stored_size': stored_size}
+    if codec:
+        data['codec'] = codec
+    if reused:
+        data['reused'] = reused
+    if same:
+        data['same'] = same
+    if copy_of:
+        data['copy_of'] = copy_of
+    return json.dumps(data, separators=(',', ':'))
+
+
+def _parse_manifest(content: str) -> Dict:
+    try:
+        data = json.loads(content)
+        return data if isinstance(data, dict) else {}
+    except (TypeError, ValueError):
+        return {}
+
+
+class RebuildState:
+    """Attachment groups still being collected, plus the scan checkpoint
+
+    The checkpoint holds the ID of the last message processed and every
+    incomplete group, so a scan of a very large channel can resume.
+    """
+
+    def __init__(self, checkpoint_path: str):
+        self.checkpoint_path = checkpoint_path
+        self.last_message_id = None
+        self.groups = {}  # code -> {'hash': [url, message], 'manifest': {}, 'chunks': {i: [url, size, message]}}
+        self.deferred = {}  # code -> record waiting for chunks of earlier uploads (None urls, or copy_of)
+        self.scanned = 0
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                data = json.load(f)
+            self.last_message_id = data.get('last_message_id')
+            self.groups = data.get('groups', {})
+            self.deferred = data.get('deferred', {})
+            self.scanned = data.get('scanned', 0)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️  Could not read rebuild checkpoint, starting over: {e}")
+
+    def save(self):
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'last_message_id': self.last_message_id,
+                       'groups': self.groups,
+                       'deferred': self.deferred,
+                       'scanned': self.scanned}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def clear(self):
+        """Remove the checkpoint once a scan has finished"""
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def add(self, filename: str, url: str, size: int, message: List, content: str = '') -> Optional[str]:
+        """Add one attachment, returns its code if it belongs to an upload"""
+        match = ATTACHMENT_NAME.match(filename)
+        if not match:
+            return None
+        code, part = match.groups()
+        if part == 'hash':
+            # A new hash message starts a new upload; an earlier incomplete
+            # group with the same code was a failed upload whose code got reused
+            info = _parse_manifest(content)
+            # reused chunks were not sent again: their url is looked up by message at the end
+            chunks = {index: [None, size, [message[0], message_id]]
+                      for index, (message_id, size) in info.get('reused', {}).items()}
+            self.groups[code] = {'hash': [url, message], 'manifest': info, 'chunks': chunks}
+        else:
+            group = self.groups.setdefault(code, {'hash': None, 'manifest': {}, 'chunks': {}})
+            group['chunks'][part] = [url, size, message]
+        return code
+
+    def _contiguous(self, group: Dict) -> Optional[List]:
+        chunks = group['chunks']
+        if not chunks:
+            return None
+        same = group['manifest'].get('same', {})
+        ordered = [chunks.get(str(i)) for i in range(len(chunks) + len(same))]
+        for i, earlier in same.items():
+            if int(i) < len(ordered):
+                ordered[int(i)] = ordered[earlier]
+        return None if None in ordered else ordered
+
+    def is_complete(self, code: str) -> bool:
+        """True once every chunk of an upload with a manifest has been seen"""
+        group = self.groups.get(code)
+        if not group or not group['hash'] or 'stored_size' not in group['manifest']:
+            return False
+        if group['manifest'].get('copy_of'):
+            return True  # no chunks of its own
+        ordered = self._contiguous(group)
+        return ordered is not None and sum(c[1] for c in ordered) == group['manifest']['stored_size']
+
+    def pop_record(self, code: str) -> Optional[List]:
+        """Build the record for a group and forget it
+
+        md5 (record[4]) is left empty, the caller reads it from the hash file.
+        Returns None if the chunks are not contiguous.
+        """
+        group = self.groups.pop(code, None)
+        if group is None:
+            return None
+        info = group['manifest']
+        if info.get('copy_of'):
+            return [info.get('name') or f"{code}.unknown", info.get('size', 0), [], group['hash'][0], None,
+                    {'copy_of': info['copy_of'], 'hash_message': group['hash'][1]}]
+        ordered = self._contiguous(group)
+        if ordered is None:
+            return None
+        sizes = [c[1] for c in ordered]
+        fixed = all(size == FIXED_CHUNK_SIZE for size in sizes[:-1])
+        meta = {'chunking': 'fixed' if fixed else 'cdc',
+                'messages': [c[2] for c in ordered],
+                'hash_message': group['hash'][1] if group['hash'] else None}
+        if not fixed:
+            meta['chunk_sizes'] = sizes
+        if info.get('codec'):
+            meta['codec'] = info['codec']
+            meta['stored_size'] = sum(sizes)
+        name = info.get('name') or f"{code}.unknown"
+        size = info.get('size', sum(sizes))
+        hash_url = group['hash'][0] if group['hash'] else None
+        return [name, size, [c[0] for c in ordered], hash_url, None, meta]
+
+    def pending_codes(self) -> List[str]:
+        return list(self.groups.keys())
+
+    @staticmethod
+    def needs_sources(record: List) -> bool:
+        """True for a record that points at chunks of earlier uploads"""
+        return None in record[2] or 'copy_of' in record[5]
+
+    def resolve(self, records: Iterable[List]) -> Tuple[List[Tuple[str, List]], List[str]]:
+        """Fill in the deferred records from records (the rebuilt catalog)
+
+        Returns ([(code, record)] that are complete now, [codes] whose
+        sources were not found) and forgets every deferred record.
+        """
+        wanted = {}  # message id -> url, for reused chunks
+        copies = {}  # hash message id -> record, for copies
+        for record in self.deferred.values():
+            meta = record[5]
+            if 'copy_of' in meta:
+                copies[meta['copy_of'][1]] = None
+            for url, message in zip(record[2], meta.get('messages', [])):
+                if url is None and message:
+                    wanted[message[1]] = None
+        for record in records:
+            if not record or len(record) < 6:
+                continue
+            meta = record[5]
+            for url, message in zip(record[2], meta.get('messages') or []):
+                if message and message[1] in wanted:
+                    wanted[message[1]] = url
+            hash_message = meta.get('hash_message')
+            if hash_message and hash_message[1] in copies:
+                copies[hash_message[1]] = record
+
+        resolved, missing = [], []
+        pending = dict(self.deferred)
+        while pending:
+            progress = False
+            for code, record in list(pending.items()):
+                meta = record[5]
+                if 'copy_of' in meta:
+                    source = copies.get(meta['copy_of'][1])
+                    if source is None or None in source[2]:
+                        continue  # not found, or a copy of a record resolved later in this loop
+                    meta = dict(source[5], hash_message=meta['hash_message'])
+                    record = [record[0], record[1], list(source[2]), record[3], record[4], meta]
+                else:
+                    urls = [url if url is not None else wanted.get(message[1])
+                            for url, message in zip(record[2], meta['messages'])]
+                    if None in urls:
+                        continue
+                    record = record[:2] + [urls] + record[3:]
+                resolved.append((code, record))
+                if meta.get('hash_message'):
+                    copies[meta['hash_message'][1]] = copies.get(meta['hash_message'][1]) or record
+                del pending[code]
+                progress = True
+            if not progress:
+                break
+        missing.extend(pending)
+        self.deferred = {}
+        return resolved, missing
@@ -0,0 +1,148 @@
+"""
+Discord Storage URL Refresh
+Re-signs expired Discord CDN attachment URLs in bulk and caches the
+refreshed links together with their expiry time
+"""
+
+import os
+import json
+import time
+import asyncio
+import urllib.parse
+from typing import Dict, List, Optional
+
+import aiohttp
+
+API_BASE = "https://discord.com/api/v10"
+REFRESH_BATCH = 50  # attachment URLs per refresh-urls request
+DEFAULT_MARGIN = 3600  # refresh links that expire within the next hour
+
+
+def url_expiry(url: str) -> Optional[int]:
+    """Unix time a signed CDN URL expires at (the hex 'ex' parameter)"""
+    try:
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)
+        return int(query['ex'][0], 16)
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+def url_key(url: str) -> str:
+    """Stable part of an attachment URL (everything but the signature)"""
+    parts = urllib.parse.urlsplit(url)
+    return parts.netloc + parts.path
+
+
+class UrlRefresher:
+    """Refreshes attachment URLs through the Discord REST API
+
+    Uses the bulk attachments/refresh-urls endpoint and falls back to
+    fetching the original message when its channel/message IDs are known.
+    Only needs the bot token, not a gateway connection.
+    """
+
+    def __init__(self, token: str, cache_path: str):
+        self.token = token
+        self.cache_path = cache_path
+        self.api_base = API_BASE  # REST API root, pointed elsewhere by benchmarks/fakediscord.py
+        self.cache = {}  # url_key -> [url, expiry]
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.cache_path, 'r') as f:
+                self.cache = json.load(f)
+        except FileNotFoundError:
+            self.cache = {}
+        except Exception as e:
+            print(f"⚠️  Could not read URL cache, starting empty: {e}")
+            self.cache = {}
+
+    def save(self):
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.cache, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def cached(self, url: str) -> str:
+        """Best known URL for an attachment (cached refresh or the original)"""
+        entry = self.cache.get(url_key(url))
+        if entry is None:
+            return url
+        cached_expiry = entry[1] or 0
+        if cached_expiry > (url_expiry(url) or 0):
+            return entry[0]
+        return url
+
+    def needs_refresh(self, url: str, margin: int = DEFAULT_MARGIN) -> bool:
+        """True if the URL has expired or will within margin seconds"""
+        expiry = url_expiry(url)
+        return expiry is not None and expiry < time.time() + margin
+
+    def _remember(self, original: str, fresh: str):
+        self.cache[url_key(original)] = [fresh, url_expiry(fresh)]
+
+    async def _api(self, http: aiohttp.ClientSession, method: str, path: str, **kwargs):
+        headers = {'Authorization': f'Bot {self.token}',
+                   'User-Agent': 'DiscordStorageBot (http://github.com/nigel/discordstorage)'}
+        while True:
+            async with http.request(method, self.api_base + path, headers=headers, **kwargs) as r:
+                if r.status == 429:
+                    retry_after = (await r.json()).get('retry_after', 1)
+                    await asyncio.sleep(float(retry_after))
+                    continue
+                if r.status != 200:
+                    raise Exception(f"HTTP {r.status} from {path}")
+                return await r.json()
+
+    async def refresh(self, urls: List[str], messages: Optional[List] = None) -> Dict[str, str]:
+        """Re-sign urls in bulk, returns {original: refreshed}
+
+        messages (optional) holds [channel_id, message_id] per URL and is
+        used for URLs the bulk endpoint could not refresh.
+        """
+        if not self.token:
+            raise Exception("A bot token is needed to refresh attachment URLs")
+        refreshed = {}
+        async with aiohttp.ClientSession() as http:
+            for start in range(0, len(urls), REFRESH_BATCH):
+                batch = urls[start:start + REFRESH_BATCH]
+                try:
+                    data = await self._api(http, 'POST', '/attachments/refresh-urls',
+                                           json={'attachment_urls': batch})
+                    for item in data.get('refreshed_urls', []):
+                        if item.get('refreshed'):
+                            refreshed[item['original']] = item['refreshed']
+                except Exception as e:
+                    print(f"⚠️  Bulk URL refresh failed: {str(e)}")
+
+            # Fall back to the message itself for anything still missing
+            for i, url in enumerate(urls):
+                if url in refreshed or not messages or i >= len(messages) or not messages[i]:
+                    continue
+                channel_id, message_id = messages[i]
+                try:
+                    message = await self._api(http, 'GET', f'/channels/{channel_id}/messages/{message_id}')
+                    if message.get('attachments'):
+                        refreshed[url] = message['attachments'][0]['url']
+                except Exception as e:
+                    print(f"⚠️  Could not refresh URL from message {message_id}: {str(e)}")
+
+        for original, fresh in refreshed.items():
+            self._remember(original, fresh)
+        if refreshed:
+            self.save()
+        return refreshed
+
+    async def fresh_urls(self, urls: List[str], messages: Optional[List] = None,
+                         margin: int = DEFAULT_MARGIN) -> List[str]:
+        """Return usable URLs, refreshing the ones about to expire"""
+        current = [self.cached(url) for url in urls]
+        stale = [i for i, url in enumerate(current) if self.needs_refresh(url, margin)]
+        if stale:
+            print(f"🔗 Refreshing {len(stale)} attachment URL(s) before they expire...")
+            refreshed = await self.refresh([current[i] for i in stale],
+                                           [messages[i] if messages and i < len(messages) else None for i in stale])
+            for i in stale:
+                current[i] = refreshed.get(current[i], current[i])
+        return current
@@ -14,6 +14,7 @@ import shutil
 import socket
 import struct
 import logging
+from html import escape as html_escape
 from datetime import datetime
 from typing import Dict, List, Optional
 
@@ -42,6 +43,12 @@ import urllib.parse
 
 # Discord Storage imports
 from .core import Core
+from .catalog import split_path
+from .chunkcache import parse_byte_range
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .throttle import format_rate, parse_rate
+
+STREAM_PIECE = 256 * 1024  # bytes per write when a response is streamed from chunks
 
 
 class DiscordWebFileServer:
@@ -52,6 +59,7 @@ class DiscordWebFileServer:
         self.config_path = config_path
         self.files_cache = {}
         self.download_cache = {}
+        self.download_jobs = {}  # file code -> TransferJob filling the cache
         self.cache_dir = os.path.join(os.getcwd(), "web_cache")
         os.makedirs(self.cache_dir, exist_ok=True)
         
@@ -59,23 +67,23 @@ class DiscordWebFileServer:
         self.reload_file_list()
     
     def reload_file_list(self):
-        """Reload file list from config.discord"""
+        """Reload file list from config.discord (if another writer changed it)"""
         try:
-            with open(self.config_path, 'r') as f:
-                first_line = f.readline().strip()
-                second_line = f.readline().strip()
-                if second_line:
-                    self.files_cache = json.loads(second_line)
-                else:
-                    self.files_cache = {}
+            self.core.catalog.reload_if_changed()
+            self.files_cache = self.core.catalog.files
         except Exception as e:
             print(f"❌ Error loading file list: {e}")
             self.files_cache = {}
     
     @cherrypy.expose
-    def index(self, uploaded=None):
-        """Main page showing file list"""
+    def index(self, uploaded=None, dir='/'):
+        """Main page showing the files and folders of one directory"""
         self.reload_file_list()
+        found = self.core.catalog.resolve(dir)
+        if found is None or found[0] != 'dir':
+            raise cherrypy.HTTPError(404, "Directory not found")
+        dir_path = self.core.catalog.dir_path(found[1])
+        subdirs, entries = self.core.catalog.listdir(found[1])
         
         html = f"""
         <!DOCTYPE html>
@@ -112,15 +120,40 @@ class DiscordWebFileServer:
         if uploaded:
             html += f"""
             <div style="background: #3ba55c; padding: 15px; border-radius: 8px; margin-bottom: 20px; color: white;">
-                <strong>✅ Upload Successful!</strong> File "{uploaded}" has been uploaded to Discord Storage.
+                <strong>✅ Upload Successful!</strong> File "{html_escape(uploaded)}" has been uploaded to Discord Storage.
             </div>
             """
         
-        html += """
+        active_jobs = self.core.jobs.active()
+        if active_jobs:
+            html += """
+            <h2>⏳ Transfers in Progress</h2>
+            """
+            for job in active_jobs:
+                html += self.render_job(job)
+        
+        # Breadcrumbs: every directory above this one
+        crumbs = '<a href="/" style="color: #5865F2;">🏠</a>'
+        walked = ''
+        for part in dir_path.strip('/').split('/') if dir_path != '/' else []:
+            walked += '/' + part
+            crumbs += f' / <a href="/?dir={urllib.parse.quote(walked)}" style="color: #5865F2;">{html_escape(part)}</a>'
+        html += f"""
             <h2>📁 Stored Files</h2>
+            <p>{crumbs}</p>
         """
         
-        if not self.files_cache:
+        for name, _ in sorted(subdirs.items()):
+            html += f"""
+            <div class="file-item">
+                <div class="file-info">
+                    <div class="file-name">📁 {html_escape(name)}</div>
+                </div>
+                <a href="/?dir={urllib.parse.quote(dir_path.rstrip('/') + '/' + name)}" class="download-btn">📂 Open</a>
+            </div>
+            """
+        
+        if not subdirs and not entries:
             html += """
             <div class="file-item">
                 <div class="file-info">
@@ -130,9 +163,10 @@ class DiscordWebFileServer:
             </div>
             """
         else:
-            for file_code, file_info in self.files_cache.items():
+            for filename, file_code in sorted(entries.items()):
+                file_info = self.files_cache.get(file_code)
                 if file_info and len(file_info) >= 2:
-                    filename = file_info[0]
+                    filename = html_escape(filename)
                     file_size = self.format_file_size(file_info[1])
                     hash_info = ""
                     if len(file_info) >= 5:
@@ -148,10 +182,11 @@ class DiscordWebFileServer:
                     </div>
                     """
         
-        html += """
+        html += f"""
             <div class="upload-form">
                 <h3>📤 Upload New File</h3>
                 <form action="/upload" method="post" enctype="multipart/form-data">
+                    <input type="hidden" name="dir" value="{html_escape(dir_path)}">
                     <input type="file" name="file" class="upload-input" required>
                     <br>
                     <button type="submit" class="upload-btn">🚀 Upload to Discord</button>
@@ -160,7 +195,7 @@ class DiscordWebFileServer:
             
             <div style="margin-top: 40px; text-align: center; color: #72767d;">
                 <p>Discord Storage Web Interface | Powered by Discord Storage</p>
-                <p><a href="/refresh" style="color: #5865F2;">🔄 Refresh File List</a></p>
+                <p><a href="/refresh" style="color: #5865F2;">🔄 Refresh File List</a> | <a href="/jobs" style="color: #5865F2;">📋 Transfers</a></p>
             </div>
         </body>
         </html>
@@ -185,26 +220,31 @@ class DiscordWebFileServer:
           # Check if file is cached
         cache_path = os.path.join(self.cache_dir, f"{file_code}.dat")
         
+        if not os.path.exists(cache_path) and self.core.chunk_cache.supports(file_info):
+            # Stream from chunks: playback starts right away and seeks fetch only what they need
+            return self.stream(file_info, filename)
+        
         if not os.path.exists(cache_path):
-            # Download file to cache
-            print(f"📥 Downloading {filename} to web cache...")
-            try:
-                result = self.core.download(file_info)
-                if result == -1:
-                    raise cherrypy.HTTPError(500, "Failed to download file from Discord")
+            # Compressed files cannot be read at an offset; fetch into the cache in the background and let the browser poll the job;
+            # a second request for the same file follows the job already running
+            job = self.download_jobs.get(file_code)
+            if job is None or job.done():
+                self.core.metrics.cache_requests.inc(cache='web', result='miss')
+                print(f"📥 Downloading {filename} to web cache...")
+                job = self.core.submit_download(file_info, owner=cherrypy.request.remote.ip)
+                self.download_jobs[file_code] = job
                 
-                # Move downloaded file to cache
-                downloads_path = os.path.join(self.core.directory, "downloads", filename)
-                if os.path.exists(downloads_path):
-                    shutil.move(downloads_path, cache_path)
-                else:
-                    raise cherrypy.HTTPError(500, "Downloaded file not found")
-                    
-            except Exception as e:
-                print(f"❌ Error downloading file: {e}")
-                raise cherrypy.HTTPError(500, f"Download error: {str(e)}")
+                def move_to_cache(job):
+                    self.download_jobs.pop(file_code, None)
+                    if job.state == 'done' and os.path.exists(job.result):
+                        shutil.move(job.result, cache_path)
+                    elif job.error:
+                        print(f"❌ Error downloading file: {job.error}")
+                job.add_done_callback(move_to_cache)
+            raise cherrypy.HTTPRedirect(f"/jobs/{job.id}")
         
         # Serve the cached file
+        self.core.metrics.cache_requests.inc(cache='web', result='hit')
         cherrypy.response.headers['Content-Type'] = 'application/octet-stream'
         cherrypy.response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
         
@@ -212,15 +252,66 @@ class DiscordWebFileServer:
         with open(cache_path, 'rb') as f:
             return f.read()
     
+    def stream(self, record: List, filename: str):
+        """Response body for a download streamed through the chunk cache,
+        honouring a Range header"""
+        size = record[1]
+        try:
+            byte_range = parse_byte_range(cherrypy.request.headers.get('Range'), size)
+        except ValueError:
+            cherrypy.response.headers['Content-Range'] = f'bytes */{size}'
+            raise cherrypy.HTTPError(416, "Range not satisfiable")
+        first, last = byte_range or (0, size - 1)
+        stream = self.core.chunk_cache.stream(record, cherrypy.request.remote.ip)
+        if byte_range:
+            cherrypy.response.status = 206
+            cherrypy.response.headers['Content-Range'] = f'bytes {first}-{last}/{size}'
+        cherrypy.response.headers['Content-Type'] = 'application/octet-stream'
+        cherrypy.response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        cherrypy.response.headers['Content-Length'] = str(last - first + 1)
+        cherrypy.response.headers['Accept-Ranges'] = 'bytes'
+        cherrypy.response.stream = True
+        
+        def body():
+            position = first
+            finished = False
+            try:
+                while position <= last:
+                    data = stream.read(position, min(STREAM_PIECE, last + 1 - position))
+                    if not data:
+                        break
+                    position += len(data)
+                    yield data
+                finished = True
+            finally:
+                if not finished:
+                    stream.close()  # the client went away (or a chunk failed), stop reading ahead
+        return body()
+    
+    @cherrypy.expose
+    def metrics(self):
+        """Prometheus metrics of this server"""
+        cherrypy.response.headers['Content-Type'] = METRICS_CONTENT_TYPE
+        return self.core.metrics.render()
+    
     @cherrypy.expose
-    def upload(self, file):
-        """Upload a file"""
+    def upload(self, file, dir='/'):
+        """Upload a file (into directory dir)"""
         if not file.filename:
             raise cherrypy.HTTPError(400, "No file selected")
+        # browsers may send a full client path; only its last part is the name
+        name = os.path.basename(file.filename.replace('\\', '/'))
+        if name in ('', '.', '..'):
+            raise cherrypy.HTTPError(400, "Invalid file name")
+        found = self.core.catalog.resolve(dir)
+        if found is None or found[0] != 'dir':
+            raise cherrypy.HTTPError(409, "Directory not found")
+        stored_name = '/'.join(split_path(self.core.catalog.dir_path(found[1])) + [name])
         
-        # Save uploaded file to temporary location
-        temp_dir = tempfile.mkdtemp()
-        temp_path = os.path.join(temp_dir, file.filename)
+        # Save uploaded file to the spool, where a queued upload survives a restart
+        temp_dir = self.core.queue.spool_dir()
+        os.makedirs(temp_dir)
+        temp_path = os.path.join(temp_dir, name)
         
         try:
             with open(temp_path, 'wb') as f:
@@ -230,61 +321,150 @@ class DiscordWebFileServer:
                         break
                     f.write(data)
             
-            # Generate file code
-            file_code = str(abs(hash(file.filename + str(time.time()))) % 10000)
-            
             print(f"📤 Uploading {file.filename} to Discord...")
             
-            # Upload to Discord
-            result = self.core.upload(temp_path, file_code)
-            
-            if result != -1:
-                # Update config file
-                self.update_config_with_new_file(file_code, result)
-                print(f"✅ File uploaded successfully with code: {file_code}")
-                
-                # Clean up temp directory first
-                try:
-                    shutil.rmtree(temp_dir)
-                except:
-                    pass
-                
-                # Redirect to main page with success message
-                raise cherrypy.HTTPRedirect("/?uploaded=" + file.filename)
-            else:
-                raise cherrypy.HTTPError(500, "Failed to upload file to Discord")
+            # The transfer is queued as a job; this request returns right away
+            job = self.submit_upload(temp_path, stored_name, temp_dir, cherrypy.request.remote.ip)
+            raise cherrypy.HTTPRedirect(f"/jobs/{job.id}")
                 
         except cherrypy.HTTPRedirect:
             # Re-raise HTTP redirects (this is the expected behavior)
             raise
         except Exception as e:
             print(f"❌ Upload error: {e}")
+            shutil.rmtree(temp_dir, ignore_errors=True)
             raise cherrypy.HTTPError(500, f"Upload error: {str(e)}")
-        finally:
-            # Clean up temp directory
+    
+    def submit_upload(self, temp_path: str, filename: str, temp_dir: str, owner: Optional[str] = None):
+        """Queue the upload of a spooled file; the queue adds the catalog entry
+        and removes the spool directory when the job finishes"""
+        job = self.core.submit_upload(temp_path, name=filename, owner=owner, cleanup=temp_dir)
+        
+        def finished(job):
+            if job.state == 'done':
+                self.reload_file_list()
+                print(f"✅ File uploaded successfully: {filename}")
+            else:
+                print(f"❌ Upload of {filename} {job.state}: {job.error or ''}")
+        job.add_done_callback(finished)
+        return job
+    
+    @cherrypy.expose
+    def jobs(self, job_id=None, format=None):
+        """Transfer status: /jobs lists all jobs, /jobs/<id> shows one (format=json for polling)"""
+        if job_id is None:
+            jobs = self.core.jobs.list()
+            if format == 'json':
+                cherrypy.response.headers['Content-Type'] = 'application/json'
+                return json.dumps([job.to_dict() for job in jobs]).encode()
+            body = ''.join(self.render_job(job) for job in jobs) or '<div class="file-item">No transfers yet</div>'
+            return self.render_page("📋 Transfers", body, refresh=any(not job.done() for job in jobs))
+        
+        job = self.core.jobs.get(job_id)
+        if job is None:
+            raise cherrypy.HTTPError(404, "Job not found")
+        if format == 'json':
+            cherrypy.response.headers['Content-Type'] = 'application/json'
+            return json.dumps(job.to_dict()).encode()
+        body = self.render_job(job)
+        if job.state == 'done' and job.kind == 'download':
+            code = next((c for c, info in self.files_cache.items() if info and info[0] == job.name), None)
+            if code:
+                body += f'<p><a href="/download/{code}" class="download-btn">⬇️ Save {html_escape(job.name)}</a></p>'
+        return self.render_page(f"{job.kind.title()}: {job.name}", body, refresh=not job.done())
+    
+    @cherrypy.expose
+    def cancel(self, job_id):
+        """Cancel a running transfer"""
+        if cherrypy.request.method != 'POST':
+            raise cherrypy.HTTPError(405, "Use POST to cancel a transfer")
+        job = self.core.jobs.get(job_id)
+        if job is None:
+            raise cherrypy.HTTPError(404, "Job not found")
+        job.cancel()
+        raise cherrypy.HTTPRedirect(f"/jobs/{job_id}")
+    
+    @cherrypy.expose
+    def limits(self, job_id=None, rate=None, **changes):
+        """Bandwidth limits as JSON; POST download=, upload=, client_download=,
+        client_upload=, schedule_download=, schedule_upload= to change them, or
+        job_id= and rate= to cap one transfer"""
+        if cherrypy.request.method == 'POST':
             try:
-                shutil.rmtree(temp_dir)
-            except:
-                pass
+                if job_id is not None:
+                    job = self.core.jobs.get(job_id)
+                    if job is None:
+                        raise cherrypy.HTTPError(404, "Job not found")
+                    self.core.bandwidth.set_job_rate(job, parse_rate(rate) if rate else None)
+                self.core.bandwidth.configure(**changes)
+            except ValueError as e:
+                raise cherrypy.HTTPError(400, str(e))
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        return json.dumps(self.core.bandwidth.to_dict()).encode()
+    
+    def render_job(self, job) -> str:
+        """HTML block with the state and progress of one job"""
+        icon = {'upload': '📤', 'download': '📥'}.get(job.kind, '📦')
+        details = f"{job.state} | {job.progress * 100:.1f}% of {self.format_file_size(job.bytes_total)}"
+        if job.state == 'running':
+            details += f" | {self.format_file_size(job.speed)}/s"
+            if job.chunks_total:
+                details += f" | chunk {job.chunks_done}/{job.chunks_total}"
+            if job.eta is not None:
+                details += f" | ETA {self.core.calculate_eta(job.eta, 1)}"
+            if job.retries:
+                details += f" | {job.retries} retries"
+            if job.rate:
+                details += f" | capped at {format_rate(job.rate)}/s"
+        if job.error:
+            details += f" | {job.error}"
+        details = html_escape(details)  # errors quote file names
+        action = ''
+        if not job.done():
+            action = f'<form action="/cancel/{job.id}" method="post"><button type="submit" class="download-btn">✖ Cancel</button></form>'
+        return f"""
+            <div class="file-item">
+                <div class="file-info">
+                    <div class="file-name">{icon} <a href="/jobs/{job.id}" style="color: #fff;">{html_escape(job.name)}</a></div>
+                    <div class="file-details">{details}</div>
+                </div>
+                {action}
+            </div>
+            """
+    
+    def render_page(self, title: str, body: str, refresh: bool = False) -> str:
+        """Minimal page in the style of the index, auto-refreshing while jobs run
+        (title is plain text, body is HTML)"""
+        title = html_escape(title)
+        meta = '<meta http-equiv="refresh" content="2">' if refresh else ''
+        return f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>{title} - Discord Storage</title>
+            {meta}
+            <style>
+                body {{ font-family: Arial, sans-serif; margin: 40px; background: #1a1a1a; color: #fff; }}
+                .file-item {{ background: #2f3136; padding: 15px; margin: 10px 0; border-radius: 8px; display: flex; justify-content: space-between; align-items: center; }}
+                .file-info {{ flex-grow: 1; }}
+                .file-name {{ font-size: 16px; font-weight: bold; margin-bottom: 5px; }}
+                .file-details {{ font-size: 12px; color: #b9bbbe; }}
+                .download-btn {{ background: #5865F2; color: white; padding: 8px 16px; text-decoration: none; border-radius: 5px; border: none; cursor: pointer; }}
+            </style>
+        </head>
+        <body>
+            <h1>{title}</h1>
+            {body}
+            <p><a href="/" style="color: #5865F2;">⬅️ Back to files</a> | <a href="/jobs" style="color: #5865F2;">📋 All transfers</a></p>
+        </body>
+        </html>
+        """
     
     def update_config_with_new_file(self, file_code: str, file_info: List):
         """Update config.discord with new file"""
         try:
-            with open(self.config_path, 'r') as f:
-                first_line = f.readline().strip()
-                second_line = f.readline().strip()
-            
-            if second_line:
-                files = json.loads(second_line)
-            else:
-                files = {}
-            
-            files[file_code] = file_info
-            
-            with open(self.config_path, 'w') as f:
-                f.write(first_line + '\n')
-                f.write(json.dumps(files))
-            
+            # the catalog writes atomically and merges with other writers
+            self.core.catalog.add(file_code, file_info)
             self.reload_file_list()
         except Exception as e:
             print(f"❌ Error updating config: {e}")
@@ -396,70 +576,107 @@ class DiscordSMBFileSystem:
         self.reload_file_list()
     
     def reload_file_list(self):
-        """Reload file list from config.discord"""
+        """Reload file list from config.discord (if another writer changed it)"""
         try:
-            with open(self.config_path, 'r') as f:
-                first_line = f.readline().strip()
-                second_line = f.readline().strip()
-                if second_line:
-                    self.files_cache = json.loads(second_line)
-                else:
-                    self.files_cache = {}
+            self.core.catalog.reload_if_changed()
+            self.files_cache = self.core.catalog.files
         except Exception as e:
             print(f"❌ Error loading file list: {e}")
             self.files_cache = {}
     
-    def list_files(self) -> List[Dict]:
-        """List all files available in Discord Storage"""
-        self.reload_file_list()
+    def list_files(self, path: str = '/') -> List[Dict]:
+        """List one directory (its files and subdirectories, not their contents)"""
+        catalog = self.core.catalog
+        found = catalog.resolve(path)
+        if found is None or found[0] != 'dir':
+            return []
+        subdirs, entries = catalog.listdir(found[1])
+        base = catalog.dir_path(found[1]).rstrip('/')
         files = []
         
-        for file_code, file_info in self.files_cache.items():
-            if file_info and len(file_info) >= 2:
-                filename = file_info[0]
-                file_size = file_info[1]
-                
-                files.append({
-                    'name': filename,
-                    'code': file_code,
-                    'size': file_size,
-                    'is_directory': False,
-                    'modified_time': datetime.now(),
-                    'created_time': datetime.now()
-                })
+        for name in sorted(subdirs):
+            files.append({
+                'name': name,
+                'path': f"{base}/{name}",
+                'code': None,
+                'size': 0,
+                'is_directory': True,
+                'modified_time': datetime.now(),
+                'created_time': datetime.now()
+            })
+        for name, file_code in sorted(entries.items()):
+            file_info = catalog.get(file_code)
+            files.append({
+                'name': name,
+                'path': f"{base}/{name}",
+                'code': file_code,
+                'size': file_info[1],
+                'is_directory': False,
+                'modified_time': datetime.now(),
+                'created_time': datetime.now()
+            })
         
         return files
     
     def get_file_info(self, filename: str) -> Optional[Dict]:
-        """Get file information by filename"""
-        for file_code, file_info in self.files_cache.items():
-            if file_info and len(file_info) >= 2 and file_info[0] == filename:
-                return {
-                    'name': filename,
-                    'code': file_code,
-                    'size': file_info[1],
-                    'is_directory': False,
-                    'modified_time': datetime.now(),
-                    'created_time': datetime.now(),
-                    'file_info': file_info
-                }
-        return None
+        """Get file information by path (None for directories and unknown paths)"""
+        found = self.core.catalog.resolve(filename)
+        if found is None or found[0] != 'file':
+            return None
+        file_info = self.core.catalog.get(found[1])
+        return {
+            'name': filename,
+            'code': found[1],
+            'size': file_info[1],
+            'is_directory': False,
+            'modified_time': datetime.now(),
+            'created_time': datetime.now(),
+            'file_info': file_info
+        }
+    
+    def is_directory(self, path: str) -> bool:
+        found = self.core.catalog.resolve(path)
+        return found is not None and found[0] == 'dir'
+    
+    def make_directory(self, path: str):
+        """Create a directory; FileExistsError if the name is taken,
+        FileNotFoundError if the parent does not exist"""
+        self.core.catalog.mkdir(path)
+        print(f"📁 Created directory {path}")
+    
+    def remove_directory(self, path: str):
+        """Remove an empty directory; OSError if it is not empty"""
+        self.core.catalog.rmdir(path)
+        print(f"🗑️  Removed directory {path}")
     
-    def download_file_to_cache(self, file_info: List, filename: str) -> str:
-        """Download file from Discord to local cache and return path"""
+    def can_stream(self, filename: str, file_info: List) -> bool:
+        """True if reads of the file are served from the chunk cache rather
+        than a whole copy in smb_cache (which is used when it is already there)"""
+        if os.path.exists(os.path.join(self.cache_dir, filename)):
+            return False
+        return self.core.chunk_cache.supports(file_info)
+    
+    def download_file_to_cache(self, file_info: List, filename: str, owner: str = 'webdav') -> str:
+        """Download file from Discord to local cache and return path (owner = the
+        client asking, for queue fairness and per-client bandwidth limits)"""
         cache_path = os.path.join(self.cache_dir, filename)
         
-        if not os.path.exists(cache_path):
+        if os.path.exists(cache_path):
+            self.core.metrics.cache_requests.inc(cache='webdav', result='hit')
+        else:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            self.core.metrics.cache_requests.inc(cache='webdav', result='miss')
             print(f"📥 Downloading {filename} to SMB cache...")
             try:
-                result = self.core.download(file_info)
+                # GET has to answer with the data, so this request waits for its job
+                job = self.core.submit_download(file_info, owner=owner)
+                result = job.wait()
                 if result == -1:
-                    raise Exception("Failed to download file from Discord")
+                    raise Exception(f"Failed to download file from Discord: {job.error}")
                 
                 # Move downloaded file to cache
-                downloads_path = os.path.join(self.core.directory, "downloads", filename)
-                if os.path.exists(downloads_path):
-                    shutil.move(downloads_path, cache_path)
+                if os.path.exists(result):
+                    shutil.move(result, cache_path)
                 else:
                     raise Exception("Downloaded file not found")
                     
@@ -470,47 +687,36 @@ class DiscordSMBFileSystem:
         return cache_path
     
     def upload_file_from_cache(self, local_path: str, filename: str) -> bool:
-        """Upload file from local cache to Discord Storage"""
+        """Upload file from local cache to Discord Storage and wait for it"""
         try:
-            # Generate file code
-            file_code = str(abs(hash(filename + str(time.time()))) % 10000)
-            
-            print(f"📤 Uploading {filename} to Discord...")
-            
-            # Upload to Discord
-            result = self.core.upload(local_path, file_code)
-            
-            if result != -1:
-                # Update config file
-                self.update_config_with_new_file(file_code, result)
-                print(f"✅ File uploaded successfully with code: {file_code}")
-                return True
-            else:
-                print(f"❌ Failed to upload {filename}")
-                return False
-                
+            return self.submit_file_from_cache(local_path, filename).wait() != -1
         except Exception as e:
             print(f"❌ Upload error: {e}")
             return False
     
+    def submit_file_from_cache(self, local_path: str, filename: str, temp_dir: Optional[str] = None, owner: str = 'webdav'):
+        """Queue the upload of a local file and return its job right away
+
+        The queue adds the catalog entry when the job finishes; temp_dir, if
+        given, is removed afterwards.
+        """
+        print(f"📤 Uploading {filename} to Discord...")
+        job = self.core.submit_upload(local_path, name=filename, owner=owner, cleanup=temp_dir)
+        
+        def finished(job):
+            if job.state == 'done':
+                self.reload_file_list()
+                print(f"✅ File uploaded successfully: {filename}")
+            else:
+                print(f"❌ Failed to upload {filename}: {job.error or job.state}")
+        job.add_done_callback(finished)
+        return job
+    
     def update_config_with_new_file(self, file_code: str, file_info: List):
         """Update config.discord with new file"""
         try:
-            with open(self.config_path, 'r') as f:
-                first_line = f.readline().strip()
-                second_line = f.readline().strip()
-            
-            if second_line:
-                files = json.loads(second_line)
-            else:
-                files = {}
-            
-            files[file_code] = file_info
-            
-            with open(self.config_path, 'w') as f:
-                f.write(first_line + '\n')
-                f.write(json.dumps(files))
-            
+            # the catalog writes atomically and merges with other writers
+            self.core.catalog.add(file_code, file_info)
             self.reload_file_list()
         except Exception as e:
             print(f"❌ Error updating config: {e}")
@@ -518,50 +724,20 @@ class DiscordSMBFileSystem:
     def delete_file(self, filename: str) -> bool:
         """Delete a file from Discord Storage"""
         try:
-            # Find the file in our cache
-            file_code = None
-            for code, info in self.files_cache.items():
-                if info[0] == filename:  # info[0] is the filename
-                    file_code = code
-                    break
-            
-            if not file_code:
-                print(f"❌ File not found in cache: {filename}")
+            file_info = self.get_file_info(filename)
+            if not file_info:
+                print(f"❌ File not found in catalog: {filename}")
                 return False
             
             print(f"🗑️  Deleting {filename} from Discord Storage...")
             
-            # Remove from config file
-            try:
-                with open(self.config_path, 'r') as f:
-                    first_line = f.readline().strip()
-                    second_line = f.readline().strip()
-                
-                if second_line:
-                    files = json.loads(second_line)
-                    if file_code in files:
-                        del files[file_code]
-                        
-                        # Write updated config
-                        with open(self.config_path, 'w') as f:
-                            f.write(first_line + '\n')
-                            f.write(json.dumps(files))
-                        
-                        # Reload cache
-                        self.reload_file_list()
-                        
-                        print(f"✅ File {filename} deleted from Discord Storage")
-                        return True
-                    else:
-                        print(f"❌ File code {file_code} not found in config")
-                        return False
-                else:
-                    print(f"❌ No files in config")
-                    return False
-                    
-            except Exception as e:
-                print(f"❌ Error updating config during delete: {e}")
+            # the catalog writes atomically and merges with other writers
+            if not self.core.catalog.remove(file_info['code']):
+                print(f"❌ File code {file_info['code']} not found in config")
                 return False
+            self.reload_file_list()
+            print(f"✅ File {filename} deleted from Discord Storage")
+            return True
                 
         except Exception as e:
             print(f"❌ Delete error: {e}")
@@ -661,8 +837,23 @@ class DiscordSMBServer:
             from datetime import datetime
             
             filesystem = self.filesystem  # Store reference for the handler
+            metrics = filesystem.core.metrics
             
             class WebDAVHandler(BaseHTTPRequestHandler):
+                def handle_one_request(self):
+                    """Handle a request, recording its latency and status for /metrics"""
+                    started = time.monotonic()
+                    self.command = None
+                    self.status_code = None
+                    super().handle_one_request()
+                    if self.command and self.status_code:
+                        metrics.webdav_seconds.observe(time.monotonic() - started, method=self.command)
+                        metrics.webdav_requests.inc(method=self.command, status=self.status_code)
+                
+                def send_response(self, code, message=None):
+                    self.status_code = code
+                    super().send_response(code, message)
+                
                 def do_OPTIONS(self):
                     """Handle OPTIONS request - required for WebDAV"""
                     self.send_response(200)
@@ -682,53 +873,22 @@ class DiscordSMBServer:
                         multistatus = ET.Element('multistatus')
                         multistatus.set('xmlns', 'DAV:')
                         
-                        if path == '/' or path == '':
-                            # Root directory
-                            response = ET.SubElement(multistatus, 'response')
-                            href = ET.SubElement(response, 'href')
-                            href.text = '/'
-                            
-                            propstat = ET.SubElement(response, 'propstat')
-                            prop = ET.SubElement(propstat, 'prop')
-                            
-                            # Directory properties
-                            resourcetype = ET.SubElement(prop, 'resourcetype')
-                            ET.SubElement(resourcetype, 'collection')
-                            
-                            displayname = ET.SubElement(prop, 'displayname')
-                            displayname.text = 'DiscordStorage'
-                            
-                            getlastmodified = ET.SubElement(prop, 'getlastmodified')
-                            getlastmodified.text = datetime.now().strftime('%a, %d %b %Y %H:%M:%S GMT')
-                            
-                            status = ET.SubElement(propstat, 'status')
-                            status.text = 'HTTP/1.1 200 OK'
-                            
-                            # Add files if depth allows
+                        if filesystem.is_directory(path):
+                            # The directory itself, then (Depth 1) only its own children
+                            self.add_propfind_response(multistatus, path.rstrip('/') + '/', 
+                                                       path.rstrip('/').rsplit('/', 1)[-1] or 'DiscordStorage', True, 0)
                             if depth != '0':
-                                files = filesystem.list_files()
-                                for file_info in files:
-                                    file_response = ET.SubElement(multistatus, 'response')
-                                    file_href = ET.SubElement(file_response, 'href')
-                                    file_href.text = f"/{file_info['name']}"
-                                    
-                                    file_propstat = ET.SubElement(file_response, 'propstat')
-                                    file_prop = ET.SubElement(file_propstat, 'prop')
-                                    
-                                    file_displayname = ET.SubElement(file_prop, 'displayname')
-                                    file_displayname.text = file_info['name']
-                                    
-                                    file_getcontentlength = ET.SubElement(file_prop, 'getcontentlength')
-                                    file_getcontentlength.text = str(file_info['size'])
-                                    
-                                    file_getlastmodified = ET.SubElement(file_prop, 'getlastmodified')
-                                    file_getlastmodified.text = datetime.now().strftime('%a, %d %b %Y %H:%M:%S GMT')
-                                    
-                                    file_getcontenttype = ET.SubElement(file_prop, 'getcontenttype')
-                                    file_getcontenttype.text = 'application/octet-stream'
-                                    
-                                    file_status = ET.SubElement(file_propstat, 'status')
-                                    file_status.text = 'HTTP/1.1 200 OK'
+                                for file_info in filesystem.list_files(path):
+                                    href = file_info['path'] + ('/' if file_info['is_directory'] else '')
+                                    self.add_propfind_response(multistatus, href, file_info['name'],
+                                                               file_info['is_directory'], file_info['size'])
+                        else:
+                            file_info = filesystem.get_file_info(path)
+                            if not file_info:
+                                self.send_error(404, "Not found")
+                                return
+                            self.add_propfind_response(multistatus, path, path.rstrip('/').rsplit('/', 1)[-1],
+                                                       False, file_info['size'])
                         
                         # Send WebDAV XML response
                         xml_response = ET.tostring(multistatus, encoding='utf-8', xml_declaration=True)
@@ -743,12 +903,32 @@ class DiscordSMBServer:
                         print(f"❌ PROPFIND error: {e}")
                         self.send_error(500, str(e))
                 
+                def add_propfind_response(self, multistatus, href, name, is_directory, size):
+                    """Append the properties of one file or directory to a PROPFIND answer"""
+                    response = ET.SubElement(multistatus, 'response')
+                    ET.SubElement(response, 'href').text = urllib.parse.quote(href)
+                    
+                    propstat = ET.SubElement(response, 'propstat')
+                    prop = ET.SubElement(propstat, 'prop')
+                    
+                    resourcetype = ET.SubElement(prop, 'resourcetype')
+                    if is_directory:
+                        ET.SubElement(resourcetype, 'collection')
+                    ET.SubElement(prop, 'displayname').text = name
+                    if not is_directory:
+                        ET.SubElement(prop, 'getcontentlength').text = str(size)
+                        ET.SubElement(prop, 'getcontenttype').text = 'application/octet-stream'
+                    ET.SubElement(prop, 'getlastmodified').text = datetime.now().strftime('%a, %d %b %Y %H:%M:%S GMT')
+                    
+                    ET.SubElement(propstat, 'status').text = 'HTTP/1.1 200 OK'
+                
                 def do_GET(self):
                     """Handle GET requests for file downloads and directory listings"""
                     try:
                         path = urllib.parse.unquote(self.path)
                         
-                        if path == '/' or path == '':                            # Root directory - provide HTML listing for browsers
+                        if filesystem.is_directory(path):
+                            # Directory - provide HTML listing of its entries for browsers
                             self.send_response(200)
                             self.send_header('Content-type', 'text/html')
                             self.end_headers()
@@ -761,16 +941,22 @@ class DiscordSMBServer:
                             <html>
                             <head><title>Discord Storage WebDAV Share</title></head>
                             <body>
-                            <h1>📁 Discord Storage Files</h1>
+                            <h1>📁 Discord Storage Files: {html_escape(path.rstrip('/') or '/')}</h1>
                             <p>💡 This is a WebDAV share for network mapping</p>
                             <ul>
                             """
                             
-                            files = filesystem.list_files()
+                            if path.strip('/'):
+                                parent = path.rstrip('/').rsplit('/', 1)[0] or '/'
+                                html += f'<li><a href="{urllib.parse.quote(parent)}">⬆️ ..</a></li>'
+                            files = filesystem.list_files(path)
                             for file_info in files:
-                                filename = file_info['name']
-                                size = file_info['size']
-                                html += f'<li><a href="/{filename}">{filename}</a> ({size} bytes)</li>'
+                                filename = html_escape(file_info['name'])
+                                if file_info['is_directory']:
+                                    html += f'<li><a href="{urllib.parse.quote(file_info["path"])}/">📁 {filename}/</a></li>'
+                                else:
+                                    size = file_info['size']
+                                    html += f'<li><a href="{urllib.parse.quote(file_info["path"])}">{filename}</a> ({size} bytes)</li>'
                             
                             html += """
                             </ul>
@@ -785,10 +971,13 @@ class DiscordSMBServer:
                             filename = path.lstrip('/')
                             file_info = filesystem.get_file_info(filename)
                             
-                            if file_info:
+                            if file_info and filesystem.can_stream(filename, file_info['file_info']):
+                                # Serve the requested range from chunks, reading ahead while sequential
+                                self.send_stream(file_info['file_info'], filename)
+                            elif file_info:
                                 # Download file to cache and serve it
                                 cache_path = filesystem.download_file_to_cache(
-                                    file_info['file_info'], filename
+                                    file_info['file_info'], filename, self.client_address[0]
                                 )
                                 
                                 self.send_response(200)
@@ -811,26 +1000,74 @@ class DiscordSMBServer:
                         print(f"❌ GET Handler error: {e}")
                         self.send_error(500, str(e))
                 
+                def send_stream(self, record, filename):
+                    """Answer a GET, honouring a Range header, from the chunk cache"""
+                    size = record[1]
+                    try:
+                        byte_range = parse_byte_range(self.headers.get('Range'), size)
+                    except ValueError:
+                        self.send_response(416)  # Range Not Satisfiable
+                        self.send_header('Content-Range', f'bytes */{size}')
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    first, last = byte_range or (0, size - 1)
+                    stream = filesystem.core.chunk_cache.stream(record, self.client_address[0])
+                    self.send_response(206 if byte_range else 200)
+                    self.send_header('Content-type', 'application/octet-stream')
+                    self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+                    self.send_header('Accept-Ranges', 'bytes')
+                    self.send_header('Content-Length', str(last - first + 1))
+                    if byte_range:
+                        self.send_header('Content-Range', f'bytes {first}-{last}/{size}')
+                    self.send_header('Last-Modified', datetime.now().strftime('%a, %d %b %Y %H:%M:%S GMT'))
+                    self.end_headers()
+                    
+                    position = first
+                    try:
+                        while position <= last:
+                            data = stream.read(position, min(STREAM_PIECE, last + 1 - position))
+                            if not data:
+                                break
+                            self.wfile.write(data)
+                            position += len(data)
+                    except (BrokenPipeError, ConnectionResetError):
+                        stream.close()  # the client went away, stop reading ahead for it
+                    except Exception as e:
+                        # headers are sent: all that is left is to cut the response short
+                        print(f"❌ WebDAV: Streaming {filename} failed: {e}")
+                        stream.close()
+                        self.close_connection = True
+                
                 def do_PUT(self):
                     """Handle PUT requests for file uploads"""
                     try:
                         path = urllib.parse.unquote(self.path)
-                        filename = path.lstrip('/')
+                        if '..' in path.replace('\\', '/').split('/'):
+                            self.send_error(400, "Path may not contain '..'")
+                            return
+                        parts = split_path(path)  # the spool path is built from these alone
+                        filename = '/'.join(parts)
                         
                         if not filename:
                             self.send_error(400, "No filename specified")
                             return
+                        if '/' in filename.rstrip('/') and not filesystem.is_directory(os.path.dirname(filename)):
+                            self.send_error(409, "Parent directory does not exist")  # create it with MKCOL first
+                            return
                         
                         content_length = int(self.headers.get('Content-Length', 0))
                         
                         if content_length > 0:
                             print(f"📤 WebDAV: Uploading {filename} ({content_length} bytes)")
                             
-                            # Save uploaded file to temporary location
-                            temp_dir = tempfile.mkdtemp()
-                            temp_path = os.path.join(temp_dir, filename)
+                            # Save uploaded file to the spool, where a queued upload survives a restart
+                            temp_dir = filesystem.core.queue.spool_dir()
+                            os.makedirs(temp_dir)
+                            temp_path = os.path.join(temp_dir, *parts)
                             
                             try:
+                                os.makedirs(os.path.dirname(temp_path), exist_ok=True)
                                 with open(temp_path, 'wb') as f:
                                     remaining = content_length
                                     while remaining > 0:
@@ -841,24 +1078,21 @@ class DiscordSMBServer:
                                         f.write(chunk)
                                         remaining -= len(chunk)
                                 
-                                # Upload to Discord Storage
-                                success = filesystem.upload_file_from_cache(temp_path, filename)
+                                # Queue the upload to Discord Storage; the queue removes
+                                # temp_dir and adds the catalog entry when it is done
+                                job = filesystem.submit_file_from_cache(temp_path, filename, temp_dir,
+                                                                        owner=self.client_address[0])
                                 
-                                if success:
-                                    print(f"✅ WebDAV: Upload successful - {filename}")
-                                    self.send_response(201)  # Created
-                                    self.send_header('Content-Length', '0')
-                                    self.end_headers()
-                                else:
-                                    print(f"❌ WebDAV: Upload failed - {filename}")
-                                    self.send_error(500, "Upload to Discord failed")
+                                print(f"✅ WebDAV: Upload accepted - {filename} (job {job.id})")
+                                self.send_response(202)  # Accepted
+                                self.send_header('X-Job-Id', job.id)
+                                self.send_header('Content-Length', '0')
+                                self.end_headers()
                                     
-                            finally:
+                            except Exception:
                                 # Clean up temp directory
-                                try:
-                                    shutil.rmtree(temp_dir)
-                                except:
-                                    pass
+                                shutil.rmtree(temp_dir, ignore_errors=True)
+                                raise
                         else:
                             # Empty file or directory creation attempt
                             self.send_response(201)  # Created
@@ -874,8 +1108,8 @@ class DiscordSMBServer:
                     try:
                         path = urllib.parse.unquote(self.path)
                         
-                        if path == '/' or path == '':
-                            # Root directory
+                        if filesystem.is_directory(path):
+                            # Directory listing
                             self.send_response(200)
                             self.send_header('Content-Type', 'text/html')
                             self.send_header('Content-Length', '1000')  # Approximate
@@ -889,6 +1123,8 @@ class DiscordSMBServer:
                                 self.send_response(200)
                                 self.send_header('Content-Type', 'application/octet-stream')
                                 self.send_header('Content-Length', str(file_info['size']))
+                                if filesystem.can_stream(filename, file_info['file_info']):
+                                    self.send_header('Accept-Ranges', 'bytes')
                                 self.send_header('Last-Modified', datetime.now().strftime('%a, %d %b %Y %H:%M:%S GMT'))
                                 self.end_headers()
                             else:
@@ -999,11 +1235,12 @@ class DiscordSMBServer:
                         temp_dir = tempfile.mkdtemp()
                         try:
                             temp_source_path = filesystem.download_file_to_cache(
-                                source_file_info['file_info'], source_filename
+                                source_file_info['file_info'], source_filename, self.client_address[0]
                             )
                             
                             # Create renamed file in temp directory
                             temp_dest_path = os.path.join(temp_dir, dest_filename)
+                            os.makedirs(os.path.dirname(temp_dest_path), exist_ok=True)
                             shutil.copy2(temp_source_path, temp_dest_path)
                             
                             # Upload renamed file to Discord
@@ -1072,11 +1309,12 @@ class DiscordSMBServer:
                         temp_dir = tempfile.mkdtemp()
                         try:
                             temp_source_path = filesystem.download_file_to_cache(
-                                source_file_info['file_info'], source_filename
+                                source_file_info['file_info'], source_filename, self.client_address[0]
                             )
                             
                             # Create copy in temp directory
                             temp_dest_path = os.path.join(temp_dir, dest_filename)
+                            os.makedirs(os.path.dirname(temp_dest_path), exist_ok=True)
                             shutil.copy2(temp_source_path, temp_dest_path)
                             
                             # Upload copy to Discord
@@ -1103,8 +1341,25 @@ class DiscordSMBServer:
                         self.send_error(500, str(e))
                 
                 def do_MKCOL(self):
-                    """Handle MKCOL requests (create directory) - not supported"""
-                    self.send_error(405, "Directory creation not supported")
+                    """Handle MKCOL requests - create a directory in the catalog"""
+                    try:
+                        path = urllib.parse.unquote(self.path)
+                        if int(self.headers.get('Content-Length', 0) or 0) > 0:
+                            self.send_error(415, "MKCOL with a request body is not supported")
+                            return
+                        
+                        filesystem.make_directory(path)
+                        self.send_response(201)  # Created
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        
+                    except FileExistsError:
+                        self.send_error(405, "A file or directory with this name already exists")
+                    except FileNotFoundError:
+                        self.send_error(409, "Parent directory does not exist")
+                    except Exception as e:
+                        print(f"❌ WebDAV MKCOL error: {e}")
+                        self.send_error(500, str(e))
                 
                 def do_DELETE(self):
                     """Handle DELETE requests - WebDAV file deletion"""
@@ -1118,6 +1373,17 @@ class DiscordSMBServer:
                         
                         print(f"🗑️  WebDAV: Deleting '{filename}'")
                         
+                        if filesystem.is_directory(filename):
+                            try:
+                                filesystem.remove_directory(filename)
+                            except OSError:
+                                self.send_error(409, "Directory is not empty")
+                                return
+                            self.send_response(204)  # No Content
+                            self.send_header('Content-Length', '0')
+                            self.end_headers()
+                            return
+                        
                         # Check if file exists
                         file_info = filesystem.get_file_info(filename)
                         if not file_info:
@@ -1268,11 +1534,19 @@ class DiscordStorageUnifiedServer:
         """Get status of all servers"""
         status = {
             'running': self.running,
+            'jobs': {
+                'active': len(self.core.jobs.active()),
+                'queued': len(self.core.queue.pending()),
+                'workers': self.core.queue.workers,
+                'total': len(self.core.jobs.list())
+            },
             'web_server': {
                 'enabled': self.web_enabled,
                 'running': self.web_server.running if self.web_server else False,
                 'host': self.web_server.host if self.web_server else None,
-                'port': self.web_server.port if self.web_server else None
+                'port': self.web_server.port if self.web_server else None,
+                'metrics': f"http://{self.web_server.host}:{self.web_server.port}/metrics" if self.web_server else None,
+                'limits': f"http://{self.web_server.host}:{self.web_server.port}/limits" if self.web_server else None
             },
             'smb_server': {
                 'enabled': self.smb_enabled,
@@ -1313,10 +1587,12 @@ def start_web_server_standalone(token: str, channel_id: str, host: str = '0.0.0.
     
     # Wait for Discord to be ready
     print("⏳ Waiting for Discord connection...")
-    while not web_server.core.isready():
-        time.sleep(1)
+    if not web_server.core.wait_ready():
+        print("❌ Could not connect to Discord, check your token")
+        return
     
     print("✅ Discord connection established!")
+    web_server.core.queue.start()  # resume transfers queued before a restart
     
     # Start web server
     web_server.start_server()
@@ -1365,10 +1641,12 @@ def start_unified_server_standalone(token: str, channel_id: str,
     
     # Wait for Discord to be ready
     print("⏳ Waiting for Discord connection...")
-    while not unified_server.core.isready():
-        time.sleep(1)
+    if not unified_server.core.wait_ready():
+        print("❌ Could not connect to Discord, check your token")
+        return
     
     print("✅ Discord connection established!")
+    unified_server.core.queue.start()  # resume transfers queued before a restart
       # Start all servers
     unified_server.start_servers(
         web_enabled=web_enabled,
@@ -0,0 +1,222 @@
+"""
+Discord Storage Throttling
+Token-bucket bandwidth limiting shared by concurrent transfers
+
+A Core's Shaper (core.bandwidth) limits chunk sends and CDN reads with a
+global bucket per direction, optional buckets per job and per client (the
+job's owner), and time-of-day schedules that replace the global rates,
+e.g. "01:00-07:00=0,07:00-01:00=2M" to run backups at full speed overnight.
+All of it can be changed while transfers are running.
+"""
+
+import time
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+DIRECTIONS = ('download', 'upload')
+
+
+def parse_rate(text: str) -> int:
+    """Parse a rate such as '500K', '10M', '1.5G' or '10MB/s' (bytes per second)"""
+    text = text.strip().upper()
+    if text.endswith('/S'):
+        text = text[:-2]
+    text = text.rstrip('B')
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text))
+
+
+class TokenBucket:
+    """Async token bucket; a rate of None or 0 means unlimited
+
+    Consumers may drive the bucket into debt and then sleep it off, so a
+    large read is never split up and the aggregate rate still holds.
+    """
+
+    def __init__(self, rate: Optional[int] = None, burst: Optional[int] = None):
+        self.rate = rate
+        self.burst = burst or (rate or 0) // 10  # ~100ms worth of data
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def set_rate(self, rate: Optional[int], burst: Optional[int] = None):
+        """Change the rate while transfers are running"""
+        self.rate = rate
+        self.burst = burst or (rate or 0) // 10
+        self.tokens = min(self.tokens, self.burst)
+
+    def take(self, amount: int) -> float:
+        """Take amount tokens, returns the seconds to wait for them"""
+        if not self.rate:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    async def consume(self, amount: int):
+        """Take amount tokens, sleeping if the bucket runs dry"""
+        delay = self.take(amount)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def parse_schedule(text: str) -> List[Tuple[int, int, int]]:
+    """Parse "HH:MM-HH:MM=RATE,..." into (start, end, rate) windows in
+    minutes since midnight; a window may wrap past midnight and a rate of
+    0 means unlimited. An empty text is no schedule."""
+    windows = []
+    for part in filter(None, (part.strip() for part in text.split(','))):
+        try:
+            span, rate = part.split('=', 1)
+            start, end = (int(hh) * 60 + int(mm) for hh, mm in (t.split(':') for t in span.split('-', 1)))
+        except ValueError:
+            raise ValueError(f"bad schedule window {part!r}, expected HH:MM-HH:MM=RATE")
+        if not (0 <= start < 1440 and 0 <= end <= 1440):
+            raise ValueError(f"bad schedule window {part!r}, times are 00:00 to 24:00")
+        windows.append((start, end, parse_rate(rate)))
+    return windows
+
+
+def format_rate(rate: Optional[int]) -> str:
+    if not rate:
+        return "unlimited"
+    for unit, size in (('G', 1024 ** 3), ('M', 1024 ** 2), ('K', 1024)):
+        if rate >= size:
+            return f"{rate / size:g}{unit}"
+    return str(rate)
+
+
+class Shaper:
+    """Bandwidth limits of one Core
+
+    Every chunk send and CDN read takes its bytes from the global bucket of
+    its direction, from its job's bucket when the job has a rate and from
+    its client's bucket when clients are limited, then waits as long as
+    the slowest of those needs.
+    """
+
+    def __init__(self):
+        self.rates = dict.fromkeys(DIRECTIONS)  # global rates set by the user
+        self.client_rates = dict.fromkeys(DIRECTIONS)  # rate for each client, None = unlimited
+        self.schedules = {direction: [] for direction in DIRECTIONS}
+        self.buckets = {direction: TokenBucket() for direction in DIRECTIONS}
+        self.clients = {}  # (direction, client) -> TokenBucket
+        self.jobs = {}  # job id -> TokenBucket
+        self._minute = None  # minute of day the schedules were last applied
+
+    def _directions(self, direction: Optional[str]) -> Tuple[str, ...]:
+        if direction is None:
+            return DIRECTIONS
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction must be one of {DIRECTIONS}, got {direction!r}")
+        return (direction,)
+
+    def set_rate(self, rate: Optional[int], direction: Optional[str] = None):
+        """Global rate of one direction, or of both when direction is None"""
+        for direction in self._directions(direction):
+            self.rates[direction] = rate or None
+        self._apply_schedules(force=True)
+
+    def set_client_rate(self, rate: Optional[int], direction: Optional[str] = None):
+        """Rate every client gets on its own, within the global one"""
+        for direction in self._directions(direction):
+            self.client_rates[direction] = rate or None
+            for (bucket_direction, client), bucket in self.clients.items():
+                if bucket_direction == direction:
+                    bucket.set_rate(rate or None)
+
+    def set_schedule(self, windows: List[Tuple[int, int, int]], direction: Optional[str] = None):
+        for direction in self._directions(direction):
+            self.schedules[direction] = list(windows)
+        self._apply_schedules(force=True)
+
+    def set_job_rate(self, job, rate: Optional[int]):
+        """Limit one transfer, on top of the global and client rates"""
+        job.rate = rate or None
+        if rate:
+            bucket = self.jobs.get(job.id)
+            if bucket is None:
+                self.jobs[job.id] = TokenBucket(rate)
+            else:
+                bucket.set_rate(rate)
+        else:
+            self.jobs.pop(job.id, None)
+
+    def forget(self, job):
+        """Drop the bucket of a finished job"""
+        self.jobs.pop(job.id, None)
+
+    def current_rate(self, direction: str) -> Optional[int]:
+        """Global rate in effect now, scheduled or set"""
+        self._apply_schedules()
+        return self.buckets[direction].rate
+
+    def _scheduled(self, direction: str, minute: int):
+        for start, end, rate in self.schedules[direction]:
+            inside = start <= minute < end if start < end else (minute >= start or minute < end)
+            if inside:
+                return rate or None
+        return self.rates[direction]
+
+    def _apply_schedules(self, force: bool = False):
+        now = time.localtime()
+        minute = now.tm_hour * 60 + now.tm_min
+        if minute == self._minute and not force:
+            return
+        self._minute = minute
+        for direction in DIRECTIONS:
+            rate = self._scheduled(direction, minute)
+            if rate != self.buckets[direction].rate:
+                self.buckets[direction].set_rate(rate)
+
+    def _client_bucket(self, direction: str, client: str) -> TokenBucket:
+        bucket = self.clients.get((direction, client))
+        if bucket is None:
+            bucket = self.clients[(direction, client)] = TokenBucket(self.client_rates[direction])
+        return bucket
+
+    async def consume(self, direction: str, amount: int, job=None, client: Optional[str] = None) -> float:
+        """Account for amount bytes moved in direction, sleeping as the limits
+        require; returns the seconds slept"""
+        self._apply_schedules()
+        delay = self.buckets[direction].take(amount)
+        client = client or getattr(job, 'owner', None)
+        if client and self.client_rates[direction]:
+            delay = max(delay, self._client_bucket(direction, client).take(amount))
+        bucket = self.jobs.get(job.id) if job is not None else None
+        if bucket is not None:
+            delay = max(delay, bucket.take(amount))
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
+
+    def configure(self, **changes) -> Dict:
+        """Apply limits given as text, as the daemon and the web server get them
+
+        Keys: download, upload, client_download, client_upload (rates such
+        as 20M, 0 for unlimited), schedule_download, schedule_upload
+        (windows, "" for none). Returns to_dict().
+        """
+        for key, value in changes.items():
+            kind, _, direction = key.rpartition('_')
+            if direction not in DIRECTIONS or kind not in ('', 'client', 'schedule'):
+                raise ValueError(f"unknown limit: {key}")
+            if kind == 'schedule':
+                self.set_schedule(parse_schedule(str(value or '')), direction)
+            else:
+                rate = parse_rate(str(value)) if value not in (None, '') else None
+                (self.set_client_rate if kind == 'client' else self.set_rate)(rate, direction)
+        return self.to_dict()
+
+    def to_dict(self) -> Dict:
+        clock = lambda minute: f"{minute // 60:02d}:{minute % 60:02d}"
+        return {direction: {
+            'rate': self.rates[direction],
+            'current': self.current_rate(direction),
+            'client_rate': self.client_rates[direction],
+            'schedule': ",".join(f"{clock(start)}-{clock(end)}={rate}" for start, end, rate in self.schedules[direction]),
+        } for direction in DIRECTIONS}
@@ -0,0 +1,271 @@
+"""
+Discord Storage Transfer Queue
+Persistent queue that every upload and download goes through, with a
+scheduler running a fixed number of transfers at a time on the Core's
+event loop
+
+Jobs are picked by priority class first (interactive reads before normal
+CLI transfers before background uploads), then round-robin between the
+clients that submitted them, so one large WebDAV copy cannot starve a
+browser download. Queued and running jobs are written to queue.discord
+and picked up again after a restart; the transfers themselves resume
+from their own progress files.
+
+queue.discord belongs to one process at a time, held through a lock on
+queue.discord.lock: a server started next to another one (or a
+--no-daemon run while the daemon is up) keeps its jobs in memory only,
+so it neither replays the owner's transfers nor overwrites its file.
+"""
+
+import os
+import json
+import time
+import shutil
+import asyncio
+import contextlib
+import threading
+import concurrent.futures
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from .jobs import CANCELLED, DONE, TransferJob
+
+INTERACTIVE = 0  # someone is waiting on it (web/WebDAV reads)
+NORMAL = 1  # CLI transfers
+BACKGROUND = 2  # uploads and bulk copies
+
+CATALOG_BATCH = 25  # finished uploads written to config.discord together
+
+
+class TransferQueue:
+    """Durable job queue with priority classes and per-client fairness"""
+
+    def __init__(self, core, queue_path: str, workers: int = 3):
+        self.core = core
+        self.queue_path = queue_path
+        self.spool_path = os.path.join(os.path.dirname(queue_path) or '.', "spool")
+        self.workers = workers
+        self.entries = {}  # job id -> persisted entry, queued or running
+        self.running = set()  # job ids with a transfer in flight
+        self.served = {}  # owner -> dispatch counter of its last started job
+        self._dispatched = 0
+        self._seq = 0
+        self._unsaved_uploads = 0
+        self._batching = 0
+        self._lock = threading.RLock()
+        self._lock_file = self._acquire()
+        self.persistent = self._lock_file is not None  # False: jobs are kept in memory only
+        if self.persistent:
+            self.load()
+        else:
+            print("⚠️  Another process owns the transfer queue, this one keeps its transfers in memory")
+
+    def _acquire(self):
+        """Open file holding the lock on queue.discord.lock, None if another process has it"""
+        try:
+            f = open(self.queue_path + ".lock", 'a+')
+        except OSError as e:
+            print(f"⚠️  Could not open the transfer queue lock: {e}")
+            return None
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            return None
+        return f  # released by the OS when the process exits
+
+    def load(self):
+        """Re-create the jobs left in queue.discord by an earlier run"""
+        try:
+            with open(self.queue_path, 'r') as f:
+                entries = json.load(f).get('jobs', [])
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"⚠️  Could not read transfer queue, starting empty: {e}")
+            return
+        for entry in entries:
+            if entry['kind'] == 'upload':
+                if not os.path.exists(entry['args']['path']):
+                    print(f"⚠️  Dropping queued upload of {entry['name']}, the source file is gone")
+                    continue
+                self.core.catalog.reserve_code(entry['args']['code'])
+            job = TransferJob(entry['kind'], entry['name'], entry['total'], entry['owner'])
+            job.id = entry['id']
+            job.created = entry['created']
+            self._seq = max(self._seq, entry['seq'])
+            self._track(job, entry)
+        if self.entries:
+            print(f"📋 {len(self.entries)} transfer(s) restored from the queue")
+
+    def save(self):
+        if not self.persistent:
+            return
+        with self._lock:
+            entries = sorted(self.entries.values(), key=lambda entry: entry['seq'])
+            tmp_path = self.queue_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'jobs': entries}, f)
+            os.replace(tmp_path, self.queue_path)
+
+    def spool_dir(self) -> str:
+        """New directory under spool/ for data that has to outlive a restart
+        until its queued upload has run (removed with cleanup=)"""
+        os.makedirs(self.spool_path, exist_ok=True)
+        return os.path.join(self.spool_path, f"{time.time_ns():x}")
+
+    def submit_upload(self, path: str, code: str, chunking=None, compression=None,
+                      name: Optional[str] = None, owner: Optional[str] = None,
+                      priority: int = BACKGROUND, cleanup: Optional[str] = None) -> TransferJob:
+        """Queue an upload; its record is added to the catalog under code when done
+
+        cleanup (optional) is a directory removed once the job has finished.
+        """
+        name = name or os.path.basename(path)
+        args = {'path': path, 'code': code, 'chunking': chunking,
+                'compression': compression, 'name': name, 'cleanup': cleanup}
+        return self._submit('upload', name, os.path.getsize(path), args, owner, priority)
+
+    def submit_download(self, record: List, owner: Optional[str] = None,
+                        priority: int = INTERACTIVE) -> TransferJob:
+        """Queue a download of a catalog record into downloads/"""
+        meta = record[5] if len(record) > 5 else {}
+        return self._submit('download', record[0], meta.get('stored_size', record[1]),
+                            {'record': record}, owner, priority)
+
+    def _submit(self, kind: str, name: str, total: int, args: Dict,
+                owner: Optional[str], priority: int) -> TransferJob:
+        job = TransferJob(kind, name, total, owner)
+        with self._lock:
+            self._seq += 1
+            entry = {'id': job.id, 'kind': kind, 'name': name, 'total': total,
+                     'owner': owner, 'priority': priority, 'seq': self._seq,
+                     'created': job.created, 'args': args}
+            self._track(job, entry)
+            if not self._batching:
+                self.save()
+        self.start()
+        return job
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Submit many jobs with a single write of queue.discord"""
+        with self._lock:
+            self._batching += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batching -= 1
+                if not self._batching:
+                    self.save()
+
+    def _track(self, job: TransferJob, entry: Dict):
+        self.entries[job.id] = entry
+        job.on_cancel = self._cancel_queued
+        job.add_done_callback(self._finished)
+        self.core.jobs.add(job)
+
+    def start(self):
+        """Let the scheduler run queued jobs (no-op until the session is ready)"""
+        loop = self.core.session.getLoop()
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._dispatch)
+
+    def pending(self) -> List[Dict]:
+        """Queued entries that have not started, in the order they would run"""
+        with self._lock:
+            return [entry for entry in sorted(self.entries.values(), key=self._rank)
+                    if entry['id'] not in self.running]
+
+    def _rank(self, entry: Dict):
+        return (entry['priority'], self.served.get(entry['owner'], 0), entry['seq'])
+
+    def _next(self) -> Optional[Dict]:
+        """Highest priority class first, then the client served least recently
+        among those with the fewest running jobs, then submission order"""
+        waiting = [entry for entry in self.entries.values() if entry['id'] not in self.running]
+        if not waiting:
+            return None
+        top = min(entry['priority'] for entry in waiting)
+        waiting = [entry for entry in waiting if entry['priority'] == top]
+        busy = {}
+        for job_id in self.running:
+            owner = self.entries[job_id]['owner']
+            busy[owner] = busy.get(owner, 0) + 1
+        return min(waiting, key=lambda entry: (busy.get(entry['owner'], 0),) + self._rank(entry))
+
+    def _dispatch(self):
+        """Start queued jobs while workers are free; runs on the session loop"""
+        loop = asyncio.get_event_loop()
+        with self._lock:
+            while len(self.running) < self.workers:
+                entry = self._next()
+                if entry is None:
+                    return
+                job = self.core.jobs.get(entry['id'])
+                self.running.add(entry['id'])
+                self._dispatched += 1
+                self.served[entry['owner']] = self._dispatched
+                job.attach(asyncio.run_coroutine_threadsafe(self._transfer(entry, job), loop))
+
+    def _transfer(self, entry: Dict, job: TransferJob):
+        args = entry['args']
+        if entry['kind'] == 'upload':
+            return self.core.async_upload(args['path'], args['code'], args['chunking'],
+                                          args['compression'], args['name'], job)
+        return self.core.async_download(args['record'], job=job)
+
+    def _cancel_queued(self, job: TransferJob) -> bool:
+        """Cancel a job, whether it is still waiting or already running"""
+        with self._lock:
+            if job._future is None:
+                future = concurrent.futures.Future()
+                future.cancel()
+                job.attach(future)
+                return True
+        return job._future.cancel()
+
+    def _finished(self, job: TransferJob):
+        with self._lock:
+            entry = self.entries.get(job.id)
+            if entry is None:
+                return
+            self.running.discard(job.id)
+            self.core.bandwidth.forget(job)
+            self.core.metrics.transfers.inc(kind=entry['kind'], state=job.state)
+            if job.state == CANCELLED and not job.cancel_requested:
+                # interrupted by a shutdown, not by the user: run it again next time
+                self._flush_catalog(force=True)
+                return
+            del self.entries[job.id]
+            args = entry['args']
+            if entry['kind'] == 'upload':
+                if job.state == DONE:
+                    self.core.catalog.add(args['code'], job.result, save=False)
+                    self._unsaved_uploads += 1
+                else:
+                    self.core.catalog.release_code(args['code'])
+                self._flush_catalog()
+            if args.get('cleanup'):
+                shutil.rmtree(args['cleanup'], ignore_errors=True)
+            self.save()
+        self.start()
+
+    def _flush_catalog(self, force: bool = False):
+        """Write finished uploads in batches, and right away once none are left"""
+        if not self._unsaved_uploads:
+            return
+        uploads_left = any(entry['kind'] == 'upload' for entry in self.entries.values())
+        if force or not uploads_left or self._unsaved_uploads >= CATALOG_BATCH:
+            self.core.catalog.save()
+            self._unsaved_uploads = 0
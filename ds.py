@@ -1,57 +1,64 @@
-from discordstorage import core
-import threading,json,asyncio,random,sys,argparse,os,time
-import urllib.request
-import urllib.error
-import zipfile
-import hashlib
-import subprocess
-import shutil
+import threading,json,sys,os
 
 TOKEN_SECRET = "" #bot's secret token
 ROOM_ID = "" #channel text ID
 BOT_INFO = None
 FILES = None
 
-# File type detection setup
-FILE_UTILITY_PATH = os.path.join(os.getcwd(), "file.exe")
-MAGIC_DB_PATH = os.path.join(os.getcwd(), "magic.mgc")
-LIBMAGIC_PATH = os.path.join(os.getcwd(), "libmagic.dll")
-
-#Generates a file code from 0-4097
-def genCode():
-    code = str(random.randint(0,4098))
-    if FILES == None:
-        return code
-    while code in FILES.keys():
-        code = str(random.randint(0,4098))
-    return code
-
 #returns if the config file is configured or not.
 def isConfigured():
     return os.path.isfile('config.discord')
 
+#Creates the Core for this directory. discord.py and aiohttp are only imported
+#here, so catalog-only commands (-l, -h) start without loading them.
+def newcore(token=None,room=None):
+    from discordstorage import core
+    return core.Core(os.getcwd() + "/", TOKEN_SECRET if token is None else token, ROOM_ID if room is None else room)
+
+#Lazily expands upload arguments (files, directories and glob patterns)
+#into (path, name) pairs. Files found inside a directory keep their path
+#relative to that directory's parent as the stored name.
+def iter_upload_targets(patterns):
+    import glob
+    for pattern in patterns:
+        if any(c in pattern for c in '*?['):
+            matches = glob.iglob(pattern, recursive=True)
+        else:
+            matches = [pattern]
+        for match in matches:
+            if os.path.isdir(match):
+                root = os.path.dirname(os.path.abspath(match))
+                for dirpath, dirnames, filenames in os.walk(match):
+                    dirnames.sort()
+                    for filename in sorted(filenames):
+                        path = os.path.join(dirpath, filename)
+                        yield path, os.path.relpath(os.path.abspath(path), root).replace(os.sep, '/')
+            elif os.path.isfile(match):
+                yield match, os.path.basename(match)
+            else:
+                print(f'[ERROR] File does not exist: {match}')
+
 #invokes file uploading, to be used on a thread that's not in main thread.
-#writes to config file accordingly.
-def tellupload(line1,line2,cmd,code,client):
-    while not (client.isready()):
-        time.sleep(0.5)
-    if not os.path.isfile(cmd):
-        print('[ERROR] File does not exist.')
-        client.logout()
+#all targets share this one session; catalog entries are written in batches.
+def tellupload(client,targets,chunking='fixed',compression=None,concurrency=3):
+    if not client.wait_ready():
+        print('[ERROR] Could not connect to Discord')
         return
-    flcode = client.upload(cmd,code)
-    if flcode == -1:
+    client.queue.start() #transfers left over from an interrupted run are resumed too
+    completed = []
+    def on_done(code,record):
+        # record: [filename, size, urls, hash_url, file_hash, meta]
+        # the transfer queue has already added it to the catalog (saved in batches)
+        completed.append(code)
+        print(f'[DONE] {record[0]} uploaded with code {code} | hash: {record[4]}')
+    failed = client.upload_many(targets,on_done,concurrency,chunking,compression)
+    client.catalog.save()
+    if failed == -1:
         print('[ERROR] File upload fail')
     else:
-        jobject = json.loads(line2)
-        # flcode now includes: [filename, size, urls, hash_url, file_hash]
-        jobject[code] = flcode
-        f = open('config.discord','w')
-        f.write(line1)
-        f.write(json.dumps(jobject))
-        f.close()
-        print('[DONE] File upload complete')
-        print(f'[INFO] File hash: {flcode[4]}')
+        for path in failed:
+            print(f'[ERROR] File upload fail: {path}')
+        print(f'[DONE] {len(completed)} file(s) uploaded, {len(failed)} failed')
     client.logout()
 
 def GetHumanReadable(size,precision=2):
@@ -62,187 +69,202 @@ def GetHumanReadable(size,precision=2):
         size = size/1024.0 #apply the division
     return "%.*f%s"%(precision,size,suffixes[suffixIndex])
 
-#invokes file downloading, to be used on a thread that's not in main thread
-def telldownload(client,inp):
-    while not (client.isready()):
-        time.sleep(0.5)
-    client.download(inp)
+#invokes file downloading, to be used on a thread that's not in main thread.
+#several records are restored concurrently through the same session.
+def telldownload(client,records,concurrency=2):
+    if not client.wait_ready():
+        print('[ERROR] Could not connect to Discord')
+        return
+    client.queue.start() #transfers left over from an interrupted run are resumed too
+    if len(records) == 1:
+        client.download(records[0])
+    else:
+        failed = client.download_many(records,concurrency)
+        if failed == -1:
+            print('[ERROR] File download fail')
+        else:
+            for record in failed:
+                print(f'[ERROR] File download fail: {record[0]}')
     client.logout()
 
-# Download and setup file type detection utility
-def setup_file_utility():
-    """Download and extract Windows file utility if not present"""
-    if os.path.exists(FILE_UTILITY_PATH) and os.path.exists(MAGIC_DB_PATH) and os.path.exists(LIBMAGIC_PATH):
-        return True
-    
-    print("📦 Setting up file type detection utility...")
-    
+#invokes the catalog rebuild from channel history, to be used on a thread that's not in main thread.
+def tellrebuild(client):
+    if not client.wait_ready():
+        print('[ERROR] Could not connect to Discord')
+        return
+    result = client.rebuild_index()
+    if result == -1:
+        print('[ERROR] Catalog rebuild failed, run --rebuild-index again to resume')
+    else:
+        print(f'[DONE] {result[0]} file(s) added to config.discord')
+    client.logout()
+
+#Runs the daemon in the foreground: one warm Discord connection that the
+#other ds.py commands in this directory send their work to.
+def rundaemon(client):
+    import asyncio
+    from discordstorage.daemon import DaemonServer
+    server = DaemonServer(client)
+    def publish():
+        if not client.wait_ready():
+            print('[ERROR] Could not connect to Discord')
+            return
+        client.queue.start() #transfers left over from an interrupted run are resumed too
+        asyncio.run_coroutine_threadsafe(server.serve(), client.session.getLoop()).result()
+        print('[DONE] Daemon ready, stop it with Ctrl+C or python ds.py --daemon-stop')
+    threading.Thread(target=publish, daemon=True).start()
     try:
-        # Download the file utility
-        url = "https://github.com/julian-r/file-windows/releases/download/v5.44/file_5.44-build104-vs2022-x64.zip"
-        zip_path = "file_utility.zip"
-        
-        print("⬇️  Downloading file utility...")
-        urllib.request.urlretrieve(url, zip_path)
-        
-        # Extract the zip file
-        print("📂 Extracting file utility...")
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall()
-        
-        # Move files to the correct location if needed
-        extracted_files = ["file.exe", "magic.mgc", "libmagic.dll"]
-        for file_name in extracted_files:
-            if os.path.exists(file_name):
-                continue
-            # Look for the file in subdirectories
-            for root, dirs, files in os.walk("."):
-                if file_name in files:
-                    src = os.path.join(root, file_name)
-                    dst = os.path.join(os.getcwd(), file_name)
-                    shutil.move(src, dst)
-                    break
-        
-        # Clean up
-        os.remove(zip_path)
-        
-        # Clean up any extracted directories
-        for item in os.listdir("."):
-            if os.path.isdir(item) and item.startswith("file_"):
-                shutil.rmtree(item)
-        
-        print("✅ File utility setup complete")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Failed to setup file utility: {str(e)}")
-        return False
+        client.start()
+    finally:
+        server.close()
 
-def detect_file_type(file_path):
-    """Detect file type using the Windows file utility"""
-    if not os.path.exists(FILE_UTILITY_PATH):
-        if not setup_file_utility():
-            return "unknown"
-    
+#Mounts the stored files read-only at mountpoint (Linux, needs fusepy and libfuse)
+#and blocks until it is unmounted with fusermount -u or Ctrl+C.
+def runmount(client,mountpoint):
+    from discordstorage.fusemount import FUSE_AVAILABLE, mount
+    if not FUSE_AVAILABLE:
+        print('[ERROR] FUSE is not available, install it with: pip install fusepy (and libfuse, e.g. apt install fuse3)')
+        return
+    if not os.path.isdir(mountpoint):
+        print('[ERROR] Mount point ' + mountpoint + ' is not a directory')
+        return
+    threading.Thread(target=client.start, daemon=True).start()
+    if not client.wait_ready():
+        print('[ERROR] Could not connect to Discord')
+        return
+    client.queue.start() #compressed files are fetched as download jobs
     try:
-        # Run file.exe to detect file type
-        result = subprocess.run([FILE_UTILITY_PATH, "-b", file_path], 
-                              capture_output=True, text=True, timeout=10)
-        
-        if result.returncode == 0:
-            file_type = result.stdout.strip()
-            return file_type
+        mount(client,mountpoint)
+    finally:
+        client.logout()
+
+#Returns a client for the daemon serving this directory, or None (also with --no-daemon).
+def connect_daemon(inp):
+    if '--no-daemon' in inp or not os.path.isfile('daemon.discord'):
+        return None
+    from discordstorage.daemon import DaemonClient
+    return DaemonClient.connect(os.getcwd())
+
+#Follows daemon jobs until they finish and prints the outcome of each,
+#or just prints their IDs with --detach. Ctrl+C stops following, not the jobs.
+def followjobs(daemon,ids,inp):
+    if '--detach' in inp:
+        print(f'[QUEUED] {len(ids)} transfer(s): ' + ' '.join(ids))
+        return
+    def on_progress(jobs):
+        done = sum(job['bytes_done'] for job in jobs)
+        total = sum(job['bytes_total'] for job in jobs) or 1
+        running = sum(1 for job in jobs if job['state'] == 'running')
+        print(f'\r[PROGRESS] {done / total * 100:5.1f}% | {running} running | {len(jobs)} total', end='', flush=True)
+    try:
+        jobs = daemon.wait(ids, on_progress)
+    except KeyboardInterrupt:
+        print('\n[INFO] Transfers continue in the daemon, see python ds.py --status')
+        return
+    print()
+    for job in jobs:
+        if job['state'] == 'done':
+            print(f"[DONE] {job['name']} ({GetHumanReadable(job['bytes_total'])})")
         else:
-            return "unknown"
-            
-    except Exception as e:
-        print(f"⚠️  File type detection failed: {str(e)}")
-        return "unknown"
+            print(f"[ERROR] {job['name']}: {job['state']} {job['error'] or ''}")
 
-def guess_file_extension(file_type):
-    """Guess file extension based on file type description"""
-    file_type_lower = file_type.lower()
-    
-    # Common file type mappings
-    extension_map = {
-        'jpeg': '.jpg',
-        'jpg': '.jpg',
-        'png': '.png',
-        'gif': '.gif',
-        'webp': '.webp',
-        'bmp': '.bmp',
-        'bitmap': '.bmp',
-        'tiff': '.tiff',
-        'svg': '.svg',
-        'ico': '.ico',
-        'pdf': '.pdf',
-        'zip': '.zip',
-        'rar': '.rar',
-        '7-zip': '.7z',
-        'tar': '.tar',
-        'gzip': '.gz',
-        'bzip2': '.bz2',
-        'microsoft word': '.docx',
-        'microsoft excel': '.xlsx',
-        'microsoft powerpoint': '.pptx',
-        'openoffice': '.odt',
-        'mp4': '.mp4',
-        'avi': '.avi',
-        'mkv': '.mkv',
-        'mov': '.mov',
-        'wmv': '.wmv',
-        'flv': '.flv',
-        'webm': '.webm',
-        'm4v': '.m4v',
-        'mp3': '.mp3',
-        'wav': '.wav',
-        'flac': '.flac',
-        'aac': '.aac',
-        'ogg': '.ogg',
-        'm4a': '.m4a',
-        'wma': '.wma',
-        'executable': '.exe',
-        'pe32': '.exe',
-        'pe32+': '.exe',
-        'msi': '.msi',
-        'dll': '.dll',
-        'text': '.txt',
-        'ascii': '.txt',
-        'utf-8': '.txt',
-        'html': '.html',
-        'xml': '.xml',
-        'json': '.json',
-        'csv': '.csv',
-        'python': '.py',
-        'javascript': '.js',
-        'css': '.css',
-        'java': '.java',
-        'c source': '.c',
-        'c++': '.cpp',
-        'c#': '.cs',
-        'php': '.php',
-        'ruby': '.rb',
-        'shell': '.sh',
-        'batch': '.bat',
-        'powershell': '.ps1',
-        'sql': '.sql',
-        'iso': '.iso',
-        'sqlite': '.db',
-        'database': '.db',
-        'font': '.ttf',
-        'truetype': '.ttf',
-        'opentype': '.otf',
-        'postscript': '.ps',
-        'epub': '.epub',
-        'mobi': '.mobi',
-        'rtf': '.rtf',
-        'xps': '.xps',
-        'sketch': '.sketch',
-        'psd': '.psd',
-        'ai': '.ai',
-        'eps': '.eps',
-        'dxf': '.dxf',
-        'dwg': '.dwg',
-        'step': '.step',
-        'stl': '.stl',
-        'obj': '.obj',
-        'fbx': '.fbx',
-        'blend': '.blend',
-        'unity': '.unity',
-        'apk': '.apk',
-        'ipa': '.ipa',
-        'deb': '.deb',
-        'rpm': '.rpm',
-        'dmg': '.dmg',
-        'pkg': '.pkg'
-    }
-    
-    # Try to find a matching extension
-    for file_format, ext in extension_map.items():
-        if file_format in file_type_lower:
-            return ext
-    
-    return '.unknown'
+#Prints the transfers known to the daemon.
+def printjobs(daemon):
+    jobs = daemon.request('jobs')
+    if not jobs:
+        print('No transfers')
+    for job in jobs:
+        print(f"{job['id']} | {job['kind']} | {job['state']} | {job['progress'] * 100:.1f}% | {job['name']}")
+
+#Writes the progress events of client's transfers as JSON lines to the
+#file given with --events ('-' for standard output).
+def setup_events(client,inp):
+    target = option_value(inp,'--events')
+    if target:
+        from discordstorage.events import JsonLinesSink
+        client.events.subscribe(JsonLinesSink(sys.stdout if target == '-' else target))
+
+#Applies --limit-rate RATE and --schedule WINDOWS to the direction ('download'
+#or 'upload') of client's transfers. Returns False after printing a bad value.
+def setup_limits(client,inp,direction):
+    from discordstorage.throttle import parse_rate, parse_schedule
+    try:
+        rate = option_value(inp,'--limit-rate')
+        if rate:
+            client.bandwidth.set_rate(parse_rate(rate),direction)
+        schedule = option_value(inp,'--schedule')
+        if schedule:
+            client.bandwidth.set_schedule(parse_schedule(schedule),direction)
+    except ValueError as e:
+        print(f'\n[ERROR] {e}\n')
+        return False
+    return True
+
+#Caps each daemon job in ids at --limit-rate, if given.
+def limit_daemon_jobs(daemon,ids,inp):
+    rate = option_value(inp,'--limit-rate')
+    if rate:
+        for job_id in ids:
+            daemon.request('limits',job=job_id,rate=rate)
+    return ids
+
+#Shows the daemon's bandwidth limits after applying KEY=VALUE changes from args.
+def setlimits(daemon,args):
+    from discordstorage.throttle import format_rate
+    changes = {}
+    for arg in args:
+        if arg.startswith('-'):
+            break
+        key, _, value = arg.partition('=')
+        changes[key.replace('-','_')] = value
+    limits = daemon.request('limits',**changes)
+    for direction, limit in limits.items():
+        line = f"{direction}: {format_rate(limit['current'])} now | set {format_rate(limit['rate'])} | per client {format_rate(limit['client_rate'])}"
+        print(line + (f" | schedule {limit['schedule']}" if limit['schedule'] else ''))
+
+#Returns the value of a "--name VALUE" or "--name=VALUE" option, or default.
+def option_value(inp,name,default=None):
+    for i, arg in enumerate(inp):
+        if arg.startswith(name + '='):
+            return arg.split('=',1)[1]
+        if arg == name and i + 1 < len(inp):
+            return inp[i+1]
+    return default
+
+#Resolves download arguments (file codes, --all, --match PATTERN) into file codes.
+def select_download_codes(args):
+    import fnmatch
+    files = FILES or {}
+    valued = ['--match','--jobs','--connections','--limit-rate','--schedule','--events']
+    codes = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == '--all':
+            codes.extend(files.keys())
+        elif arg == '--match' or arg.startswith('--match='):
+            pattern = arg.split('=',1)[1] if '=' in arg else (args[i+1] if i + 1 < len(args) else '')
+            codes.extend(code for code, record in files.items() if record and fnmatch.fnmatch(record[0], pattern))
+        elif arg.startswith('--'):
+            pass # transfer options, read with option_value
+        elif arg.startswith('-'):
+            break
+        elif arg in files:
+            codes.append(arg)
+        else:
+            print(f'\n[ERROR] File code not found: {arg}\n')
+        i += 2 if arg in valued else 1
+    seen = set()
+    selected = []
+    for code in codes:
+        if code not in seen and files.get(code):
+            seen.add(code)
+            selected.append(code)
+    return selected
+
+#Resolves download arguments (file codes, --all, --match PATTERN) into file records.
+def select_download_records(args):
+    return [FILES[code] for code in select_download_codes(args)]
 
 def print_url_help():
     """Print helpful information about getting fresh Discord URLs"""
@@ -260,60 +282,13 @@ def print_url_help():
     print()
     print("💡 TIPS:")
     print("   • Discord CDN URLs expire after some time")
+    print("   • Files in config.discord don't need this: -d refreshes expired URLs automatically")
     print("   • Always copy the complete URL (don't truncate)")
     print("   • Hash file should end with .hash")
     print("   • Chunk files should end with .0, .1, .2, etc.")
     print("   • Make sure you have all chunk files")
     print("="*60)
 
-def calculate_file_hash(file_path):
-    """Calculate MD5 hash of a file"""
-    md5 = hashlib.md5()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            md5.update(chunk)
-    return md5.hexdigest()
-
-def download_url_to_file(url, output_path):
-    """Download a file from a URL with better error handling"""
-    try:
-        print(f"⬇️  Downloading from URL...")
-        
-        # Add headers that might help with Discord CDN
-        req = urllib.request.Request(url)
-        req.add_header('User-Agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
-        req.add_header('Accept', '*/*')
-        req.add_header('Accept-Language', 'en-US,en;q=0.9')
-        req.add_header('Accept-Encoding', 'gzip, deflate, br')
-        req.add_header('Connection', 'keep-alive')
-        req.add_header('Upgrade-Insecure-Requests', '1')
-        
-        with urllib.request.urlopen(req, timeout=30) as response:
-            with open(output_path, 'wb') as f:
-                shutil.copyfileobj(response, f)
-        
-        file_size = os.path.getsize(output_path)
-        print(f"✅ Downloaded {file_size} bytes")
-        return True
-        
-    except urllib.error.HTTPError as e:
-        if e.code == 403:
-            print(f"❌ Download failed: Access forbidden (403)")
-            print(f"⚠️  The Discord CDN link has likely expired!")
-            print(f"💡 Discord CDN links expire after a certain time period.")
-            print(f"📋 You may need to get fresh URLs from Discord.")
-        elif e.code == 404:
-            print(f"❌ Download failed: File not found (404)")
-        else:
-            print(f"❌ Download failed: HTTP Error {e.code}: {e.reason}")
-        return False
-    except urllib.error.URLError as e:
-        print(f"❌ Download failed: Network error - {str(e)}")
-        return False
-    except Exception as e:
-        print(f"❌ Download failed: {str(e)}")
-        return False
-
 def recover_files(file_id, hash_url, *chunk_urls):
     """Recover files from URLs and add to config file"""
     print(f"🔄 Starting file recovery for ID: {file_id}")
@@ -321,87 +296,55 @@ def recover_files(file_id, hash_url, *chunk_urls):
     print(f"📦 Chunk URLs: {len(chunk_urls)} chunks")
     print("-" * 50)
     
-    # Create recovery directory
-    recovery_dir = os.path.join(os.getcwd(), "recovery")
-    os.makedirs(recovery_dir, exist_ok=True)
+    # The bot token (if configured) lets the engine refresh expired URLs
+    token, room = "", "0"
+    if isConfigured():
+        try:
+            with open('config.discord', 'r') as f:
+                bot_info = json.loads(f.readline())
+            token, room = bot_info['TOKEN'], bot_info['ROOM_ID']
+        except Exception:
+            pass
     
-    # Download hash file
-    hash_file_path = os.path.join(recovery_dir, f"{file_id}.hash")
-    print("📥 Downloading hash file...")
-    if not download_url_to_file(hash_url, hash_file_path):
-        print("❌ Failed to download hash file")
+    # Chunks are fetched concurrently straight into downloads/, hashed as they
+    # stream in; an interrupted recovery resumes when run again
+    client = newcore(token, room)
+    record, report = client.recover(f"{file_id}.unknown", hash_url, chunk_urls)
+    if record is None:
+        print("❌ Cannot proceed with file recovery - all chunks are required")
         print_url_help()
         return False
-    
-    # Read expected hash
-    try:
-        with open(hash_file_path, 'r') as f:
-            expected_hash = f.read().strip()
-        print(f"✅ Expected hash: {expected_hash}")
-    except Exception as e:
-        print(f"❌ Failed to read hash file: {str(e)}")
-        return False
-    
-    # Download all chunks
-    chunk_files = []
-    failed_chunks = []
-    
-    for i, chunk_url in enumerate(chunk_urls):
-        chunk_path = os.path.join(recovery_dir, f"{file_id}.{i}")
-        print(f"📥 Downloading chunk {i+1}/{len(chunk_urls)}...")
-        if download_url_to_file(chunk_url, chunk_path):
-            chunk_files.append(chunk_path)
-            print(f"✅ Chunk {i+1} downloaded successfully")
-        else:
-            failed_chunks.append(i+1)
-            print(f"❌ Failed to download chunk {i+1}")
-    
-    if failed_chunks:
-        print(f"\n❌ Failed to download {len(failed_chunks)} chunk(s): {', '.join(map(str, failed_chunks))}")
-        print("💡 Cannot proceed with file recovery - all chunks are required")
-        return False
-    
-    # Combine chunks into single file
-    recovered_file_path = os.path.join(recovery_dir, f"{file_id}.unknown")
-    print("🔧 Combining chunks...")
-    try:
-        with open(recovered_file_path, 'wb') as output_file:
-            for chunk_file in chunk_files:
-                with open(chunk_file, 'rb') as input_file:
-                    shutil.copyfileobj(input_file, output_file)
-        
-        file_size = os.path.getsize(recovered_file_path)
-        print(f"✅ Chunks combined successfully ({file_size} bytes)")
-    except Exception as e:
-        print(f"❌ Failed to combine chunks: {str(e)}")
-        return False
+    recovered_file_path = os.path.join(os.getcwd(), "downloads", record[0])
+    downloads_dir = os.path.dirname(recovered_file_path)
     
     # Verify hash
-    print("🔍 Verifying file hash...")
-    actual_hash = calculate_file_hash(recovered_file_path)
-    if actual_hash == expected_hash:
+    expected_hash = report.get('expected_hash')
+    actual_hash = report.get('actual_hash')
+    if expected_hash and actual_hash == expected_hash:
         print(f"✅ Hash verification successful: {actual_hash}")
     else:
-        print(f"❌ Hash verification failed!")
-        print(f"   Expected: {expected_hash}")
-        print(f"   Actual:   {actual_hash}")
-        print("⚠️  File may be corrupted!")
+        if expected_hash:
+            print(f"❌ Hash verification failed!")
+            print(f"   Expected: {expected_hash}")
+            print(f"   Actual:   {actual_hash}")
+            print("⚠️  File may be corrupted!")
+        else:
+            print("❌ Failed to download hash file, the file could not be verified")
+            print_url_help()
         
         # Ask user if they want to continue anyway
-        response = input("❓ Continue with corrupted file? (y/n): ").lower().strip()
+        response = input("❓ Continue with unverified file? (y/n): ").lower().strip()
         if response not in ['y', 'yes']:
             print("🛑 Recovery aborted by user")
             return False
         else:
             print("⚠️  Continuing with potentially corrupted file...")
     
-    # Detect file type
+    # Detect file type from the head of the first chunk the engine already fetched
     print("🔎 Scanning file type...")
-    file_type = detect_file_type(recovered_file_path)
+    from discordstorage import filetype
+    file_type, guessed_ext = filetype.sniff(report.get('head', b''))
     print(f"📋 Detected file type: {file_type}")
-    
-    # Guess extension
-    guessed_ext = guess_file_extension(file_type)
     print(f"💡 Suggested extension: {guessed_ext}")
     
     # Ask user if they want to rename the file
@@ -409,9 +352,9 @@ def recover_files(file_id, hash_url, *chunk_urls):
         response = input(f"🤔 We think the file type is \"{guessed_ext[1:].upper()}\" - rename it? (y/n): ").lower().strip()
         if response in ['y', 'yes']:
             new_name = f"{file_id}{guessed_ext}"
-            new_path = os.path.join(recovery_dir, new_name)
+            new_path = os.path.join(downloads_dir, new_name)
             try:
-                os.rename(recovered_file_path, new_path)
+                os.replace(recovered_file_path, new_path)
                 recovered_file_path = new_path
                 print(f"✅ File renamed to: {new_name}")
             except Exception as e:
@@ -428,98 +371,51 @@ def recover_files(file_id, hash_url, *chunk_urls):
             
             if manual_ext and len(manual_ext) > 1:
                 new_name = f"{file_id}{manual_ext}"
-                new_path = os.path.join(recovery_dir, new_name)
+                new_path = os.path.join(downloads_dir, new_name)
                 try:
-                    os.rename(recovered_file_path, new_path)
+                    os.replace(recovered_file_path, new_path)
                     recovered_file_path = new_path
                     print(f"✅ File renamed to: {new_name}")
                 except Exception as e:
                     print(f"⚠️  Failed to rename file: {str(e)}")
     
-    # Clean up temporary files
-    try:
-        os.remove(hash_file_path)
-        for chunk_file in chunk_files:
-            os.remove(chunk_file)
-        print("🧹 Cleaned up temporary files")
-    except Exception as e:
-        print(f"⚠️  Could not clean up some temporary files: {str(e)}")
-      # Move to downloads folder
-    downloads_dir = os.path.join(os.getcwd(), "downloads")
-    os.makedirs(downloads_dir, exist_ok=True)
-    final_path = os.path.join(downloads_dir, os.path.basename(recovered_file_path))
+    print(f"📁 File recovered and saved to: downloads/{os.path.basename(recovered_file_path)}")
     
-    try:
-        shutil.move(recovered_file_path, final_path)
-        print(f"📁 File recovered and saved to: downloads/{os.path.basename(final_path)}")
-        
-        # Add recovered file to config.discord if it exists
-        if isConfigured():
-            try:                # Read current config
-                with open('config.discord', 'r') as f:
-                    first_line = f.readline()
-                    second_line = f.readline()
-                
-                # Ensure we have both lines
-                if not first_line.strip():
-                    raise Exception("Invalid config file - missing bot configuration")
-                
-                if not second_line.strip():
-                    second_line = "{}"  # Empty files database
-                  # Parse the files data
-                files_data = json.loads(second_line) if second_line.strip() else {}
-                
-                # Check if file_id already exists
-                if file_id in files_data:
-                    print(f"⚠️  File ID {file_id} already exists in config database")
-                    response = input(f"   Overwrite existing entry? (y/n): ").lower().strip()
-                    if response not in ['y', 'yes']:
-                        print("   File recovered but not added to database to avoid overwriting existing entry")
-                        print("🎉 Recovery completed successfully!")
-                        return True
-                
-                # Get file stats
-                file_size = os.path.getsize(final_path)
-                filename = os.path.basename(final_path)
-                
-                # Create file record in the same format as uploads
-                # [filename, size, urls, hash_url, file_hash]
-                file_record = [
-                    filename,
-                    file_size,
-                    list(chunk_urls),  # Convert tuple to list for JSON serialization
-                    hash_url,
-                    expected_hash
-                ]
-                
-                # Add to files data with the provided file_id
-                files_data[file_id] = file_record
-                
-                # Write updated config back
-                with open('config.discord', 'w') as f:
-                    f.write(first_line)
-                    f.write(json.dumps(files_data))
-                
-                print(f"💾 File added to config database with ID: {file_id}")
-                print(f"📋 You can now use: python ds.py -d {file_id} to re-download this file")
-                
-            except Exception as e:
-                print(f"⚠️  Could not add file to config database: {str(e)}")
-                print("   File recovery was successful, but file won't appear in -list")
-        else:
-            print("💡 No config.discord file found - file recovered but not added to database")
-            print("   Create a config file to manage recovered files with ds.py commands")
-        
-        print("🎉 Recovery completed successfully!")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Failed to move file to downloads: {str(e)}")
-        print(f"📁 File is available at: {recovered_file_path}")
-        return True  # Still consider it successful
+    # Add recovered file to config.discord if it exists
+    if isConfigured():
+        try:
+            catalog = client.catalog
+            catalog.reload_if_changed()
+            
+            # Check if file_id already exists
+            if file_id in catalog:
+                print(f"⚠️  File ID {file_id} already exists in config database")
+                response = input(f"   Overwrite existing entry? (y/n): ").lower().strip()
+                if response not in ['y', 'yes']:
+                    print("   File recovered but not added to database to avoid overwriting existing entry")
+                    print("🎉 Recovery completed successfully!")
+                    return True
+            
+            # Same record format as uploads: [filename, size, urls, hash_url, file_hash, meta]
+            # (the urls may have been refreshed during recovery)
+            record[0] = os.path.basename(recovered_file_path)
+            catalog.add(file_id, record)
+            
+            print(f"💾 File added to config database with ID: {file_id}")
+            print(f"📋 You can now use: python ds.py -d {file_id} to re-download this file")
+            
+        except Exception as e:
+            print(f"⚠️  Could not add file to config database: {str(e)}")
+            print("   File recovery was successful, but file won't appear in -list")
+    else:
+        print("💡 No config.discord file found - file recovered but not added to database")
+        print("   Create a config file to manage recovered files with ds.py commands")
+    
+    print("🎉 Recovery completed successfully!")
+    return True
 
 def parseArgs(inp):
-    commands = ['-h','-help','-l','-list','-d','-download','-u','-upload','-r','-recover','-s','-smb','-samba']
+    commands = ['-h','-help','-l','-list','-d','-download','-u','-upload','-r','-recover','-s','-smb','-samba','--rebuild-index','--daemon','--daemon-stop','--status','--limits','--mount']
     if(len(inp) == 1):
         print('----------------------\n|DiscordStorage v2.0 |')
         print('|Enhanced Fork       |\n----------------------')
@@ -527,39 +423,129 @@ def parseArgs(inp):
         print('COMMANDS:')
         print('[-h, -help] :: Show the current message')
         print('[-l, -list] :: Lists all the file informations that has been uploaded to the server.')
-        print('[-d, -download] (FILE CODE) :: Downloads a file from the server. A filecode is taken in as the file identifier.')
-        print('[-u, -upload] (FILE DIRECTORY) :: Uploads a file to the server. The full file directory is taken in for the argument.')
+        print('[-d, -download] (FILE CODES...) :: Downloads files from the server. File codes are taken in as the file identifiers.')
+        print('    --all | --match PATTERN :: Restore every file, or every file whose name matches PATTERN.')
+        print('    --jobs N | --connections N :: Files in parallel (default 2), CDN connection cap (default 8).')
+        print('[-u, -upload] (FILES, DIRECTORIES or GLOBS...) :: Uploads files to the server. Directories are uploaded recursively through one connection.')
+        print('    --jobs N :: Number of files uploaded at the same time (default 3).')
+        print('    --cdc :: Split the upload at content-defined boundaries so unchanged parts of a file are never re-sent.')
+        print('    --compress[=zstd|zlib|lzma] :: Compress before chunking (skipped automatically if the file does not compress).')
+        print('    --limit-rate RATE | --schedule HH:MM-HH:MM=RATE,... :: (-d and -u) Bandwidth cap e.g. 20M, and caps by time of day (0 = unlimited). Per transfer when a daemon runs them.')
+        print('    --events FILE :: (-d and -u) Also write progress events as JSON lines to FILE (- for standard output).')
         print('[-r, -recover] (FILE ID) (HASH URL) (CHUNK URLs...) :: Recover a lost file from Discord URLs.')
+        print('[--rebuild-index] :: Rebuild config.discord from the files in the storage channel (resumable).')
+        print('[--daemon] :: Keep one Discord connection open; -l, -d and -u in this directory then go through it and start instantly.')
+        print('    --status | --daemon-stop :: Show the daemon\'s transfers, or stop it. --detach on -d/-u returns once queued, --no-daemon bypasses it.')
+        print('[--mount] (DIRECTORY) :: Mount the stored files read-only with FUSE (Linux, needs fusepy); reads fetch only the chunks they need.')
+        print('    --limits [download=RATE] [upload=RATE] [client-download=RATE] [client-upload=RATE] [schedule-upload=WINDOWS] ... :: Show or change the daemon\'s bandwidth limits while it runs.')
         print('[-s, -smb, -samba] :: Start unified server with web interface and/or SMB/CIFS network file sharing.\n')
     elif isConfigured():
         f = open('config.discord','r')
         first = f.readline()
         second = f.readline()
+        rest = f.read().strip() #directories line, see discordstorage/catalog.py
         f.close()
         TOKEN_SECRET = json.loads(first.replace("\\n",""))['TOKEN']
         for el in inp:
             if '-d' == el or '-download' == el:
-                if not ((not(FILES == None)) and (inp[inp.index(el)+1] in FILES.keys())):
+                if len(inp) <= inp.index(el) + 1:
+                    raise IndexError
+                codes = select_download_codes(inp[inp.index(el)+1:])
+                records = [FILES[code] for code in codes]
+                daemon = connect_daemon(inp)
+                if not records:
                     print('\n[ERROR] File code not found\n')
+                elif daemon:
+                    for obj in records:
+                        print('DOWNLOADING: ' + obj[0] + ' | SIZE: ' + GetHumanReadable(obj[1]))
+                    followjobs(daemon,limit_daemon_jobs(daemon,daemon.request('download',codes=codes),inp),inp)
                 else:
-                    obj = json.loads(second)[inp[inp.index(el)+1]]
-                    print('DOWNLOADING: ' + obj[0] )
-                    print('SIZE: ' + GetHumanReadable(obj[1]))
-                    client = core.Core(os.getcwd() + "/",TOKEN_SECRET,ROOM_ID)
-                    threading.Thread(target=telldownload,args=(client,obj,)).start()
+                    for obj in records:
+                        print('DOWNLOADING: ' + obj[0] + ' | SIZE: ' + GetHumanReadable(obj[1]))
+                    client = newcore()
+                    client.max_connections = max(1, int(option_value(inp,'--connections',client.max_connections)))
+                    if not setup_limits(client,inp,'download'):
+                        break
+                    concurrency = max(1, int(option_value(inp,'--jobs',2)))
+                    setup_events(client,inp)
+                    threading.Thread(target=telldownload,args=(client,records,concurrency,)).start()
                     client.start()
-                    break
+                break
             elif '-u' == el or '-upload' == el:
-                print('UPLOADING: ' + inp[inp.index(el)+1])
-                client = core.Core(os.getcwd() + "/",TOKEN_SECRET,ROOM_ID)
-                threading.Thread(target=tellupload,args=(first,second,inp[inp.index(el)+1],genCode(),client,)).start()
+                patterns = []
+                for arg in inp[inp.index(el)+1:]:
+                    if arg.startswith('-'):
+                        break
+                    patterns.append(arg)
+                if not patterns:
+                    raise IndexError
+                print('UPLOADING: ' + ', '.join(patterns))
+                chunking = 'cdc' if '--cdc' in inp else 'fixed'
+                compression = None
+                for arg in inp:
+                    if arg == '--compress' or arg.startswith('--compress='):
+                        compression = arg.split('=',1)[1] if '=' in arg else 'auto'
+                daemon = connect_daemon(inp)
+                if daemon:
+                    targets = [[os.path.abspath(path), name] for path, name in iter_upload_targets(patterns)]
+                    ids = daemon.request('upload',targets=targets,chunking=chunking,compression=compression)
+                    followjobs(daemon,limit_daemon_jobs(daemon,ids,inp),inp)
+                    break
+                client = newcore()
+                if not setup_limits(client,inp,'upload'):
+                    break
+                concurrency = max(1, int(option_value(inp,'--jobs',3)))
+                setup_events(client,inp)
+                threading.Thread(target=tellupload,args=(client,iter_upload_targets(patterns),chunking,compression,concurrency,)).start()
                 client.start()
                 break
+            elif '--rebuild-index' == el:
+                print('REBUILDING CATALOG FROM CHANNEL HISTORY')
+                client = newcore()
+                threading.Thread(target=tellrebuild,args=(client,)).start()
+                client.start()
+                break
+            elif '--daemon' == el:
+                if connect_daemon(inp):
+                    print('[ERROR] A daemon is already running for this directory')
+                    break
+                print('STARTING DAEMON')
+                rundaemon(newcore())
+                break
+            elif '--limits' == el:
+                daemon = connect_daemon(inp)
+                if not daemon:
+                    print('[ERROR] No daemon is running for this directory')
+                else:
+                    try:
+                        setlimits(daemon,inp[inp.index(el)+1:])
+                    except Exception as e:
+                        print(f'[ERROR] {e}')
+                break
+            elif '--mount' == el:
+                if len(inp) <= inp.index(el) + 1:
+                    raise IndexError
+                runmount(newcore(),inp[inp.index(el)+1])
+                break
+            elif '--daemon-stop' == el or '--status' == el:
+                daemon = connect_daemon(inp)
+                if not daemon:
+                    print('[ERROR] No daemon is running for this directory')
+                elif el == '--status':
+                    printjobs(daemon)
+                else:
+                    daemon.request('shutdown')
+                    print('[DONE] Daemon stopped')
+                break
             elif '-list' == el or '-l' == el:
-                if not (FILES == None):
+                files = FILES
+                daemon = connect_daemon(inp)
+                if daemon:
+                    files = daemon.request('list') #includes uploads the daemon finished since startup
+                if not (files == None):
                     print('\nFILES UPLOADED TO DISCORD:\n')
-                    for key in FILES.keys():
-                        if FILES[key] == None:   
+                    for key in files.keys():
+                        if files[key] == None:   
                             #correct nullfied attribute
                             print(' [CONSOLE] Removed incorrect file with filecode ' + str(key))
                             f = open('config.discord','w')
@@ -567,10 +553,12 @@ def parseArgs(inp):
                             jobject = json.loads(second)
                             del jobject[key]
                             f.write(json.dumps(jobject))
+                            if rest:
+                                f.write('\n' + rest)
                             f.close()
                         else:
                             # Handle both old format [name, size, urls] and new format [name, size, urls, hash_url, hash]
-                            file_info = FILES[key]
+                            file_info = files[key]
                             name = str(file_info[0])
                             size = GetHumanReadable(file_info[1])
                             hash_info = ""
@@ -586,9 +574,21 @@ def parseArgs(inp):
                 print('COMMANDS:')
                 print('[-h, -help] :: Show the current message')
                 print('[-l, -list] :: Lists all the file informations that has been uploaded to the server.')
-                print('[-d, -download] (FILE CODE) :: Downloads a file from the server. A filecode is taken in as the file identifier.')
-                print('[-u, -upload] (FILE DIRECTORY) :: Uploads a file to the server. The full file directory is taken in for the argument.')
+                print('[-d, -download] (FILE CODES...) :: Downloads files from the server. File codes are taken in as the file identifiers.')
+                print('    --all | --match PATTERN :: Restore every file, or every file whose name matches PATTERN.')
+                print('    --jobs N | --connections N :: Files in parallel (default 2), CDN connection cap (default 8).')
+                print('[-u, -upload] (FILES, DIRECTORIES or GLOBS...) :: Uploads files to the server. Directories are uploaded recursively through one connection.')
+                print('    --jobs N :: Number of files uploaded at the same time (default 3).')
+                print('    --cdc :: Split the upload at content-defined boundaries so unchanged parts of a file are never re-sent.')
+                print('    --compress[=zstd|zlib|lzma] :: Compress before chunking (skipped automatically if the file does not compress).')
+                print('    --limit-rate RATE | --schedule HH:MM-HH:MM=RATE,... :: (-d and -u) Bandwidth cap e.g. 20M, and caps by time of day (0 = unlimited). Per transfer when a daemon runs them.')
+                print('    --events FILE :: (-d and -u) Also write progress events as JSON lines to FILE (- for standard output).')
                 print('[-r, -recover] (FILE ID) (HASH URL) (CHUNK URLs...) :: Recover a lost file from Discord URLs.')
+                print('[--rebuild-index] :: Rebuild config.discord from the files in the storage channel (resumable).')
+                print('[--daemon] :: Keep one Discord connection open; -l, -d and -u in this directory then go through it and start instantly.')
+                print('    --status | --daemon-stop :: Show the daemon\'s transfers, or stop it. --detach on -d/-u returns once queued, --no-daemon bypasses it.')
+                print('[--mount] (DIRECTORY) :: Mount the stored files read-only with FUSE (Linux, needs fusepy); reads fetch only the chunks they need.')
+                print('    --limits [download=RATE] [upload=RATE] [client-download=RATE] [client-upload=RATE] [schedule-upload=WINDOWS] ... :: Show or change the daemon\'s bandwidth limits while it runs.')
                 print('[-s, -smb, -samba] :: Start unified server with web interface and/or SMB/CIFS network file sharing.\n')
             elif '-r' == el or '-recover' == el:
                 # Handle recovery command: ds.py -r <id> <hash_url> <chunk1> <chunk2> ...
@@ -783,70 +783,88 @@ def parseArgs(inp):
                         print("   For SMB: Run as administrator (Windows) or with sudo (Linux)")
                 break
 
-if not isConfigured():
-    # Check if this is a recovery command first (doesn't need config)
-    if len(sys.argv) > 1 and (sys.argv[1] == '-r' or sys.argv[1] == '-recover'):
-        try:
-            if len(sys.argv) < 5:  # Need at least: script, -r, id, hash_url, and one chunk
-                print('\n[ERROR] Recovery command requires: file_id, hash_url, and at least one chunk URL\n')
-                print('Usage: python ds.py -r <file_id> <hash_url> <chunk_url1> [chunk_url2] ...\n')
-            else:
-                file_id = sys.argv[2]
-                hash_url = sys.argv[3]
-                chunk_urls = sys.argv[4:]  # All remaining arguments are chunk URLs
-                
-                # Validate inputs
-                if not file_id.isdigit():
-                    print(f'\n[ERROR] File ID must be numeric, got: {file_id}\n')
-                elif not hash_url.startswith('http'):
-                    print(f'\n[ERROR] Hash URL must be a valid HTTP URL\n')
+#Reads config.discord and runs the command in argv.
+def main(argv):
+    global TOKEN_SECRET,ROOM_ID,BOT_INFO,FILES
+    if not isConfigured():
+        # Check if this is a recovery command first (doesn't need config)
+        if len(argv) > 1 and (argv[1] == '-r' or argv[1] == '-recover'):
+            try:
+                if len(argv) < 5:  # Need at least: script, -r, id, hash_url, and one chunk
+                    print('\n[ERROR] Recovery command requires: file_id, hash_url, and at least one chunk URL\n')
+                    print('Usage: python ds.py -r <file_id> <hash_url> <chunk_url1> [chunk_url2] ...\n')
                 else:
-                    # Validate chunk URLs
-                    valid_chunks = True
-                    for i, chunk_url in enumerate(chunk_urls):
-                        if not chunk_url.startswith('http'):
-                            print(f'\n[ERROR] Chunk URL {i+1} must be a valid HTTP URL\n')
-                            valid_chunks = False
-                            break
+                    file_id = argv[2]
+                    hash_url = argv[3]
+                    chunk_urls = argv[4:]  # All remaining arguments are chunk URLs
+                
+                    # Validate inputs
+                    if not file_id.isdigit():
+                        print(f'\n[ERROR] File ID must be numeric, got: {file_id}\n')
+                    elif not hash_url.startswith('http'):
+                        print(f'\n[ERROR] Hash URL must be a valid HTTP URL\n')
+                    else:
+                        # Validate chunk URLs
+                        valid_chunks = True
+                        for i, chunk_url in enumerate(chunk_urls):
+                            if not chunk_url.startswith('http'):
+                                print(f'\n[ERROR] Chunk URL {i+1} must be a valid HTTP URL\n')
+                                valid_chunks = False
+                                break
                     
-                    if valid_chunks:
-                        # All URLs are valid, proceed with recovery
-                        print(f'\n🔄 Starting file recovery...')
-                        if recover_files(file_id, hash_url, *chunk_urls):
-                            print('\n✅ File recovery completed successfully!')
-                        else:
-                            print('\n❌ File recovery failed!')
+                        if valid_chunks:
+                            # All URLs are valid, proceed with recovery
+                            print(f'\n🔄 Starting file recovery...')
+                            if recover_files(file_id, hash_url, *chunk_urls):
+                                print('\n✅ File recovery completed successfully!')
+                            else:
+                                print('\n❌ File recovery failed!')
                         
-        except Exception as e:
-            print(f'\n[ERROR] Recovery failed: {str(e)}\n')
+            except Exception as e:
+                print(f'\n[ERROR] Recovery failed: {str(e)}\n')
+        else:
+            print('Welcome to DiscordStorage.')
+            print('Go to http://github.com/nigelchen/DiscordStorage for instructions.')
+            TOKEN_SECRET = input('Bot token ID (Will be stored in plaintext in config file):')
+            ROOM_ID = input ('Enter channel ID to store files in:')
+            if len(ROOM_ID) <=0:
+                ROOM_ID = None
+            f = open('config.discord','w')
+            f.write(str(json.dumps({'TOKEN':TOKEN_SECRET,'ROOM_ID':ROOM_ID})) + "\n")
+            f.write(str(json.dumps({})))
+            f.close()
     else:
-        print('Welcome to DiscordStorage.')
-        print('Go to http://github.com/nigelchen/DiscordStorage for instructions.')
-        TOKEN_SECRET = input('Bot token ID (Will be stored in plaintext in config file):')
-        ROOM_ID = input ('Enter channel ID to store files in:')
-        if len(ROOM_ID) <=0:
-            ROOM_ID = None
-        f = open('config.discord','w')
-        f.write(str(json.dumps({'TOKEN':TOKEN_SECRET,'ROOM_ID':ROOM_ID})) + "\n")
-        f.write(str(json.dumps({})))
+        f = open('config.discord','r')
+        first = f.readline()
+        second = f.readline()
+        BOT_INFO = json.loads(first)
+        FILES = json.loads(second)
+        TOKEN_SECRET = json.loads(first.replace("\\n",""))['TOKEN']
+        ROOM_ID = json.loads(first.replace("\\n",""))['ROOM_ID']
         f.close()
-else:
-    f = open('config.discord','r')
-    first = f.readline()
-    second = f.readline()
-    BOT_INFO = json.loads(first)
-    FILES = json.loads(second)
-    TOKEN_SECRET = json.loads(first.replace("\\n",""))['TOKEN']
-    ROOM_ID = json.loads(first.replace("\\n",""))['ROOM_ID']
-    f.close()
 
-try:
-    parseArgs(sys.argv)
-except IndexError:
-    print('\nUsage: python ds.py [command] (target)\n')
-    print('COMMANDS:')
-    print('[-h, -help] :: Show the help message')
-    print('[-l, -list] :: Lists all the file informations that has been uploaded to the server.')
-    print('[-d, -download] (FILE CODE) :: Downloads a file from the server. A filecode is taken in as the file identifier.')
-    print('[-u, -upload] (FILE DIRECTORY) :: Uploads a file to the server. The full file directory is taken in for the argument.')
-    print('[-r, -recover] (FILE ID) (HASH URL) (CHUNK URLs...) :: Recover a lost file from Discord URLs.\n')
+    try:
+        parseArgs(argv)
+    except IndexError:
+        print('\nUsage: python ds.py [command] (target)\n')
+        print('COMMANDS:')
+        print('[-h, -help] :: Show the help message')
+        print('[-l, -list] :: Lists all the file informations that has been uploaded to the server.')
+        print('[-d, -download] (FILE CODES...) :: Downloads files from the server. File codes are taken in as the file identifiers.')
+        print('    --all | --match PATTERN :: Restore every file, or every file whose name matches PATTERN.')
+        print('    --jobs N | --connections N :: Files in parallel (default 2), CDN connection cap (default 8).')
+        print('[-u, -upload] (FILES, DIRECTORIES or GLOBS...) :: Uploads files to the server. Directories are uploaded recursively through one connection.')
+        print('    --jobs N :: Number of files uploaded at the same time (default 3).')
+        print('    --cdc :: Split the upload at content-defined boundaries so unchanged parts of a file are never re-sent.')
+        print('    --compress[=zstd|zlib|lzma] :: Compress before chunking (skipped automatically if the file does not compress).')
+        print('    --limit-rate RATE | --schedule HH:MM-HH:MM=RATE,... :: (-d and -u) Bandwidth cap e.g. 20M, and caps by time of day (0 = unlimited). Per transfer when a daemon runs them.')
+        print('    --events FILE :: (-d and -u) Also write progress events as JSON lines to FILE (- for standard output).')
+        print('[-r, -recover] (FILE ID) (HASH URL) (CHUNK URLs...) :: Recover a lost file from Discord URLs.')
+        print('[--rebuild-index] :: Rebuild config.discord from the files in the storage channel (resumable).')
+        print('[--daemon] :: Keep one Discord connection open; -l, -d and -u in this directory then go through it and start instantly.')
+        print('    --status | --daemon-stop :: Show the daemon\'s transfers, or stop it. --detach on -d/-u returns once queued, --no-daemon bypasses it.')
+        print('[--mount] (DIRECTORY) :: Mount the stored files read-only with FUSE (Linux, needs fusepy); reads fetch only the chunks they need.')
+        print('    --limits [download=RATE] [upload=RATE] [client-download=RATE] [client-upload=RATE] [schedule-upload=WINDOWS] ... :: Show or change the daemon\'s bandwidth limits while it runs.\n')
+
+if __name__ == '__main__':
+    main(sys.argv)
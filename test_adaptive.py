@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Discord Storage Adaptive Concurrency Test
+AIMD limit fed with chunk timings of a link with a fixed per-request cost
+"""
+
+import sys
+import os
+import asyncio
+
+# Add the project directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from discordstorage.adaptive import AdaptiveLimit, CircuitBreaker
+
+FULL = 9000000
+REQUEST_COST = 0.2  # seconds every request pays whatever its size
+RATE = 10000000  # bytes/s
+
+
+def took(nbytes, slowdown=1.0):
+    return REQUEST_COST + slowdown * nbytes / RATE
+
+
+def report(limit, seconds, nbytes):
+    limit.decreased_at = float('-inf')  # no cooldown, every congestion signal counts
+    limit.success(seconds, nbytes)
+
+
+def test_small_files_and_last_chunks_do_not_shrink_the_limit():
+    """Full chunks, the short tail of a file and whole small files on an idle link"""
+    limit = AdaptiveLimit(initial=4, maximum=8)
+    for _ in range(50):
+        report(limit, took(FULL), FULL)
+        report(limit, took(1000000), 1000000)  # last chunk of a 10 MB file
+        report(limit, took(20000), 20000)  # a small file
+    assert limit.current == 8
+
+
+def test_small_files_first_then_full_chunks():
+    """The baseline of small files is not held against the first full chunks"""
+    limit = AdaptiveLimit(initial=4, maximum=8)
+    for _ in range(20):
+        report(limit, took(5000), 5000)
+    for _ in range(20):
+        report(limit, took(FULL), FULL)
+    assert limit.current == 8
+
+
+def test_full_chunks_slowing_down_still_count_as_congestion():
+    limit = AdaptiveLimit(initial=8, maximum=8)
+    for _ in range(5):
+        report(limit, took(FULL), FULL)
+    report(limit, took(FULL, slowdown=3.0), FULL)
+    assert limit.current == 4
+
+
+def test_breaker_ignores_failures_that_are_not_the_endpoints():
+    """A 403 or 404 neither closes an open circuit nor ends a half-open probe"""
+    breaker = CircuitBreaker('cdn', threshold=3, reset=0.05)
+    for _ in range(3):
+        breaker.failure('timeout')
+    assert breaker.state == breaker.OPEN
+    breaker.failure('http_403')
+    assert breaker.state == breaker.OPEN
+
+    asyncio.run(breaker.wait())
+    assert breaker.state == breaker.HALF_OPEN
+    breaker.failure('http_404')
+    assert breaker.state == breaker.HALF_OPEN
+    breaker.success()
+    assert breaker.state == breaker.CLOSED
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Discord Storage Catalog Test
+Directory tree of config.discord shared by threads and by several writers
+"""
+
+import sys
+import os
+import json
+import tempfile
+import threading
+
+# Add the project directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from discordstorage.catalog import Catalog
+
+
+def record(name):
+    return [name, 1, [], None, None, {}]
+
+
+def saved_dirs(path):
+    with open(path) as f:
+        lines = f.read().splitlines()
+    return json.loads(lines[2]) if len(lines) > 2 else {}
+
+
+def legacy_catalog(directory):
+    """config.discord written before directories were stored"""
+    path = os.path.join(directory, "config.discord")
+    with open(path, 'w') as f:
+        f.write(json.dumps({}) + '\n' + json.dumps({'1': record("photos/a.jpg")}))
+    return path
+
+
+def test_writers_of_a_legacy_catalog_share_implicit_dirs():
+    with tempfile.TemporaryDirectory() as directory:
+        path = legacy_catalog(directory)
+        first, second = Catalog(path), Catalog(path)
+        first.add('2', record("photos/b.jpg"))
+        second.add('3', record("photos/c.jpg"))
+        assert list(saved_dirs(path).values()) == [['0', 'photos']]
+
+        first.remove('1')
+        first.remove('2')
+        first.remove('3')
+        first.rmdir('/photos')
+        second.add('4', record("d.txt"))
+        assert saved_dirs(path) == {}
+        assert second.resolve('/photos') is None
+
+
+def test_unsaved_implicit_dirs_are_not_written_by_a_reload():
+    with tempfile.TemporaryDirectory() as directory:
+        path = legacy_catalog(directory)
+        Catalog(path)
+        with open(path) as f:
+            assert len(f.read().splitlines()) == 2
+
+
+def test_mkdir_under_an_implicit_dir_another_writer_saved():
+    with tempfile.TemporaryDirectory() as directory:
+        path = legacy_catalog(directory)
+        first, second = Catalog(path), Catalog(path)
+        second.add('2', record("b.txt"))
+        first.mkdir('/photos/2024')
+        dirs = saved_dirs(path)
+        photos = [dir_id for dir_id, entry in dirs.items() if entry == ['0', 'photos']]
+        assert len(photos) == 1
+        assert [photos[0], '2024'] in dirs.values()
+        assert second.resolve('/photos/2024')[0] == 'dir'
+
+
+def test_duplicate_dirs_from_older_versions_are_merged():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "config.discord")
+        with open(path, 'w') as f:
+            f.write(json.dumps({}) + '\n' + json.dumps({'1': record("photos/a.jpg")}) + '\n'
+                    + json.dumps({'aa': ['0', 'photos'], 'bb': ['0', 'photos'], 'cc': ['bb', '2024']}))
+        catalog = Catalog(path)
+        assert catalog.resolve('/photos/2024')[0] == 'dir'
+        catalog.rmdir('/photos/2024')
+        catalog.remove('1')
+        catalog.rmdir('/photos')
+        assert catalog.resolve('/photos') is None
+        assert saved_dirs(path) == {}
+
+
+def test_concurrent_add_and_rmdir():
+    """Threads adding files and making and removing directories on one catalog"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "config.discord")
+        catalog = Catalog(path)
+        errors = []
+
+        def adder(n):
+            try:
+                for i in range(100):
+                    catalog.add(f"{n}-{i}", record(f"files{n}/{i}.bin"), save=i % 10 == 0)
+            except Exception as e:
+                errors.append(e)
+
+        def mkdirs(n):
+            try:
+                for i in range(50):
+                    catalog.mkdir(f"/empty{n}-{i}")
+                    catalog.listdir()
+                    catalog.rmdir(f"/empty{n}-{i}")
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=adder, args=(n,)) for n in range(3)]
+        threads += [threading.Thread(target=mkdirs, args=(n,)) for n in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        catalog.save()
+        assert errors == []
+
+        reloaded = Catalog(path)
+        assert len(reloaded) == 300
+        subdirs, entries = reloaded.listdir()
+        assert sorted(subdirs) == ['files0', 'files1', 'files2']
+        for n in range(3):
+            assert len(reloaded.listdir(subdirs[f"files{n}"])[1]) == 100
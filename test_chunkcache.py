@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Discord Storage Chunk Cache Test
+Streams opened before the session has connected, and part files of fetches
+"""
+
+import sys
+import os
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+# Add the project directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from discordstorage.chunkcache import ChunkCache
+from discordstorage.metrics import Metrics
+
+DATA = b"chunk data " * 100
+
+
+class Session:
+    """No loop until connect() is called, like the Discord session before on_ready"""
+
+    def __init__(self):
+        self.loop = None
+
+    def getLoop(self):
+        return self.loop
+
+    def connect(self):
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        self.loop = loop
+
+
+def cache_with_chunk(tmp_path, connects):
+    session = Session()
+
+    def wait_ready(timeout=None):
+        if connects:
+            session.connect()
+        return session.loop is not None
+
+    core = SimpleNamespace(session=session, wait_ready=wait_ready, chunk_offsets=lambda record: [0])
+    core.metrics = Metrics(core)
+    cache = ChunkCache(core, str(tmp_path))
+    (tmp_path / "abc").write_bytes(DATA)
+    record = ["file.bin", len(DATA), [cdn("file.bin.0")], "", "", {'chunk_hashes': ["abc"]}]
+    return cache, record
+
+
+def cdn(name):
+    return f"https://cdn.example/{name}"
+
+
+def test_read_waits_for_the_session(tmp_path):
+    cache, record = cache_with_chunk(tmp_path, connects=True)
+    stream = cache.stream(record)
+    assert stream.read(0, 5) == DATA[:5]
+    cache.core.session.loop.call_soon_threadsafe(cache.core.session.loop.stop)
+
+
+def test_read_before_connecting_is_a_clear_error(tmp_path):
+    cache, record = cache_with_chunk(tmp_path, connects=False)
+    with pytest.raises(ConnectionError):
+        cache.stream(record).read(0, 5)
+
+
+def test_part_files_of_interrupted_fetches_are_removed(tmp_path):
+    cache, _ = cache_with_chunk(tmp_path, connects=False)
+    (tmp_path / "def.0a1b2c3d.part").write_bytes(b"half")
+    (tmp_path / "def.4e5f6a7b.part").write_bytes(b"ha")
+    cache._load()
+    assert sorted(os.listdir(tmp_path)) == ["abc"]
+    assert list(cache.entries) == ["abc"]
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Discord Storage Chunker Test
+Content-defined cut points within the size limits, and their stability under edits
+"""
+
+import sys
+import os
+import random
+
+# Add the project directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from discordstorage.chunker import (MAX_CHUNK_SIZE, MIN_CHUNK_SIZE, find_cut_point,
+                                    iter_chunks)
+
+# scaled-down limits so the per-byte hash loop stays quick
+MIN, AVG, MAX = 256, 1024, 4096
+
+
+def noise(size, seed=1):
+    return random.Random(seed).randbytes(size)
+
+
+def test_cut_points_respect_the_limits():
+    assert find_cut_point(b"x" * 100, MIN, AVG, MAX) == 100  # shorter than the minimum: one chunk
+    assert find_cut_point(b"x" * MIN, MIN, AVG, MAX) == MIN
+    assert find_cut_point(bytes(MAX * 3), MIN, AVG, MAX) == MAX  # no boundary in zeros: cut at the maximum
+    for seed in range(20):
+        cut = find_cut_point(noise(MAX * 2, seed), MIN, AVG, MAX)
+        assert MIN < cut <= MAX
+
+
+def test_default_limits_fit_discord_attachments():
+    assert find_cut_point(bytes(MIN_CHUNK_SIZE)) == MIN_CHUNK_SIZE
+    assert MIN_CHUNK_SIZE < find_cut_point(bytes(MAX_CHUNK_SIZE + 1)) <= MAX_CHUNK_SIZE
+
+
+def test_iter_chunks_covers_the_file(tmp_path):
+    data = noise(50000)
+    path = tmp_path / "file.bin"
+    path.write_bytes(data)
+    chunks = list(iter_chunks(str(path), MIN, AVG, MAX))
+    assert b"".join(chunks) == data
+    assert all(MIN < len(chunk) <= MAX for chunk in chunks[:-1])
+    assert 0 < len(chunks[-1]) <= MAX
+
+    path.write_bytes(b"")
+    assert list(iter_chunks(str(path), MIN, AVG, MAX)) == []
+
+
+def test_an_insertion_only_changes_nearby_chunks(tmp_path):
+    data = noise(50000)
+    edited = data[:20000] + b"inserted bytes" + data[20000:]
+    (tmp_path / "old.bin").write_bytes(data)
+    (tmp_path / "new.bin").write_bytes(edited)
+    old = list(iter_chunks(str(tmp_path / "old.bin"), MIN, AVG, MAX))
+    new = list(iter_chunks(str(tmp_path / "new.bin"), MIN, AVG, MAX))
+    assert len(set(old) - set(new)) <= 2
+    assert sum(len(chunk) for chunk in set(new) & set(old)) > len(data) * 0.8
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Discord Storage Daemon Test
+Round trips of control requests through a DaemonServer on a fake Core
+"""
+
+import sys
+import os
+import json
+import asyncio
+import tempfile
+import threading
+import contextlib
+from types import SimpleNamespace
+
+# Add the project directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from discordstorage.daemon import DaemonClient, DaemonServer
+
+
+class FakeCore:
+    """Just enough of a Core for the upload command"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.submitted = []
+        self.queue = SimpleNamespace(batch=contextlib.nullcontext)
+
+    def submit_upload(self, path, name=None, **kwargs):
+        self.submitted.append((path, name))
+        return SimpleNamespace(id=str(len(self.submitted)))
+
+
+def run_daemon(core):
+    """Start a DaemonServer on a loop in a background thread"""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    server = DaemonServer(core)
+    asyncio.run_coroutine_threadsafe(server.serve(), loop).result(10)
+    return server, loop
+
+
+def stop_daemon(server, loop):
+    """Let handlers see their clients go away, then stop the loop"""
+    asyncio.run_coroutine_threadsafe(asyncio.sleep(0.1), loop).result(10)
+    server.close()
+    loop.call_soon_threadsafe(loop.stop)
+
+
+def test_large_upload_request():
+    """A directory upload of thousands of files is far more than 64 KiB of JSON"""
+    with tempfile.TemporaryDirectory() as directory:
+        core = FakeCore(directory)
+        server, loop = run_daemon(core)
+        try:
+            client = DaemonClient.connect(directory)
+            targets = [[f"/data/photos/{n:05d}-some-long-file-name.jpg", f"photos/{n:05d}-some-long-file-name.jpg"]
+                       for n in range(3000)]
+            ids = client.request('upload', targets=targets)
+            assert len(ids) == 3000
+            assert len(core.submitted) == 3000
+            client.close()
+        finally:
+            stop_daemon(server, loop)
+
+
+class FakeWriter:
+    def __init__(self):
+        self.data = b""
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def test_oversized_request_gets_an_error_reply():
+    """A line over the reader's limit is answered with an error, not a dropped connection"""
+    async def exchange():
+        reader = asyncio.StreamReader(limit=64)
+        reader.feed_data(b'{"secret": "x", "cmd": "upload", "args": {"targets": "' + b"x" * 200 + b'"}}\n')
+        reader.feed_eof()
+        writer = FakeWriter()
+        with tempfile.TemporaryDirectory() as directory:
+            await DaemonServer(FakeCore(directory)).handle(reader, writer)
+        return writer
+
+    writer = asyncio.run(exchange())
+    reply = json.loads(writer.data.decode().splitlines()[0])
+    assert reply['ok'] is False and 'longer than' in reply['error']
+    assert writer.closed
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Discord Storage Resume State Test
+Chunk bitmap of a download and progress journal of an upload, kept across restarts
+"""
+
+import sys
+import os
+
+# Add the project directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from discordstorage.fileio import ChunkBitmap, ProgressJournal
+
+CHUNKS = 20
+SIZE = 20 * 9000000
+
+
+def test_bitmap_marks_and_unmarks_chunks(tmp_path):
+    bitmap = ChunkBitmap(str(tmp_path / "file.bitmap"), CHUNKS, SIZE)
+    for index in (0, 7, 8, 19):
+        bitmap.add(index)
+    assert list(bitmap) == [0, 7, 8, 19]
+    assert len(bitmap) == 4 and 8 in bitmap and 9 not in bitmap
+    bitmap.discard([7, 19])
+    assert list(bitmap) == [0, 8]
+    bitmap.close()
+
+
+def test_bitmap_resumes_what_was_synced(tmp_path):
+    path = str(tmp_path / "file.bitmap")
+    data = open(tmp_path / "file.bin", 'wb')
+    bitmap = ChunkBitmap(path, CHUNKS, SIZE, sync_every=2, sync_interval=3600)
+    bitmap.add(3, data)
+    bitmap.add(12, data)  # the second mark writes both out
+    bitmap.add(15, data)  # still pending when the process dies
+    data.close()
+    assert list(ChunkBitmap(path, CHUNKS, SIZE)) == [3, 12]
+
+    bitmap.close()  # a clean shutdown writes out the rest
+    assert list(ChunkBitmap(path, CHUNKS, SIZE)) == [3, 12, 15]
+
+
+def test_bitmap_of_a_different_file_starts_over(tmp_path):
+    path = str(tmp_path / "file.bitmap")
+    bitmap = ChunkBitmap(path, CHUNKS, SIZE)
+    bitmap.add(5)
+    bitmap.close()
+    assert list(ChunkBitmap(path, CHUNKS, SIZE + 1)) == []
+    assert list(ChunkBitmap(path, CHUNKS + 1, SIZE)) == []
+    with open(path, 'r+b') as f:
+        f.truncate(ChunkBitmap.HEADER.size + 1)  # bits of a damaged file
+    assert list(ChunkBitmap(path, CHUNKS, SIZE)) == []
+
+
+def journal_with_chunks(path, count):
+    journal = ProgressJournal(path)
+    journal.start({'code': "abc", 'chunks': CHUNKS})
+    for index in range(count):
+        journal.append({'i': index, 'url': f"https://cdn.example/abc.{index}"})
+    journal.close()
+
+
+def test_journal_drops_a_torn_tail(tmp_path):
+    path = str(tmp_path / "upload.journal")
+    journal_with_chunks(path, 3)
+    with open(path, 'ab') as f:
+        f.write(b'0badc0de {"i":3,"u')  # the append a crash interrupted
+    journal = ProgressJournal(path)
+    header, entries = journal.load()
+    assert header == {'code': "abc", 'chunks': CHUNKS}
+    assert [entry['i'] for entry in entries] == [0, 1, 2]
+
+    journal.append({'i': 3, 'url': "https://cdn.example/abc.3"})  # follows the last good line
+    journal.close()
+    _, entries = ProgressJournal(path).load()
+    assert [entry['i'] for entry in entries] == [0, 1, 2, 3]
+
+
+def test_journal_stops_at_a_damaged_line(tmp_path):
+    path = str(tmp_path / "upload.journal")
+    journal_with_chunks(path, 4)
+    with open(path, 'rb') as f:
+        lines = f.readlines()
+    lines[2] = lines[2].replace(b'"i":1', b'"i":7')  # CRC no longer matches
+    with open(path, 'wb') as f:
+        f.writelines(lines)
+    header, entries = ProgressJournal(path).load()
+    assert header['code'] == "abc"
+    assert [entry['i'] for entry in entries] == [0]
+
+
+def test_journal_without_a_usable_header(tmp_path):
+    path = str(tmp_path / "upload.journal")
+    assert ProgressJournal(path).load() == (None, [])
+    with open(path, 'wb') as f:
+        f.write(b'{"code":"abc"}\n')  # no CRC
+    assert ProgressJournal(path).load() == (None, [])
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Discord Storage File Type Detection Test
+Signatures, containers told apart by their contents, and text formats
+"""
+
+import sys
+import os
+import struct
+
+# Add the project directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from discordstorage.filetype import UNKNOWN, sniff, sniff_file
+
+
+def ext(head):
+    return sniff(head)[1]
+
+
+def zip_member(name, data=b""):
+    """A zip local file header followed by its (stored) data"""
+    return b'PK\x03\x04' + bytes(22) + len(name).to_bytes(2, 'little') + bytes(2) + name + data
+
+
+def test_magic_numbers():
+    assert ext(b'\x89PNG\r\n\x1a\n' + bytes(100)) == '.png'
+    assert ext(b'\xff\xd8\xff\xe0' + bytes(100)) == '.jpg'
+    assert ext(b'%PDF-1.7\n') == '.pdf'
+    assert ext(b'(\xb5/\xfd' + bytes(10)) == '.zst'
+    assert ext(b'\x7fELF\x02\x01\x01') == '.elf'
+    assert ext(bytes(257) + b'ustar\x0000') == '.tar'
+    assert ext(bytes(32769) + b'CD001\x01') == '.iso'
+
+
+def test_longest_magic_wins():
+    assert sniff(b'PK\x05\x06' + bytes(18)) == ('Zip archive data (empty)', '.zip')
+    assert ext(b'!<arch>\ndebian-binary') == '.deb'
+
+
+def test_containers():
+    assert ext(b'RIFF\x24\x00\x00\x00WAVEfmt ') == '.wav'
+    assert ext(b'RIFF\x24\x00\x00\x00WEBPVP8 ') == '.webp'
+    assert ext(b'RIFF\x24\x00\x00\x00ABCD') == '.riff'
+    assert ext(b'\x00\x00\x00\x18ftypqt  ') == '.mov'
+    assert ext(b'\x00\x00\x00\x18ftypisom') == '.mp4'
+    assert ext(zip_member(b'[Content_Types].xml') + zip_member(b'word/document.xml')) == '.docx'
+    assert ext(zip_member(b'mimetype', b'application/epub+zip')) == '.epub'
+    assert ext(zip_member(b'readme.txt', b'hello')) == '.zip'
+    assert ext(b'\x47' + bytes(187) + b'\x47' + bytes(187) + b'\x47' + bytes(187)) == '.ts'
+
+
+def bmp(file_size, pixels, dib_size):
+    return b'BM' + struct.pack('<IIII', file_size, 0, pixels, dib_size) + bytes(40)
+
+
+def dos_header(pe_offset, last_page=0x90, pages=3, header=4):
+    return b'MZ' + struct.pack('<HHHH', last_page, pages, 0, header) + bytes(50) + struct.pack('<I', pe_offset)
+
+
+def test_bitmaps_need_a_consistent_header():
+    assert sniff(bmp(70 + 16, 54, 40)) == ('PC bitmap', '.bmp')
+    assert ext(bmp(138 + 4, 138, 124)) == '.bmp'
+    assert ext(bmp(70, 54, 41)) != '.bmp'  # no such info header
+    assert ext(bmp(40, 54, 40)) != '.bmp'  # pixels past the end of the file
+    assert ext(b'BMW service history\n2019,oil change\n') == '.txt'
+
+
+def test_executables_need_a_pe_or_dos_header():
+    pe = dos_header(128) + bytes(64) + b'PE\x00\x00' + bytes(100)
+    assert sniff(pe) == ('PE32 executable (MS Windows)', '.exe')
+    assert sniff(dos_header(0) + bytes(100)) == ('MS-DOS executable', '.exe')
+    assert sniff(dos_header(128) + bytes(100)) == ('MS-DOS executable', '.exe')  # offset points elsewhere
+    assert ext(dos_header(10 ** 6, last_page=600)) != '.exe'
+    assert ext(b'MZ' + bytes(10)) != '.exe'
+    assert ext(b'MZ stands for Mark Zbikowski\n') == '.txt'
+
+
+def test_text_formats():
+    assert ext(b'#!/usr/bin/env python3\nprint(1)\n') == '.py'
+    assert ext(b'#!/bin/sh\necho hi\n') == '.sh'
+    assert ext(b'\xef\xbb\xbf  {"a": 1}') == '.json'
+    assert ext(b'<?xml version="1.0"?>\n<svg xmlns="http://www.w3.org/2000/svg"/>') == '.svg'
+    assert ext(b'<!DOCTYPE html>\n<html></html>') == '.html'
+    assert ext(b'name,size\na.bin,1\nb.bin,2\n') == '.csv'
+    assert ext(b'CREATE TABLE files (name TEXT);') == '.sql'
+    assert ext('just some notes, café'.encode()) == '.txt'
+    assert ext('café'.encode()[:-1]) == '.txt'  # cut in the middle of a character
+
+
+def test_unknown_data(tmp_path):
+    assert sniff(b'') == UNKNOWN
+    assert sniff(b'\x01\x02\x03\x00\x04') == UNKNOWN
+    assert sniff(b'\xfe\xfe\xfe\xfe' + b'text' * 20) == UNKNOWN
+    assert sniff_file(str(tmp_path / "missing")) == UNKNOWN
+    (tmp_path / "image").write_bytes(b'GIF89a' + bytes(20))
+    assert sniff_file(str(tmp_path / "image")) == ('GIF image data', '.gif')
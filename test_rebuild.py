@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Discord Storage Index Rebuild Test
+Records put back together from channel attachments and their manifests
+"""
+
+import sys
+import os
+import json
+
+# Add the project directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from discordstorage.rebuild import MANIFEST_LIMIT, RebuildState, manifest
+
+CHANNEL = 42
+SIZE = 9000000
+
+
+def cdn(name):
+    return f"https://cdn.example/{name}"
+
+
+def scan(state, messages):
+    """Feed (message id, filename, size, content) like the history walk does,
+    returns the finished records and sets aside the deferred ones"""
+    records = {}
+    for message_id, filename, size, content in messages:
+        code = state.add(filename, cdn(filename), size, [CHANNEL, message_id], content)
+        if code is not None and state.is_complete(code):
+            record = state.pop_record(code)
+            if state.needs_sources(record):
+                state.deferred[code] = record
+            else:
+                records[code] = record
+    return records
+
+
+def test_interleaved_uploads_are_grouped_by_code(tmp_path):
+    state = RebuildState(str(tmp_path / "rebuild.discord"))
+    records = scan(state, [
+        (1, "40.hash", 32, manifest("a.bin", SIZE + 10, None, SIZE + 10)),
+        (2, "41.1", 7, ''),  # chunks may arrive before their hash message
+        (3, "40.0", SIZE, ''),
+        (4, "41.0", 4000000, ''),
+        (5, "notes.txt", 3, ''),  # not an upload
+        (6, "41.hash", 32, manifest("b.bin", 100, 'zlib', 4000007)),
+        (7, "40.1", 10, ''),
+    ])
+    assert sorted(records) == ['40']
+    assert records['40'][:4] == ["a.bin", SIZE + 10, [cdn("40.0"), cdn("40.1")], cdn("40.hash")]
+    assert records['40'][5]['chunking'] == 'fixed'
+    assert records['40'][5]['messages'] == [[CHANNEL, 3], [CHANNEL, 7]]
+    assert records['40'][5]['hash_message'] == [CHANNEL, 1]
+
+    # the hash message replaced the group, so the chunks seen earlier must come again
+    assert not state.is_complete('41')
+    assert state.pending_codes() == ['41']
+
+
+def test_compressed_cdc_upload(tmp_path):
+    state = RebuildState(str(tmp_path / "rebuild.discord"))
+    records = scan(state, [
+        (1, "50.hash", 32, manifest("c.log", 50000000, 'zlib', 4000007)),
+        (2, "50.0", 4000000, ''),
+        (3, "50.1", 7, ''),
+    ])
+    meta = records['50'][5]
+    assert records['50'][1] == 50000000
+    assert meta['chunking'] == 'cdc' and meta['chunk_sizes'] == [4000000, 7]
+    assert meta['codec'] == 'zlib' and meta['stored_size'] == 4000007
+
+
+def test_hash_without_a_usable_manifest_never_completes(tmp_path):
+    state = RebuildState(str(tmp_path / "rebuild.discord"))
+    records = scan(state, [(1, "60.hash", 32, "not json"), (2, "60.0", 5, ''),
+                           (3, "61.hash", 32, '["a list"]'), (4, "61.0", 5, '')])
+    assert records == {}
+    assert sorted(state.pending_codes()) == ['60', '61']
+
+
+def test_a_failed_upload_whose_code_was_reused(tmp_path):
+    state = RebuildState(str(tmp_path / "rebuild.discord"))
+    records = scan(state, [
+        (1, "70.hash", 32, manifest("old.bin", 2 * SIZE, None, 2 * SIZE)),
+        (2, "70.0", SIZE, ''),  # the upload failed here
+        (3, "70.hash", 32, manifest("new.bin", 5, None, 5)),
+        (4, "70.0", 5, ''),
+    ])
+    assert records['70'][:3] == ["new.bin", 5, [cdn("70.0")]]
+    assert records['70'][5]['messages'] == [[CHANNEL, 4]]
+
+
+def test_scan_resumes_from_a_checkpoint(tmp_path):
+    path = str(tmp_path / "rebuild.discord")
+    state = RebuildState(path)
+    scan(state, [(1, "80.hash", 32, manifest("a.bin", SIZE + 1, None, SIZE + 1)), (2, "80.0", SIZE, '')])
+    state.last_message_id = 2
+    state.save()
+
+    state = RebuildState(path)
+    assert state.last_message_id == 2
+    records = scan(state, [(3, "80.1", 1, '')])
+    assert records['80'][2] == [cdn("80.0"), cdn("80.1")]
+    state.clear()
+    assert not os.path.exists(path)
+
+
+def test_reused_chunks_and_copies_are_resolved_after_the_scan(tmp_path):
+    state = RebuildState(str(tmp_path / "rebuild.discord"))
+    records = scan(state, [
+        (1, "10.hash", 32, manifest("a.bin", 2 * SIZE, None, 2 * SIZE)),
+        (2, "10.0", SIZE, ''),
+        (3, "10.1", SIZE, ''),
+        # chunk 0 is chunk 1 of code 10, chunk 2 repeats chunk 1 of this upload
+        (4, "11.hash", 32, manifest("b.bin", 3 * SIZE + 5, None, 3 * SIZE + 5,
+                                    reused={'0': [3, SIZE]}, same={'2': 1})),
+        (5, "11.1", SIZE, ''),
+        (6, "11.3", 5, ''),
+        (7, "12.hash", 32, manifest("c.bin", 3 * SIZE + 5, None, 3 * SIZE + 5, copy_of=[CHANNEL, 4])),
+    ])
+    assert list(records) == ['10']
+    assert sorted(state.deferred) == ['11', '12']
+
+    resolved, missing = state.resolve(records.values())
+    resolved = dict(resolved)
+    assert missing == [] and state.deferred == {}
+    assert resolved['11'][2] == [cdn("10.1"), cdn("11.1"), cdn("11.1"), cdn("11.3")]
+    assert resolved['11'][5]['messages'] == [[CHANNEL, 3], [CHANNEL, 5], [CHANNEL, 5], [CHANNEL, 6]]
+    assert resolved['12'][0] == "c.bin"
+    assert resolved['12'][2] == resolved['11'][2]
+    assert resolved['12'][3] == cdn("12.hash")
+    assert resolved['12'][5]['hash_message'] == [CHANNEL, 7]
+
+
+def test_sources_that_were_never_seen_are_reported(tmp_path):
+    state = RebuildState(str(tmp_path / "rebuild.discord"))
+    scan(state, [(1, "20.hash", 32, manifest("x.bin", SIZE, None, SIZE, reused={'0': [999, SIZE]})),
+                 (2, "21.hash", 32, manifest("y.bin", SIZE, None, SIZE, copy_of=[CHANNEL, 998]))])
+    resolved, missing = state.resolve([])
+    assert resolved == [] and sorted(missing) == ['20', '21']
+
+
+def test_deferred_records_survive_a_checkpoint(tmp_path):
+    path = str(tmp_path / "rebuild.discord")
+    state = RebuildState(path)
+    scan(state, [(1, "30.hash", 32, manifest("x.bin", SIZE, None, SIZE, copy_of=[CHANNEL, 5]))])
+    state.save()
+    assert list(RebuildState(path).deferred) == ['30']
+
+
+def test_manifest_stays_compact():
+    reused = {str(i): [1234567890123456789, SIZE] for i in range(40)}
+    content = manifest("some file name.bin", 40 * SIZE, 'zstd', 40 * SIZE, reused=reused)
+    assert len(content) <= MANIFEST_LIMIT
+    assert json.loads(content)['reused']['39'] == [1234567890123456789, SIZE]
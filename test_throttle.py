@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Discord Storage Throttle Test
+Rates accepted by --limit-rate
+"""
+
+import sys
+import os
+
+# Add the project directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from discordstorage.throttle import parse_rate
+
+
+def test_parse_rate_formats():
+    assert parse_rate("20M") == 20 * 1024 ** 2
+    assert parse_rate("500K") == 500 * 1024
+    assert parse_rate("1.5G") == int(1.5 * 1024 ** 3)
+    assert parse_rate("10MB/s") == 10 * 1024 ** 2
+    assert parse_rate("512KB/s") == 512 * 1024
+    assert parse_rate("512kb/s") == 512 * 1024
+    assert parse_rate("2mb") == 2 * 1024 ** 2
+    assert parse_rate("1000B/s") == 1000
+    assert parse_rate(" 4096 ") == 4096
+    assert parse_rate("0") == 0
+
+
+def test_parse_rate_rejects_garbage():
+    for text in ("fast", "10X", ""):
+        try:
+            parse_rate(text)
+        except ValueError:
+            continue
+        raise AssertionError(f"{text!r} was accepted")
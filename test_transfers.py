@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Discord Storage Transfer Queue Test
+Ownership of queue.discord between processes sharing a directory
+"""
+
+import sys
+import os
+import json
+import tempfile
+from types import SimpleNamespace
+
+# Add the project directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from discordstorage.jobs import JobRegistry
+from discordstorage.transfers import TransferQueue
+
+
+class FakeCore:
+    """Just enough of a Core for a queue that never starts its transfers"""
+
+    def __init__(self):
+        self.jobs = JobRegistry()
+        self.catalog = SimpleNamespace(reserve_code=lambda code: None)
+        self.session = SimpleNamespace(getLoop=lambda: None)
+
+
+def queued_download(name, seq):
+    return {'id': f"job{seq}", 'kind': 'download', 'name': name, 'total': 10, 'owner': 'cli',
+            'priority': 1, 'seq': seq, 'created': 0, 'args': {'record': [name, 10, [], None, None]}}
+
+
+def test_only_the_owner_resumes_and_persists():
+    """A second queue on the same directory neither replays nor rewrites queue.discord"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "queue.discord")
+        with open(path, 'w') as f:
+            json.dump({'jobs': [queued_download("left-over.bin", 1)]}, f)
+
+        owner = TransferQueue(FakeCore(), path)
+        assert owner.persistent
+        assert len(owner.entries) == 1
+
+        other = TransferQueue(FakeCore(), path)
+        assert not other.persistent
+        assert other.entries == {}
+        other.submit_download(["mine.bin", 10, [], None, None])
+        assert len(other.entries) == 1
+        with open(path) as f:
+            assert [entry['name'] for entry in json.load(f)['jobs']] == ["left-over.bin"]
+
+        owner.submit_download(["theirs.bin", 10, [], None, None])
+        with open(path) as f:
+            assert [entry['name'] for entry in json.load(f)['jobs']] == ["left-over.bin", "theirs.bin"]
+
+
+def test_lock_is_released_with_its_owner():
+    """Once the owning queue is gone the next one takes over the file"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "queue.discord")
+        owner = TransferQueue(FakeCore(), path)
+        owner._lock_file.close()
+        assert TransferQueue(FakeCore(), path).persistent
@@ -48,6 +48,24 @@ def mock_core_test():
         print(f"❌ Failed to create Core instance: {e}")
         return False
 
+def test_job_pages_escape_file_names(tmp_path, monkeypatch):
+    """Uploaded file names are shown on the index and /jobs as text, not markup"""
+    from types import SimpleNamespace
+    from discordstorage.catalog import Catalog
+    from discordstorage.jobs import JobRegistry, TransferJob
+    from discordstorage.smbserver import DiscordWebFileServer
+
+    monkeypatch.chdir(tmp_path)
+    core = SimpleNamespace(catalog=Catalog(str(tmp_path / "config.discord")), jobs=JobRegistry())
+    server = DiscordWebFileServer(core, str(tmp_path / "config.discord"))
+    job = TransferJob('upload', '<script>alert(1)</script>.txt', 10)
+    job.error = "could not read <img src=x onerror=alert(1)>"
+    core.jobs.add(job)
+
+    for page in (server.jobs(), server.jobs(job.id), server.index(uploaded='<b>x</b>')):
+        assert '<script>' not in page and '<img' not in page and '<b>x' not in page
+        assert '&lt;script&gt;' in page or '&lt;b&gt;' in page
+
 def main():
     print("🧪 Discord Storage Web Server Test")
     print("=" * 50)